@@ -0,0 +1,54 @@
+"""
+	Best-matching-unit search benchmark:
+	row-wise BMU engine ('_Template_SOM._calc_sq_dists') against
+	former diagonal of full N x N dot product
+	
+	Usage: python bmu_search.py [input_dim]
+"""
+
+import sys
+import timeit
+
+sys.path.append("../../")
+
+from numpy import *
+
+from mpfrl.SOM import Miller_SOM
+
+LATTICE_SIDES = [5, 10, 20, 50, 100]
+
+def _diag_dot_sq_dists(diff_m):
+	return diag(dot(diff_m, diff_m.T))
+
+def bench(input_dim = 16):
+	print "%10s %8s %14s %14s %10s" % (
+				"lattice", "N", "diag(dot), us", "engine, us", "speedup")
+	
+	for side in LATTICE_SIDES:
+		som = Miller_SOM((side, side), input_dim)
+		diff_m = random.uniform(-1.0, 1.0, som.neurons.shape)
+		
+		# sanity check: both paths must agree
+		assert(allclose(_diag_dot_sq_dists(diff_m), som._calc_sq_dists(diff_m)))
+		
+		# N x N temporary becomes really heavy for large lattices
+		repeats = max(1, 2000 / (side * side))
+		
+		t_old = min(timeit.repeat(
+						lambda: _diag_dot_sq_dists(diff_m), 
+						repeat = 3, number = repeats
+		)) / repeats
+		t_new = min(timeit.repeat(
+						lambda: som._calc_sq_dists(diff_m), 
+						repeat = 3, number = repeats * 10
+		)) / (repeats * 10)
+		
+		print "%10s %8d %14.1f %14.1f %9.1fx" % (
+					"%dx%d" % (side, side), side * side,
+					t_old * 1e6, t_new * 1e6, t_old / t_new)
+
+if (__name__ == "__main__"):
+	if (len(sys.argv) > 1):
+		bench(int(sys.argv[1]))
+	else:
+		bench()
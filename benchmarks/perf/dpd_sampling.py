@@ -0,0 +1,75 @@
+"""
+	Neurons' sampling benchmark ('generate' of SOM without generative
+	model): previous procedure (CDF by 'cumsum' into temporary, then 
+	'digitize') against inverse CDF sampler and alias table sampler 
+	(PMF is set before every draw, table is built once as long as PMF 
+	is the same) for several lattices and numbers of samples per draw
+	
+	Usage: python dpd_sampling.py [input_dim]
+"""
+
+import sys
+import timeit
+
+sys.path.append("../../")
+
+from numpy import *
+
+from mpfrl.samplers import CDF_Sampler, Alias_Sampler
+
+LATTICE_SIDES = [8, 20, 50]
+SAMPLES_NUMS = [1, 100, 10000]
+
+def _prev_sample(neurons, act_vec, samples_num):
+	absolute(act_vec, out = act_vec)
+	
+	bins = cumsum(act_vec)
+	bins /= bins[-1]
+	
+	return neurons[digitize(random.random_sample(samples_num), bins)]
+
+def _sample(neurons, sampler, act_vec, samples_num):
+	absolute(act_vec, out = act_vec)
+	sampler.set_pmf(act_vec)
+	
+	# (the same as in '_Template_SOM')
+	if (samples_num == 1):
+		ind = sampler.sample_one(random)
+		return neurons[ind:ind + 1].copy()
+	
+	return neurons.take(sampler.sample(random, samples_num), axis = 0)
+
+def bench(input_dim = 16):
+	print "%10s %8s %14s %14s %14s" % (
+				"lattice", "samples", "previous, us", "CDF, us", "alias, us")
+	
+	for side in LATTICE_SIDES:
+		states_num = side * side
+		
+		neurons = random.uniform(0.0, 1.0, (states_num, input_dim)).astype(float32)
+		act_vec = random.uniform(0.0, 1.0, states_num).astype(float32)
+		
+		cdf_sampler = CDF_Sampler(states_num)
+		alias_sampler = Alias_Sampler(states_num)
+		
+		for samples_num in SAMPLES_NUMS:
+			number = max(10, 100000 / samples_num / side)
+			
+			t = [
+				min(timeit.repeat(f, repeat = 3, number = number)) / number
+				for f in [
+					lambda: _prev_sample(neurons, act_vec, samples_num),
+					lambda: _sample(neurons, cdf_sampler, act_vec, samples_num),
+					lambda: _sample(neurons, alias_sampler, act_vec, samples_num)
+				]
+			]
+			
+			print "%10s %8d %14.1f %14.1f %14.1f" % (
+						"%dx%d" % (side, side), samples_num, 
+						t[0] * 1e6, t[1] * 1e6, t[2] * 1e6)
+
+if (__name__ == "__main__"):
+	if (len(sys.argv) > 1):
+		bench(int(sys.argv[1]))
+	else:
+		bench()
@@ -0,0 +1,115 @@
+"""
+	Dtype policy check: no floating-point array of SOMs, their predictors, 
+	units and hierarchy is promoted to another dtype by 'feed', forward 
+	and backward passes or 'MPF_Hierarchy.evaluate' (which is timed for 
+	float32 and float64 hierarchies)
+	
+	Snake-like hierarchy is used: 16 L0 sensor units, three levels in total
+	
+	Usage: python dtype_check.py [steps_num]
+"""
+
+import sys
+import time
+
+sys.path.append("../../")
+
+from numpy import *
+
+from hierarchies import build_hierarchy
+
+SENSORS_NUM = 16
+PATCH_DIM = 16
+
+def _attributes(obj):
+	"""
+	returns (name, value) pairs of attributes of 'obj' (with or without 
+	'__slots__', see '_Base_MPF_Unit')
+	"""
+	
+	if (hasattr(obj, "__dict__")):
+		return vars(obj).items()
+	
+	# (private names are stored mangled)
+	names = [
+		"_%s%s" % (cls.__name__, name) if name.startswith("__") else name
+		for cls in obj.__class__.__mro__
+			for name in getattr(cls, "__slots__", ())
+	]
+	
+	return [(name, getattr(obj, name)) for name in names if hasattr(obj, name)]
+
+def _promoted(obj, dtype, path):
+	"""
+	returns paths of floating-point arrays of 'obj' (and of its SOMs, their
+	predictors and noises) which are not of 'dtype'
+	"""
+	
+	res = []
+	
+	for (name, value) in _attributes(obj):
+		if (isinstance(value, ndarray) and (value.dtype.kind == "f") and 
+			(value.dtype != dtype)):
+			res.append("%s.%s: %s" % (path, name, value.dtype))
+		elif (name in ["ss", "ts", "_predictor", "_noise_func"]):
+			res.extend(_promoted(value, dtype, path + "." + name))
+	
+	return res
+
+def _check(h, dtype):
+	res = _promoted(h, dtype, "h")
+	
+	for level in h._levels:
+		for (unit, children) in level:
+			res.extend(_promoted(unit, dtype, "unit_L%d" % unit.unit_level))
+	
+	return res
+
+def check(steps_num = 20):
+	X = random.uniform(0.0, 1.0, (steps_num, SENSORS_NUM * PATCH_DIM))
+	
+	ok = True
+	t_evaluate = dict()
+	
+	for dtype in [float32, float64]:
+		h = build_hierarchy(SENSORS_NUM, PATCH_DIM, dtype = dtype)
+		unit = h.l0_units[0]
+		
+		# -- SOM alone
+		unit.ss.feed(X[0, :PATCH_DIM].astype(dtype))
+		
+		# -- unit's passes
+		unit.forward_pass(X[1, :PATCH_DIM].astype(dtype))
+		unit.backward_pass(random.uniform(0.0, 1.0, unit.ts.act_vec.shape).astype(dtype))
+		
+		# -- whole hierarchy (input of another dtype is converted)
+		t_start = time.time()
+		for t in xrange(steps_num):
+			h.evaluate(X[t], 0.0)
+		t_evaluate[dtype] = (time.time() - t_start) / steps_num
+		
+		promoted = _check(h, dtype)
+		
+		for (name, vec) in [
+						("output_vec", h.output_vec), 
+						("generate", unit.ss.generate(unit.ss.act_vec, 4))]:
+			if (vec.dtype != dtype):
+				promoted.append("%s: %s" % (name, vec.dtype))
+		
+		print "%s: %s" % (dtype.__name__, "ok" if (len(promoted) == 0) else "promoted")
+		for path in sorted(set(promoted)): print "  " + path
+		
+		ok = ok and (len(promoted) == 0)
+	
+	print "evaluate, ms: float32 %.2f, float64 %.2f" % (
+				t_evaluate[float32] * 1e3, t_evaluate[float64] * 1e3)
+	
+	return ok
+
+if (__name__ == "__main__"):
+	if (len(sys.argv) > 1):
+		ok = check(int(sys.argv[1]))
+	else:
+		ok = check()
+	
+	sys.exit(0 if ok else 1)
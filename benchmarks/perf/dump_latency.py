@@ -0,0 +1,81 @@
+"""
+	Dump latency benchmark: per-step 'MPF_Hierarchy.evaluate' latency
+	(median and at dump boundaries) without dumps, with synchronous
+	dumps ("mat" and "checkpoint" formats) and with asynchronous
+	checkpoint writer
+	
+	Snake-like hierarchy is used: 16 L0 sensor units, three levels in total,
+	dump is performed every 20 steps (like in snake benchmark)
+	
+	Usage: python dump_latency.py [steps_num]
+"""
+
+import sys
+import shutil
+import tempfile
+import time
+
+sys.path.append("../../")
+
+from numpy import *
+
+from hierarchies import build_hierarchy
+
+SENSORS_NUM = 16
+PATCH_DIM = 16
+DUMP_PERIOD = 20
+
+MODES = [
+	# (name, dump period, dump format, async slots)
+	("no dumps", 0, "checkpoint", 0),
+	("mat", DUMP_PERIOD, "mat", 0),
+	("checkpoint", DUMP_PERIOD, "checkpoint", 0),
+	("async", DUMP_PERIOD, "checkpoint", 4)
+]
+
+def bench(steps_num = 200):
+	X = random.uniform(0.0, 1.0, (steps_num, SENSORS_NUM * PATCH_DIM))
+	
+	print "%12s %14s %18s %18s %12s" % (
+				"mode", "median, ms", "dump steps, ms", "max step, ms", "total, s")
+	
+	for (mode_name, dump_period, dump_format, dump_async_slots) in MODES:
+		dump_path = tempfile.mkdtemp()
+		
+		try:
+			h = build_hierarchy(SENSORS_NUM, PATCH_DIM, 
+								dump_period = dump_period, 
+								dump_path = dump_path, 
+								dump_format = dump_format, 
+								dump_async_slots = dump_async_slots)
+			
+			steps_times = zeros(steps_num)
+			
+			t_total = time.time()
+			
+			for t in xrange(steps_num):
+				t_start = time.time()
+				h.evaluate(X[t], 0.0)
+				steps_times[t] = time.time() - t_start
+			
+			h.close_dumps()
+			
+			t_total = time.time() - t_total
+		finally:
+			shutil.rmtree(dump_path)
+		
+		# (the first step is skipped as warm-up one)
+		dump_steps = arange(DUMP_PERIOD, steps_num, DUMP_PERIOD)
+		
+		print "%12s %14.2f %18.2f %18.2f %12.2f" % (
+					mode_name, 
+					median(steps_times[1:]) * 1e3,
+					mean(steps_times[dump_steps]) * 1e3,
+					steps_times[1:].max() * 1e3,
+					t_total)
+
+if (__name__ == "__main__"):
+	if (len(sys.argv) > 1):
+		bench(int(sys.argv[1]))
+	else:
+		bench()
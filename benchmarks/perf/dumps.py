@@ -0,0 +1,107 @@
+"""
+	Dumping benchmark: cost of one dump (snapshots after forward and backward
+	passes plus storing) of "mat" and "checkpoint" dump formats compared
+	to 'MPF_Hierarchy.evaluate' without dumping, checkpoint is also dumped
+	with snapshot after forward pass only (see 'dump_snapshots')
+	
+	Snake-like hierarchy is used: 16 L0 sensor units, three levels in total,
+	dump is performed every step
+	
+	Modes are run one after another several times, per dump cost is the
+	median of differences with evaluation without dumps of the same round
+	(timings drift between rounds)
+	
+	Usage: python dumps.py [steps_num]
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+import time
+
+sys.path.append("../../")
+
+from numpy import *
+
+from hierarchies import build_hierarchy
+
+SENSORS_NUM = 16
+PATCH_DIM = 16
+
+REPEATS_NUM = 5
+
+MODES = [
+	# (name, dump format, snapshots)
+	("mat", "mat", ("after_forward", "after_backward")),
+	("checkpoint", "checkpoint", ("after_forward", "after_backward")),
+	("forward only", "checkpoint", ("after_forward",))
+]
+
+def _run(h, X):
+	t_start = time.time()
+	for t in xrange(X.shape[0]):
+		h.evaluate(X[t], 0.0)
+	
+	return (time.time() - t_start) / X.shape[0]
+
+def _measure(X, dump_period, dump_format, 
+				dump_snapshots = ("after_forward", "after_backward")):
+	"""
+	returns time per step and size of dumps
+	"""
+	
+	dump_path = tempfile.mkdtemp()
+	
+	try:
+		h = build_hierarchy(SENSORS_NUM, PATCH_DIM, 
+							dump_period = dump_period, 
+							dump_path = dump_path, 
+							dump_format = dump_format, 
+							dump_snapshots = dump_snapshots)
+		t_step = _run(h, X)
+		
+		dump_size = sum([
+					os.path.getsize(os.path.join(dump_path, filename))
+					for filename in os.listdir(dump_path)
+		])
+	finally:
+		shutil.rmtree(dump_path)
+	
+	return (t_step, dump_size)
+
+def bench(steps_num = 20):
+	X = random.uniform(0.0, 1.0, (steps_num, SENSORS_NUM * PATCH_DIM))
+	
+	t_evaluate = []
+	t_dumps = [[] for mode in MODES]
+	dumps_sizes = [0 for mode in MODES]
+	
+	for i in xrange(REPEATS_NUM):
+		(t_round, dump_size) = _measure(X, 0, "checkpoint")
+		t_evaluate.append(t_round)
+		
+		for (mode_ind, (mode_name, dump_format, dump_snapshots)) in enumerate(MODES):
+			(t_step, dumps_sizes[mode_ind]) = _measure(
+						X, 1, dump_format, dump_snapshots)
+			
+			t_dumps[mode_ind].append(t_step - t_round)
+	
+	t_evaluate = median(t_evaluate)
+	
+	print "evaluate without dumps, ms: %.2f" % (t_evaluate * 1e3)
+	print "%12s %16s %18s %16s" % (
+				"mode", "per dump, ms", "of evaluate, %", "per dump, KiB")
+	
+	for (mode_ind, (mode_name, dump_format, dump_snapshots)) in enumerate(MODES):
+		t_dump = median(t_dumps[mode_ind])
+		
+		print "%12s %16.2f %18.1f %16.1f" % (
+					mode_name, t_dump * 1e3, 100.0 * t_dump / t_evaluate,
+					dumps_sizes[mode_ind] / 1024.0 / steps_num)
+
+if (__name__ == "__main__"):
+	if (len(sys.argv) > 1):
+		bench(int(sys.argv[1]))
+	else:
+		bench()
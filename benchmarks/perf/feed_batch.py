@@ -0,0 +1,54 @@
+"""
+	SOM training throughput (samples/s): loop over 'feed' against
+	'feed_batch' in online and batch modes
+	
+	Usage: python feed_batch.py [samples_num]
+"""
+
+import sys
+import time
+
+sys.path.append("../../")
+
+from numpy import *
+
+from mpfrl.SOM import Miller_SOM
+
+LATTICE_SIDES = [5, 10, 20, 50]
+INPUT_DIM = 16
+BATCH_EPOCHS = 5
+
+def _throughput(func, samples_num):
+	t_start = time.time()
+	func()
+	
+	return samples_num / (time.time() - t_start)
+
+def bench(samples_num = 2000):
+	X = random.uniform(0.0, 1.0, (samples_num, INPUT_DIM))
+	
+	print "%10s %14s %14s %14s" % (
+				"lattice", "feed loop", "online batch", "batch SOM")
+	
+	for side in LATTICE_SIDES:
+		som = Miller_SOM((side, side), INPUT_DIM)
+		som.init_predictor()
+		
+		def _feed_loop():
+			for x in X: som.feed(x)
+		
+		print "%10s %14.0f %14.0f %14.0f" % (
+					"%dx%d" % (side, side),
+					_throughput(_feed_loop, samples_num),
+					_throughput(lambda: som.feed_batch(X), samples_num),
+					_throughput(
+						lambda: som.feed_batch(X, True, BATCH_EPOCHS), 
+						samples_num * BATCH_EPOCHS
+					)
+		)
+
+if (__name__ == "__main__"):
+	if (len(sys.argv) > 1):
+		bench(int(sys.argv[1]))
+	else:
+		bench()
@@ -0,0 +1,213 @@
+"""
+	Allocation check of 'MPF_Unit_RL._forward_pass_kernel' after warm-up:
+	
+	1. arrays owning data buffers constructed per step (i.e. allocations
+		of array data, neither views nor 0-d arrays which numpy wraps
+		scalar operands into), counted by sites (file, function) which
+		constructed them: ndarray's allocation and deallocation slots are
+		hooked by ctypes (CPython 2 on 64-bit platform, layout is checked)
+	2. growth of number of Python objects tracked by garbage collector
+		and of resident memory of the process
+	
+	Only sites in 'ALLOWED_SITES' may allocate buffers on every step
+	
+	Unit is fed by cyclic sequence of input vectors, so its markov predictor
+	(the only structure allowed to grow) saturates during warm-up
+	
+	Usage: python forward_kernel_allocs.py [steps_num]
+"""
+
+import sys
+import ctypes
+import gc
+import os
+import time
+
+sys.path.append("../../")
+
+from numpy import *
+
+from mpfrl.units import *
+from mpfrl.SOM import Miller_SOM
+
+WARMUP_STEPS_NUM = 3000
+PATTERNS_NUM = 8
+
+# 'bincount' of markov predictor has no 'out' (its result and cast of
+# int64 transition counts to float64 weights are allocated every step)
+ALLOWED_SITES = [("predictors.py", "predict")]
+
+class _Hierarchy_Stub:
+	reinforcement_prime = 0.0
+
+class _Array_Allocations:
+	"""
+	
+	Counter of arrays (ndim > 0) owning their data constructed between
+	'start' and 'stop', by sites (file name, function name)
+	
+	Allocation slot records site of every constructed array, deallocation
+	slot counts those which own data (every temporary of a step is
+	deallocated within the step)
+	
+	"""
+	
+	# -- PyTypeObject's slots (in words)
+	_TP_BASICSIZE = 4
+	_TP_DEALLOC = 6
+	_TP_WEAKLISTOFFSET = 26
+	_TP_ALLOC = 38
+	
+	# -- PyArrayObject's fields (offsets in bytes) and NPY_ARRAY_OWNDATA flag
+	_DATA_OFFSET = 16
+	_ND_OFFSET = 24
+	_FLAGS_OFFSET = 64
+	_OWNDATA = 0x0004
+	
+	def __init__(self):
+		self._slots = ctypes.cast(id(ndarray), ctypes.POINTER(ctypes.c_ssize_t))
+		
+		self.__check_layout()
+		
+		# (original slots are called by PYFUNCTYPE, which keeps GIL held)
+		alloc_type = (ctypes.c_void_p, ctypes.c_void_p, ctypes.c_ssize_t)
+		dealloc_type = (None, ctypes.c_void_p)
+		
+		self._orig_alloc_ptr = self._slots[self._TP_ALLOC]
+		self._orig_dealloc_ptr = self._slots[self._TP_DEALLOC]
+		
+		self._orig_alloc = ctypes.PYFUNCTYPE(*alloc_type)(self._orig_alloc_ptr)
+		self._orig_dealloc = ctypes.PYFUNCTYPE(*dealloc_type)(self._orig_dealloc_ptr)
+		
+		self._alloc_hook = ctypes.CFUNCTYPE(*alloc_type)(self.__alloc)
+		self._dealloc_hook = ctypes.CFUNCTYPE(*dealloc_type)(self.__dealloc)
+		
+		# -- site -> number of arrays, sites of arrays alive (by address)
+		self.sites = dict()
+		self._born = dict()
+	
+	def __check_layout(self):
+		assert(self._slots[self._TP_BASICSIZE] == ndarray.__basicsize__)
+		assert(self._slots[self._TP_WEAKLISTOFFSET] == ndarray.__weakrefoffset__)
+		
+		arr = zeros((2, 3))
+		
+		assert(ctypes.c_void_p.from_address(id(arr) + self._DATA_OFFSET).value ==
+				arr.ctypes.data)
+		assert(ctypes.c_int.from_address(id(arr) + self._ND_OFFSET).value == 2)
+		assert(self.__owns_data(id(arr)) and not self.__owns_data(id(arr[1:])))
+	
+	def __owns_data(self, addr):
+		return bool(ctypes.c_int.from_address(addr + self._FLAGS_OFFSET).value &
+					self._OWNDATA)
+	
+	def __alloc(self, arr_type, items_num):
+		addr = self._orig_alloc(arr_type, items_num)
+		
+		code = sys._getframe(1).f_code
+		self._born[addr] = (os.path.basename(code.co_filename), code.co_name)
+		
+		return addr
+	
+	def __dealloc(self, addr):
+		site = self._born.pop(addr, None)
+		
+		if ((site is not None) and self.__owns_data(addr) and
+			(ctypes.c_int.from_address(addr + self._ND_OFFSET).value > 0)):
+			self.sites[site] = self.sites.get(site, 0) + 1
+		
+		self._orig_dealloc(addr)
+	
+	def start(self):
+		self.sites.clear()
+		self._born.clear()
+		
+		self._slots[self._TP_ALLOC] = ctypes.cast(self._alloc_hook, ctypes.c_void_p).value
+		self._slots[self._TP_DEALLOC] = ctypes.cast(self._dealloc_hook, ctypes.c_void_p).value
+	
+	def stop(self):
+		self._slots[self._TP_ALLOC] = self._orig_alloc_ptr
+		self._slots[self._TP_DEALLOC] = self._orig_dealloc_ptr
+
+def _rss_pages():
+	with open("/proc/%d/statm" % os.getpid()) as statm_f:
+		return int(statm_f.read().split()[1])
+
+def _build_unit():
+	random.seed(0)
+	
+	unit = MPF_Unit_RL(
+				ss_class = Miller_SOM,
+				ts_class = Miller_SOM,
+				input_dim = 16,
+				ss_shape = (10, 10),
+				ts_shape = (8, 8),
+				parent_unit = None,
+				unit_type = MPF_UT_SENSOR
+	)
+	
+	unit._hierarchy = _Hierarchy_Stub()
+	
+	return unit
+
+def _run(unit, X, R, first_step, steps_num):
+	for t in xrange(first_step, first_step + steps_num):
+		unit._hierarchy.reinforcement_prime = R[t % R.shape[0]]
+		unit._forward_pass_kernel(X[t % X.shape[0]])
+
+def check(steps_num = 10000):
+	X = random.uniform(0.0, 1.0, (PATTERNS_NUM, 16))
+	R = random.uniform(-1.0, 1.0, PATTERNS_NUM)
+	
+	unit = _build_unit()
+	
+	_run(unit, X, R, 0, WARMUP_STEPS_NUM)
+	
+	# -- buffers allocated per step
+	allocations = _Array_Allocations()
+	
+	allocations.start()
+	_run(unit, X, R, WARMUP_STEPS_NUM, PATTERNS_NUM)
+	allocations.stop()
+	
+	# -- heap growth
+	gc.collect()
+	objects_num = len(gc.get_objects())
+	rss_pages = _rss_pages()
+	trans_num = unit.ss._predictor.trans_num
+	
+	t_start = time.time()
+	_run(unit, X, R, WARMUP_STEPS_NUM + PATTERNS_NUM, steps_num)
+	t_step = (time.time() - t_start) / steps_num
+	
+	gc.collect()
+	objects_growth = len(gc.get_objects()) - objects_num
+	rss_growth = _rss_pages() - rss_pages
+	
+	print "buffers allocated per step:"
+	for (site, arrays_num) in sorted(allocations.sites.items()):
+		print "  %-36s %5.1f%s" % (
+					"%s:%s" % site, float(arrays_num) / PATTERNS_NUM,
+					"" if (site in ALLOWED_SITES) else "  (NOT ALLOWED)")
+	
+	print "steps after warm-up:       %d" % steps_num
+	print "forward kernel, us:        %.1f" % (t_step * 1e6)
+	print "gc objects growth:         %d" % objects_growth
+	print "resident pages growth:     %d" % rss_growth
+	print "predictor transitions:     %d -> %d" % (
+				trans_num, unit.ss._predictor.trans_num)
+	
+	not_allowed = [site for site in allocations.sites if (site not in ALLOWED_SITES)]
+	
+	ok = (objects_growth <= 0) and (rss_growth <= 0) and (len(not_allowed) == 0)
+	print "OK" if ok else "FAILED"
+	
+	return ok
+
+if (__name__ == "__main__"):
+	if (len(sys.argv) > 1):
+		ok = check(int(sys.argv[1]))
+	else:
+		ok = check()
+	
+	sys.exit(0 if ok else 1)
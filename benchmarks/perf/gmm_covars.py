@@ -0,0 +1,131 @@
+"""
+	GMM covariances update benchmark: previous per-neuron procedure against
+	current one for 'full' covariances (all neurons, only neurons inside 
+	the window of the last neighbourhood update, 'window_only', and only
+	neurons displaced by more than 'move_tolerance') and 'tied' covariance
+	(one matrix product), then time of SOM's feed with 'full' covariances
+	
+	Usage: python gmm_covars.py [input_dim]
+"""
+
+import sys
+import timeit
+import warnings
+
+sys.path.append("../../")
+
+from numpy import *
+
+from mpfrl.SOM import Miller_SOM
+
+LATTICE_SIDES = [10, 20, 30]
+NH_TOLERANCE = 1e-3
+MOVE_TOLERANCE = 1e-3
+
+def _prev_data(som):
+	som._covar_calc_data[:] = som.neurons[som._adj_neurons_inds, som._adj_wv_comps_inds]
+	som._covar_calc_data -= som._neurons_wv_comps_flat
+	som._covar_calc_data *= som._neurons_adj_num_norm * som.covar_diff_scale
+
+def _prev_full(som):
+	_prev_data(som)
+	
+	for i in xrange(som.neurons.shape[0]):
+		dot(som._covar_calc_data_views[i], 
+				som._covar_calc_data_views[i].T, 
+				som.gen_model.covars_[i])
+
+def _prev_tied(som, temp_cov):
+	_prev_data(som)
+	
+	for i in xrange(som.neurons.shape[0]):
+		dot(som._covar_calc_data_views[i], som._covar_calc_data_views[i].T, temp_cov)
+		
+		som.gen_model.covars_ += temp_cov
+		
+	som.gen_model.covars_ /= som.neurons.shape[0]
+
+def _som(side, input_dim, cov_type, window_only = False, move_tolerance = None, 
+			nh_tolerance = NH_TOLERANCE):
+	random.seed(0)
+	
+	som = Miller_SOM((side, side), input_dim, nh_tolerance = nh_tolerance)
+	som.init_generative_gmm(cov_type, window_only, move_tolerance)
+	
+	# (sets window of neighbourhood update)
+	som.feed(random.uniform(0.0, 1.0, input_dim).astype(som.dtype))
+	
+	return som
+
+def _time(f):
+	return min(timeit.repeat(f, repeat = 3, number = 10)) / 10
+
+def bench(input_dim = 16):
+	warnings.simplefilter("ignore", DeprecationWarning)
+	
+	print "%10s %12s %12s %12s %12s %12s %12s" % (
+				"lattice", "full (prev)", "full", "full (win)", "full (moved)", 
+				"tied (prev)", "tied")
+	
+	for side in LATTICE_SIDES:
+		t = []
+		
+		# -- full
+		som = _som(side, input_dim, "full")
+		
+		t.append(_time(lambda: _prev_full(som)))
+		t.append(_time(som._Template_SOM__update_covars))
+		
+		som = _som(side, input_dim, "full", True)
+		
+		t.append(_time(som._Template_SOM__update_covars))
+		
+		som = _som(side, input_dim, "full", False, MOVE_TOLERANCE, None)
+		
+		t.append(_time(som._Template_SOM__update_covars))
+		
+		# -- tied
+		som = _som(side, input_dim, "tied")
+		temp_cov = zeros(som.gen_model.covars_.shape, dtype = som.dtype)
+		
+		t.append(_time(lambda: _prev_tied(som, temp_cov)))
+		t.append(_time(som._Template_SOM__update_covars))
+		
+		print "%10s %12s %12s %12s %12s %12s %12s" % tuple(
+					["%dx%d" % (side, side)] + ["%.2f ms" % (x * 1e3) for x in t])
+	
+	print "nh_tolerance %g, move_tolerance %g" % (NH_TOLERANCE, MOVE_TOLERANCE)
+	print
+	
+	# -- feed (with 'full' covariances)
+	X = random.uniform(0.0, 1.0, (50, input_dim)).astype(float32)
+	
+	print "%10s %12s %12s %12s %12s" % ("lattice", "feed", "feed (win)", "feed (moved)", "moved")
+	
+	for side in LATTICE_SIDES:
+		t = []
+		
+		for (window_only, move_tolerance, nh_tolerance) in [
+							(False, None, None), 
+							(True, None, NH_TOLERANCE), 
+							(False, MOVE_TOLERANCE, None)]:
+			som = _som(side, input_dim, "full", window_only, move_tolerance, nh_tolerance)
+			
+			moved_num = 0
+			t_start = timeit.default_timer()
+			
+			for x in X:
+				som.feed(x)
+				if (move_tolerance is not None): moved_num += som._last_moved_inds.shape[0]
+			
+			t.append((timeit.default_timer() - t_start) / X.shape[0])
+		
+		print "%10s %12s %12s %12s %12.1f" % tuple(
+					["%dx%d" % (side, side)] + ["%.2f ms" % (x * 1e3) for x in t] + 
+					[float(moved_num) / X.shape[0]])
+
+if (__name__ == "__main__"):
+	if (len(sys.argv) > 1):
+		bench(int(sys.argv[1]))
+	else:
+		bench()
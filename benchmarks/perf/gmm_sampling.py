@@ -0,0 +1,106 @@
+"""
+	GMM generation benchmark ('generate' of SOM with generative model):
+	previous 'sklearn.mixture.GMM' (weights set and 'sample' called on
+	every draw) against 'Mixture_Sampler' with cached Cholesky factors,
+	both for the same SOM's means and covariances, for several lattices
+	and numbers of samples per draw (after feeding, so the cost of
+	factors refresh is included in the "feed + generate" column)
+	
+	Also reports time of importing 'sklearn.mixture' (in a new process),
+	previously paid on every import of SOM module
+	
+	Usage: python gmm_sampling.py [input_dim]
+"""
+
+import subprocess
+import sys
+import timeit
+import warnings
+
+sys.path.append("../../")
+
+from numpy import *
+
+from mpfrl.SOM import Miller_SOM
+
+try:
+	from sklearn.mixture import GMM
+except ImportError:
+	GMM = None
+
+# (GMM is deprecated in later versions of sklearn)
+warnings.simplefilter("ignore", DeprecationWarning)
+
+LATTICE_SIDES = [8, 20]
+SAMPLES_NUMS = [1, 100]
+
+def _sklearn_gmm(som):
+	gmm = GMM(n_components = som.neurons.shape[0], 
+				covariance_type = som.gen_model.covariance_type)
+	
+	gmm.means_ = som.neurons[:]
+	gmm.covars_ = som.gen_model.covars_
+	
+	return gmm
+
+def _prev_generate(gmm, act_vec, samples_num):
+	gmm.weights_ = act_vec[:]
+	
+	return gmm.sample(samples_num)
+
+def _import_time():
+	return float(subprocess.check_output([sys.executable, "-W", "ignore", "-c",
+				"import time; t = time.time(); import sklearn.mixture; "
+				"print time.time() - t"]))
+
+def bench(input_dim = 16):
+	if (GMM is not None):
+		print "sklearn.mixture import: %.0f ms\n" % (_import_time() * 1e3)
+	
+	print "%6s %10s %8s %14s %14s %22s" % (
+				"cov", "lattice", "samples", "sklearn, us", "sampler, us", 
+				"feed + generate, us")
+	
+	for cov_type in ["full", "tied"]:
+		for side in LATTICE_SIDES:
+			som = Miller_SOM((side, side), input_dim)
+			som.init_generative_gmm(cov_type)
+			
+			x = random.uniform(0.0, 1.0, input_dim).astype(som.dtype)
+			som.feed(x)
+			
+			act_vec = som.act_vec.copy()
+			
+			def feed_generate():
+				som.feed(x)
+				som.generate(som.act_vec, samples_num)
+			
+			for samples_num in SAMPLES_NUMS:
+				number = max(10, 20000 / samples_num / side)
+				
+				t_sampler = min(timeit.repeat(
+							lambda: som.generate(act_vec, samples_num), 
+							repeat = 3, number = number)) / number
+				
+				t_feed = min(timeit.repeat(
+							feed_generate, repeat = 3, number = number / 10)) / \
+								(number / 10)
+				
+				if (GMM is not None):
+					gmm = _sklearn_gmm(som)
+					
+					t_sklearn = min(timeit.repeat(
+								lambda: _prev_generate(gmm, act_vec, samples_num), 
+								repeat = 3, number = number)) / number
+				else:
+					t_sklearn = nan
+				
+				print "%6s %10s %8d %14.1f %14.1f %22.1f" % (
+							cov_type, "%dx%d" % (side, side), samples_num, 
+							t_sklearn * 1e6, t_sampler * 1e6, t_feed * 1e6)
+
+if (__name__ == "__main__"):
+	if (len(sys.argv) > 1):
+		bench(int(sys.argv[1]))
+	else:
+		bench()
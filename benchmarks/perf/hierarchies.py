@@ -0,0 +1,70 @@
+"""
+	Hierarchy factory shared by benchmark and check scripts: snake-like
+	hierarchy of Miller_SOM units with sensor units fed from grid patches
+	(optionally plus one actuator unit)
+"""
+
+import sys
+
+sys.path.append("../../")
+
+from numpy import *
+
+from mpfrl.hierarchy import MPF_Hierarchy
+from mpfrl.units import *
+from mpfrl.SOM import Miller_SOM
+from mpfrl.common import FLOAT_DTYPE
+
+def build_hierarchy(sensors_num, input_dim, levels_num = 3, 
+						ss_shape = (10, 10), ts_shape = (8, 8), 
+						l0_ts_class = Miller_SOM, actions_num = 0, 
+						dtype = FLOAT_DTYPE, seed = 0, rngs_seed = None, 
+						**kwargs):
+	"""
+		Builds hierarchy of 'sensors_num' L0 sensor units with 'input_dim' 
+		inputs, plus actuator unit with 'actions_num' inputs if it is 
+		positive, and 'levels_num' levels in total; 'kwargs' are passed
+		to MPF_Hierarchy
+		
+		'seed' (if not None) is used to seed numpy.random before building,
+		so that every built hierarchy has same initial neurons; 'rngs_seed'
+		(if not None) is passed to 'MPF_Hierarchy.seed_rngs'
+	"""
+	
+	if seed is not None:
+		random.seed(seed)
+	
+	l0_units = [
+			MPF_Unit_RL(
+				ss_class = Miller_SOM,
+				ts_class = l0_ts_class,
+				input_dim = input_dim,
+				ss_shape = ss_shape,
+				ts_shape = ts_shape,
+				parent_unit = None,
+				unit_type = MPF_UT_SENSOR,
+				dtype = dtype
+			)
+			for i in xrange(sensors_num)
+	]
+	
+	if actions_num > 0:
+		l0_units.append(
+				MPF_Unit_RL(
+					ss_class = Miller_SOM,
+					ts_class = l0_ts_class,
+					input_dim = actions_num,
+					ss_shape = (4, 4),
+					ts_shape = ts_shape,
+					parent_unit = None,
+					unit_type = MPF_UT_ACTUATOR,
+					dtype = dtype
+				)
+		)
+	
+	h = MPF_Hierarchy(l0_units, levels_num, **kwargs)
+	
+	if rngs_seed is not None:
+		h.seed_rngs(rngs_seed)
+	
+	return h
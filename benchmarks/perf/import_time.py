@@ -0,0 +1,101 @@
+"""
+	Startup benchmark of short-lived evaluation worker (new process that
+	imports package, builds hierarchy of tictactoe agent, i.e. without 
+	generative model and dumps, and evaluates it once): time of imports,
+	of building and of the first evaluation, and heavy optional modules 
+	found loaded at the end
+	
+	Workers are run with bytecode cache (one warm-up run first), the 
+	previous eager import of 'scipy.io' (by 'hierarchy') is reproduced
+	by importing it explicitly before the package
+	
+	Usage: python import_time.py [runs_num]
+"""
+
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = ["scipy", "sklearn", "multiprocessing"]
+
+WORKER = """
+import sys
+import time
+
+t_start = time.time()
+
+if (%(eager)s):
+	import scipy.io
+
+sys.path.append("../../")
+
+from mpfrl.hierarchy import MPF_Hierarchy
+from mpfrl.units import *
+from mpfrl.SOM import Miller_SOM
+
+t_imported = time.time()
+
+l0_units = [
+		MPF_Unit_RL(
+			ss_class = Miller_SOM,
+			ts_class = None,
+			input_dim = 3,
+			ss_shape = (5, 5),
+			ts_shape = (6, 6),
+			parent_unit = None,
+			unit_type = MPF_UT_SENSOR
+		)
+		for i in xrange(3)
+]
+
+mpf_h = MPF_Hierarchy(
+		l0_units = l0_units,
+		levels_num = 3,
+		dump_period = 0,
+		ts_class = Miller_SOM
+)
+
+t_built = time.time()
+
+mpf_h.evaluate(random.uniform(0.0, 1.0, 9).astype(mpf_h.dtype), 0.0)
+
+t_evaluated = time.time()
+
+print t_imported - t_start, t_built - t_imported, t_evaluated - t_built
+print " ".join([m for m in %(heavy)r if (m in sys.modules)])
+"""
+
+def _run_worker(eager):
+	env = dict(os.environ)
+	env.pop("PYTHONDONTWRITEBYTECODE", None)
+	
+	out = subprocess.check_output(
+				[sys.executable, "-W", "ignore", "-c", 
+					WORKER % {"eager": eager, "heavy": HEAVY_MODULES}],
+				env = env
+	).splitlines()
+	
+	return ([float(t) for t in out[0].split()], out[1] if (len(out) > 1) else "")
+
+def bench(runs_num = 10):
+	print "%8s %12s %12s %12s %12s   %s" % (
+				"imports", "import, ms", "build, ms", "evaluate, ms", 
+				"total, ms", "heavy modules loaded")
+	
+	for eager in [True, False]:
+		_run_worker(eager) # warm-up (bytecode cache)
+		
+		runs = [_run_worker(eager) for i in xrange(runs_num)]
+		
+		# (the fastest run of every stage)
+		t = [min([r[0][i] for r in runs]) for i in xrange(3)]
+		
+		print "%8s %12.1f %12.1f %12.1f %12.1f   %s" % (
+					"eager" if eager else "lazy", 
+					t[0] * 1e3, t[1] * 1e3, t[2] * 1e3, sum(t) * 1e3, runs[0][1])
+
+if (__name__ == "__main__"):
+	if (len(sys.argv) > 1):
+		bench(int(sys.argv[1]))
+	else:
+		bench()
@@ -0,0 +1,50 @@
+"""
+	Neighbourhood update benchmark: full-lattice update against
+	windowed one ('nh_tolerance' SOM's parameter) for several
+	lattice sizes and neighbourhood widths
+	
+	Usage: python nh_update.py [input_dim]
+"""
+
+import sys
+import timeit
+
+sys.path.append("../../")
+
+from numpy import *
+
+from mpfrl.SOM import Miller_SOM
+
+LATTICE_SIDES = [20, 50, 100, 200]
+SIGMAS = [1.0, 3.0]
+NH_TOLERANCE = 1e-3
+
+def bench(input_dim = 16):
+	print "%10s %6s %12s %12s %10s" % (
+				"lattice", "sigma", "full, us", "window, us", "speedup")
+	
+	for side in LATTICE_SIDES:
+		som_full = Miller_SOM((side, side), input_dim)
+		som_win = Miller_SOM((side, side), input_dim, nh_tolerance = NH_TOLERANCE)
+		
+		diff_m = random.uniform(-1.0, 1.0, som_full.neurons.shape)
+		bmu_ind = (side / 2) * side + side / 2
+		
+		for sigma in SIGMAS:
+			t = []
+			
+			for som in [som_full, som_win]:
+				t.append(min(timeit.repeat(
+							lambda: som._nh_update(bmu_ind, sigma*sigma, diff_m), 
+							repeat = 3, number = 20
+				)) / 20)
+			
+			print "%10s %6.1f %12.1f %12.1f %9.1fx" % (
+						"%dx%d" % (side, side), sigma,
+						t[0] * 1e6, t[1] * 1e6, t[0] / t[1])
+
+if (__name__ == "__main__"):
+	if (len(sys.argv) > 1):
+		bench(int(sys.argv[1]))
+	else:
+		bench()
@@ -0,0 +1,96 @@
+"""
+	Noise benchmark: per-call cost of pre-drawn (ring buffer) noise
+	against previous noise (samples are drawn on every call) for 
+	several noise vector lengths (input dimensions of SOMs), and 
+	evaluation time of hierarchy with ring noise against drawing 
+	samples on every call ('block_size = 1')
+	
+	Snake-like hierarchy is used: 16 L0 sensor units, three levels in total
+	
+	Usage: python noise_ring.py [steps_num]
+"""
+
+import sys
+import time
+import timeit
+
+sys.path.append("../../")
+
+from numpy import *
+
+from mpfrl.noise import UniformNoise, GaussianNoise, NOISE_BLOCK_SIZE
+from hierarchies import build_hierarchy
+
+SENSORS_NUM = 16
+PATCH_DIM = 16
+
+NOISE_DIMS = [16, 100, 400]
+
+class _Prev_Noise:
+	"""
+	previous implementation of noises
+	"""
+	
+	def __init__(self, noise_class, shape):
+		self.noise_class = noise_class
+		self.shape = shape
+		
+		self.magn = 1.0
+		self.magn_decrease = 1e-4
+		self.min_magn = 0.001
+		
+	def __call__(self):
+		self.magn -= self.magn_decrease
+		if (self.magn < self.min_magn):
+			self.magn_decrease = 0.0
+			self.magn = self.min_magn
+		
+		if (self.noise_class == UniformNoise):
+			return random.uniform(-1.0, 1.0, self.shape) * self.magn
+		else:
+			return random.normal(0.0, self.magn, self.shape)
+
+def _build_hierarchy(block_size):
+	h = build_hierarchy(SENSORS_NUM, PATCH_DIM, rngs_seed = 0)
+	
+	for unit in h.l0_units + h.units:
+		unit.ss._noise_func.block_size = block_size
+		unit.ts._noise_func.block_size = block_size
+	
+	return h
+
+def bench(steps_num = 50):
+	print "%8s %10s %12s %12s %10s" % ("noise", "dim", "previous, us", "ring, us", "speedup")
+	
+	for noise_class in [UniformNoise, GaussianNoise]:
+		for dim in NOISE_DIMS:
+			noise = noise_class(magn_decrease = 1e-4)
+			noise.shape = dim
+			
+			t = [
+				min(timeit.repeat(f, repeat = 3, number = 2000)) / 2000
+				for f in [_Prev_Noise(noise_class, dim), noise]
+			]
+			
+			print "%8s %10d %12.2f %12.2f %9.1fx" % (
+						noise_class.__name__[:-5], dim, t[0] * 1e6, t[1] * 1e6, t[0] / t[1])
+	
+	X = random.uniform(0.0, 1.0, (steps_num, SENSORS_NUM * PATCH_DIM))
+	
+	t = []
+	
+	for block_size in [1, NOISE_BLOCK_SIZE]:
+		h = _build_hierarchy(block_size)
+		
+		t_start = time.time()
+		for i in xrange(steps_num):
+			h.evaluate(X[i], 0.0)
+		t.append((time.time() - t_start) / steps_num)
+	
+	print "evaluate, ms: per call %.2f, ring %.2f" % (t[0] * 1e3, t[1] * 1e3)
+
+if (__name__ == "__main__"):
+	if (len(sys.argv) > 1):
+		bench(int(sys.argv[1]))
+	else:
+		bench()
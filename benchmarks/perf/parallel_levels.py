@@ -0,0 +1,74 @@
+"""
+	Parallel per-level evaluation benchmark: sequential 'MPF_Hierarchy.evaluate'
+	against the same hierarchy with same-level units dispatched to a thread
+	pool (see 'MPF_Hierarchy.set_executor')
+	
+	Snake-like hierarchy is used: 16 L0 sensor units fed from 4x4 grid patches
+	plus one actuator unit, three levels in total
+	
+	Usage: python parallel_levels.py [steps_num]
+"""
+
+import sys
+import time
+
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+sys.path.append("../../")
+
+from numpy import *
+
+from mpfrl.SOM import Miller_SOM
+from hierarchies import build_hierarchy
+
+THREADS_NUMS = [1, 2, 4, 8]
+
+SENSORS_NUM = 16
+PATCH_DIM = 16
+ACTIONS_NUM = 4
+
+def _build_hierarchy():
+	# same initial neurons for every built hierarchy
+	return build_hierarchy(SENSORS_NUM, PATCH_DIM, actions_num = ACTIONS_NUM, 
+							rngs_seed = 0, ts_class = Miller_SOM, 
+							dump_period = 0)
+
+def _run(h, X, R):
+	t_start = time.time()
+	for t in xrange(X.shape[0]):
+		h.evaluate(X[t], R[t])
+	
+	return (time.time() - t_start) / X.shape[0]
+
+def bench(steps_num = 50):
+	X = random.uniform(0.0, 1.0, (steps_num, SENSORS_NUM * PATCH_DIM + ACTIONS_NUM))
+	R = random.uniform(-1.0, 1.0, steps_num)
+	
+	print "CPUs: %d" % cpu_count()
+	
+	h = _build_hierarchy()
+	t_sequential = _run(h, X, R)
+	
+	print "%8s %12s %10s %10s" % ("threads", "step, ms", "speedup", "identical")
+	print "%8s %12.2f %9.1fx %10s" % ("-", t_sequential * 1e3, 1.0, "-")
+	
+	for threads_num in THREADS_NUMS:
+		pool = ThreadPool(threads_num)
+		
+		h_par = _build_hierarchy()
+		h_par.set_executor(pool)
+		t_parallel = _run(h_par, X, R)
+		
+		pool.close()
+		pool.join()
+		
+		print "%8d %12.2f %9.1fx %10s" % (
+					threads_num, t_parallel * 1e3, t_sequential / t_parallel,
+					(h_par.output_vec == h.output_vec).all())
+
+if (__name__ == "__main__"):
+	if (len(sys.argv) > 1):
+		bench(int(sys.argv[1]))
+	else:
+		bench()
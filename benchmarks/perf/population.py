@@ -0,0 +1,71 @@
+"""
+	Population benchmark: K separate 'MPF_Hierarchy.evaluate' calls against
+	one 'MPF_Population.evaluate' of the same K hierarchies
+	
+	Tictactoe-like hierarchies are used: three L0 units without RSOM,
+	three levels in total. Members have dedicated random numbers generators
+	(see 'MPF_Hierarchy.seed_rngs'), so separate and population outputs
+	differ by rounding only (largest difference is printed)
+	
+	Usage: python population.py [steps_num]
+"""
+
+import sys
+import time
+
+sys.path.append("../../")
+
+from numpy import *
+
+from mpfrl.population import MPF_Population
+from mpfrl.SOM import Miller_SOM
+from hierarchies import build_hierarchy
+
+POPULATION_SIZES = [1, 4, 16, 64]
+
+def _build_hierarchy(seed):
+	return build_hierarchy(3, 3, ss_shape = (5, 5), ts_shape = (6, 6), 
+							l0_ts_class = None, seed = seed, 
+							rngs_seed = seed, ts_class = Miller_SOM)
+
+def bench(steps_num = 50):
+	print "%6s %16s %16s %10s %12s" % (
+				"K", "separate, ms", "population, ms", "speedup", "max diff")
+	
+	for K in POPULATION_SIZES:
+		X = random.uniform(0.0, 1.0, (steps_num, K, 9))
+		R = random.uniform(-1.0, 1.0, (steps_num, K))
+		
+		# -- separate hierarchies
+		hierarchies = [_build_hierarchy(k) for k in xrange(K)]
+		
+		t_start = time.time()
+		for t in xrange(steps_num):
+			for k in xrange(K):
+				hierarchies[k].evaluate(X[t, k], R[t, k])
+		
+		t_separate = (time.time() - t_start) / steps_num
+		
+		# -- population
+		population = MPF_Population([_build_hierarchy(k) for k in xrange(K)])
+		
+		t_start = time.time()
+		for t in xrange(steps_num):
+			population.evaluate(X[t], R[t])
+		
+		t_population = (time.time() - t_start) / steps_num
+		
+		max_diff = abs(
+					population.output_vecs - 
+					array([h.output_vec for h in hierarchies])
+		).max()
+		
+		print "%6d %16.2f %16.2f %9.1fx %12.2g" % (
+					K, t_separate * 1e3, t_population * 1e3, 
+					t_separate / t_population, max_diff)
+
+if (__name__ == "__main__"):
+	if (len(sys.argv) > 1):
+		bench(int(sys.argv[1]))
+	else:
+		bench()
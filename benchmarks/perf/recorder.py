@@ -0,0 +1,145 @@
+"""
+	Recording benchmark: cost of per-step diagnostics recording (in memory
+	and into columnar file) compared to 'MPF_Hierarchy.evaluate', size of 
+	recorded row and loading time of whole file
+	
+	Recorder's calls are timed directly (on trained hierarchy), difference
+	of evaluation times is hidden by noise
+	
+	Snake-like hierarchy is used: 16 L0 sensor units, three levels in total
+	
+	Recording across 'MPF_Hierarchy.map_state' is checked too: rows must
+	match those of the same hierarchy which state is not mapped
+	
+	Usage: python recorder.py [steps_num]
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+import time
+
+sys.path.append("../../")
+
+from numpy import *
+
+from mpfrl.recorder import load_series
+from hierarchies import build_hierarchy
+
+SENSORS_NUM = 16
+PATCH_DIM = 16
+
+def _run(h, X):
+	t_start = time.time()
+	for t in xrange(X.shape[0]):
+		h.evaluate(X[t], 0.0)
+	
+	return (time.time() - t_start) / X.shape[0]
+
+def _time_recording(h, X):
+	"""
+	returns time of recorder's calls per step
+	"""
+	
+	t_start = time.time()
+	for t in xrange(X.shape[0]):
+		h.recorder.record(X[t])
+		h.recorder.store_outputs()
+	
+	return (time.time() - t_start) / X.shape[0]
+
+def bench(steps_num = 200):
+	X = random.uniform(0.0, 1.0, (steps_num, SENSORS_NUM * PATCH_DIM))
+	
+	h = build_hierarchy(SENSORS_NUM, PATCH_DIM)
+	t_evaluate = _run(h, X)
+	
+	h.start_recording()
+	t_memory = _time_recording(h, X)
+	
+	columns_num = len(h.recorder.columns)
+	
+	series_path = tempfile.mkdtemp()
+	file_path = os.path.join(series_path, "h.series")
+	
+	try:
+		h.start_recording(file_path, 64)
+		t_file = _time_recording(h, X)
+		h.close_recording()
+		
+		file_size = os.path.getsize(file_path)
+		
+		t_start = time.time()
+		columns = load_series(file_path)
+		t_load = time.time() - t_start
+	finally:
+		shutil.rmtree(series_path)
+	
+	assert(len(columns["t"]) == steps_num)
+	
+	print "evaluate, ms: %.2f" % (t_evaluate * 1e3)
+	print "columns: %d, bytes per row: %.1f" % (
+				columns_num, float(file_size) / steps_num)
+	print "recording in memory per step, ms: %.3f (%.1f%% of evaluate)" % (
+				t_memory * 1e3, 100.0 * t_memory / t_evaluate)
+	print "recording into file per step, ms: %.3f (%.1f%% of evaluate)" % (
+				t_file * 1e3, 100.0 * t_file / t_evaluate)
+	print "loading %d rows, ms: %.2f" % (steps_num, t_load * 1e3)
+
+def check_mapping(steps_num = 200):
+	"""
+	records two identical hierarchies, state of the second one is mapped 
+	(and synchronized) in the middle of recording, returns whether their
+	columns are equal
+	"""
+	
+	X = random.uniform(0.0, 1.0, (steps_num, SENSORS_NUM * PATCH_DIM))
+	R = random.uniform(-1.0, 1.0, steps_num)
+	
+	hs = [
+		build_hierarchy(SENSORS_NUM, PATCH_DIM, seed = 0, rngs_seed = 0)
+		for i in xrange(2)
+	]
+	
+	state_path = tempfile.mkdtemp()
+	
+	try:
+		for h in hs:
+			h.start_recording()
+		
+		for t in xrange(steps_num):
+			if (t == steps_num // 2):
+				hs[1].map_state(os.path.join(state_path, "h.state"))
+			
+			for h in hs:
+				h.evaluate(X[t], R[t])
+			
+			if (t >= steps_num // 2): hs[1].sync_state()
+	finally:
+		shutil.rmtree(state_path)
+	
+	# (NaN of zero vectors' angular errors are equal)
+	mismatches = [
+		name 
+		for name in hs[0].recorder.columns
+			if (not allclose(hs[0].recorder.column(name), hs[1].recorder.column(name),
+								rtol = 0.0, atol = 0.0, equal_nan = True))
+	]
+	
+	print "recording across map_state, mismatched columns: %d of %d" % (
+				len(mismatches), len(hs[0].recorder.columns))
+	
+	return (len(mismatches) == 0)
+
+if (__name__ == "__main__"):
+	if (len(sys.argv) > 1):
+		bench(int(sys.argv[1]))
+		ok = check_mapping(int(sys.argv[1]))
+	else:
+		bench()
+		ok = check_mapping()
+	
+	print "OK" if ok else "FAILED"
+	
+	sys.exit(0 if ok else 1)
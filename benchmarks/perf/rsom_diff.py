@@ -0,0 +1,129 @@
+"""
+	RSOM difference accumulation benchmark: in-place leaky integration
+	(difference memory is not copied and not altered by neighbourhood 
+	update) against previous procedure (integration into temporaries, 
+	copy of the whole difference matrix to memory, in-place update of 
+	difference), both followed by BMU search and Miller SOM's update
+	
+	Traffic is counted in passes over N x D matrices (every read and 
+	write of whole matrix, temporaries included) per step
+	
+	Target is 2x less traffic of accumulation, checked by its time on the 
+	largest lattice (the only one which doesn't fit in cache, so time is
+	bound by traffic). In passes it is 13 -> 9: integration by numpy's
+	ufuncs takes at least 4 calls (difference, its scaling, scaling of
+	memory, sum), while memory holds difference itself. Fewer passes need
+	fused multiply-add (BLAS axpy, 7 passes, 1.5x faster on 50x50, but
+	scipy in SOM's step) or memory kept scaled (5 passes, stored state
+	is not difference then), both aren't worth it
+	
+	Lattices are of temporal SOMs fed from 20x20 spatial SOM
+	
+	Usage: python rsom_diff.py [steps_num]
+"""
+
+import sys
+import time
+import timeit
+
+sys.path.append("../../")
+
+from numpy import *
+
+from mpfrl.common import EPS
+from mpfrl.SOM import Miller_SOM
+
+INPUT_DIM = 400
+LATTICE_SIDES = [8, 20, 50]
+
+# reduction of accumulation's time on the largest lattice
+TARGET_SPEEDUP = 2.0
+
+# -- passes of (difference accumulation, BMU search, update)
+PREV_PASSES = (13, 2, 5)
+CURR_PASSES = (9, 2, 5)
+
+def _prev_accumulate(som, input_vec, diff_m, last_diff_m):
+	diff_m[:] = (1 - som.decay) * last_diff_m + som.decay * (input_vec - som.neurons)
+	last_diff_m[:] = diff_m
+
+def _prev_step(som, input_vec, diff_m, last_diff_m):
+	"""
+	previous per-step procedure (see 'Miller_SOM._update_neurons_kernel')
+	"""
+	
+	_prev_accumulate(som, input_vec, diff_m, last_diff_m)
+	
+	bmu_ind = argmin(som._calc_sq_dists(diff_m))
+	
+	model_error = dot(diff_m[bmu_ind], diff_m[bmu_ind]) / diff_m.shape[1]
+	if (model_error < EPS): model_error = EPS
+	
+	diff_m *= som._gauss_nh(bmu_ind, model_error * som.nh_constant * som.nh_constant)
+	som.neurons += diff_m
+
+def _curr_step(som, input_vec):
+	diff_m = som._Template_SOM__calc_diff_m(input_vec)
+	
+	bmu_ind = argmin(som._calc_sq_dists(diff_m))
+	
+	som._update_neurons_kernel(bmu_ind, diff_m)
+
+def bench(steps_num = 200):
+	X = random.uniform(0.0, 1.0, (steps_num, INPUT_DIM)).astype(float32)
+	
+	print "%10s %24s %24s" % ("", "accumulation, us", "step, us")
+	print "%10s %10s %10s %4s %10s %10s %4s" % (
+				"lattice", "previous", "current", "", "previous", "current", "")
+	
+	for side in LATTICE_SIDES:
+		random.seed(0)
+		som_prev = Miller_SOM((side, side), INPUT_DIM, rsom_ext = True)
+		random.seed(0)
+		som_curr = Miller_SOM((side, side), INPUT_DIM, rsom_ext = True)
+		
+		diff_m = zeros(som_prev.neurons.shape, dtype = som_prev.dtype)
+		last_diff_m = zeros(som_prev.neurons.shape, dtype = som_prev.dtype)
+		
+		t_start = time.time()
+		for t in xrange(steps_num):
+			_prev_step(som_prev, X[t], diff_m, last_diff_m)
+		t_prev = (time.time() - t_start) / steps_num
+		
+		t_start = time.time()
+		for t in xrange(steps_num):
+			_curr_step(som_curr, X[t])
+		t_curr = (time.time() - t_start) / steps_num
+		
+		assert(array_equal(som_prev.neurons, som_curr.neurons))
+		
+		# -- accumulation alone
+		calc_diff_m = som_curr._Template_SOM__calc_diff_m
+		
+		t_prev_acc = min(timeit.repeat(
+					lambda: _prev_accumulate(som_prev, X[0], diff_m, last_diff_m), 
+					repeat = 5, number = 50
+		)) / 50
+		t_curr_acc = min(timeit.repeat(
+					lambda: calc_diff_m(X[0]), repeat = 5, number = 50)) / 50
+		
+		acc_speedup = t_prev_acc / t_curr_acc
+		
+		print "%10s %10.1f %10.1f %3.1fx %10.1f %10.1f %3.1fx" % (
+					"%dx%d" % (side, side), 
+					t_prev_acc * 1e6, t_curr_acc * 1e6, t_prev_acc / t_curr_acc,
+					t_prev * 1e6, t_curr * 1e6, t_prev / t_curr)
+	
+	print "passes over N x D matrices: accumulation %d -> %d " \
+			"(%d temporaries -> 0), step %d -> %d" % (
+				PREV_PASSES[0], CURR_PASSES[0], 4, 
+				sum(PREV_PASSES), sum(CURR_PASSES))
+	print "target (%.1fx less accumulation's time on %dx%d): %s" % (
+				TARGET_SPEEDUP, LATTICE_SIDES[-1], LATTICE_SIDES[-1],
+				"met" if (acc_speedup >= TARGET_SPEEDUP) else "NOT met")
+
+if (__name__ == "__main__"):
+	if (len(sys.argv) > 1):
+		bench(int(sys.argv[1]))
+	else:
+		bench()
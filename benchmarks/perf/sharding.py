@@ -0,0 +1,74 @@
+"""
+	Sharded hierarchy benchmark: sequential 'MPF_Hierarchy.evaluate' against
+	'MPF_Sharded_Hierarchy.evaluate' of the same hierarchy with its subtrees
+	distributed among 1..8 worker processes
+	
+	Synthetic hierarchy is used: 64 L0 sensor units, four levels in total,
+	subtrees are rooted at L1
+	
+	Usage: python sharding.py [steps_num]
+"""
+
+import sys
+import time
+
+from multiprocessing import cpu_count
+
+sys.path.append("../../")
+
+from numpy import *
+
+from mpfrl.sharding import MPF_Sharded_Hierarchy
+from mpfrl.SOM import Miller_SOM
+from hierarchies import build_hierarchy
+
+PROCESSES_NUMS = [1, 2, 4, 8]
+
+SENSORS_NUM = 64
+SENSOR_DIM = 8
+
+def _build_hierarchy():
+	# same initial neurons for every built hierarchy
+	return build_hierarchy(SENSORS_NUM, SENSOR_DIM, 4, ss_shape = (8, 8), 
+							ts_shape = (6, 6), rngs_seed = 0, 
+							ts_class = Miller_SOM, dump_period = 0)
+
+def _run(h, X, R):
+	t_start = time.time()
+	for t in xrange(X.shape[0]):
+		h.evaluate(X[t], R[t])
+	
+	return (time.time() - t_start) / X.shape[0]
+
+def bench(steps_num = 30):
+	X = random.uniform(0.0, 1.0, (steps_num, SENSORS_NUM * SENSOR_DIM))
+	R = random.uniform(-1.0, 1.0, steps_num)
+	
+	print "CPUs: %d" % cpu_count()
+	
+	h = _build_hierarchy()
+	t_sequential = _run(h, X, R)
+	
+	print "%10s %12s %10s %10s" % ("processes", "step, ms", "speedup", "identical")
+	print "%10s %12.2f %9.1fx %10s" % ("-", t_sequential * 1e3, 1.0, "-")
+	
+	for processes_num in PROCESSES_NUMS:
+		sharded_h = MPF_Sharded_Hierarchy(_build_hierarchy(), processes_num)
+		t_sharded = _run(sharded_h, X, R)
+		
+		sharded_h.close()
+		
+		print "%10d %12.2f %9.1fx %10s" % (
+					processes_num, t_sharded * 1e3, t_sequential / t_sharded,
+					(sharded_h.h.output_vec == h.output_vec).all())
+	
+	if (cpu_count() < PROCESSES_NUMS[-1]):
+		print "NOTE: only %d CPU(s), workers beyond that share CPUs, so " \
+				"scaling up to %d processes is NOT measured here" % (
+					cpu_count(), PROCESSES_NUMS[-1])
+
+if (__name__ == "__main__"):
+	if (len(sys.argv) > 1):
+		bench(int(sys.argv[1]))
+	else:
+		bench()
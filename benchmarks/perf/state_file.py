@@ -0,0 +1,102 @@
+"""
+	Memory-mapped state benchmark: creation of state file, checkpoint
+	('sync_state' after every step) and restoring into fresh hierarchy
+	compared to 'MPF_Hierarchy.evaluate' and to reading the last snapshot
+	of checkpoint store (i.e. parsing)
+	
+	Snake-like hierarchy is used: 16 L0 sensor units, three levels in total
+	
+	Usage: python state_file.py [steps_num]
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+import time
+
+sys.path.append("../../")
+
+from numpy import *
+
+from mpfrl.hierarchy import CHECKPOINT_FILENAME
+from mpfrl.checkpoints import Checkpoint_Reader
+from hierarchies import build_hierarchy
+
+SENSORS_NUM = 16
+PATCH_DIM = 16
+
+def _build_hierarchy(dump_period = 0, dump_path = ""):
+	return build_hierarchy(SENSORS_NUM, PATCH_DIM, dump_period = dump_period, 
+							dump_path = dump_path, dump_format = "checkpoint")
+
+def bench(steps_num = 50):
+	X = random.uniform(0.0, 1.0, (steps_num, SENSORS_NUM * PATCH_DIM))
+	
+	dump_path = tempfile.mkdtemp()
+	state_path = os.path.join(dump_path, "h.state")
+	
+	try:
+		h = _build_hierarchy(steps_num, dump_path)
+		
+		t_start = time.time()
+		for t in xrange(steps_num):
+			h.evaluate(X[t], 0.0)
+		t_evaluate = (time.time() - t_start) / steps_num
+		
+		h.close_dumps()
+		
+		# -- creation
+		t_start = time.time()
+		h.map_state(state_path)
+		t_map = time.time() - t_start
+		
+		# -- checkpoint every step
+		t_start = time.time()
+		for t in xrange(steps_num):
+			h.evaluate(X[t], 0.0)
+			h.sync_state()
+		t_sync = (time.time() - t_start) / steps_num - t_evaluate
+		
+		record = h.state_record().copy()
+		
+		# -- restoring
+		h_restored = _build_hierarchy()
+		
+		t_start = time.time()
+		h_restored.map_state(state_path, restore = True)
+		t_restore = time.time() - t_start
+		
+		restored_record = h_restored.state_record()
+		
+		identical = True
+		for name in record.dtype.names:
+			if (not array_equal(record[name], restored_record[name])):
+				identical = identical and \
+					(isnan(record[name]).all() and isnan(restored_record[name]).all())
+		
+		# -- parsing of checkpoint store
+		t_start = time.time()
+		reader = Checkpoint_Reader(os.path.join(dump_path, CHECKPOINT_FILENAME))
+		reader.snapshot()
+		reader.close()
+		t_parse = time.time() - t_start
+		
+		file_stat = os.stat(state_path)
+	finally:
+		shutil.rmtree(dump_path)
+	
+	print "evaluate, ms: %.2f" % (t_evaluate * 1e3)
+	print "state file, KiB: %.1f (allocated %.1f)" % (
+				file_stat.st_size / 1024.0, file_stat.st_blocks * 512 / 1024.0)
+	print "map (create), ms: %.2f" % (t_map * 1e3)
+	print "sync per step, ms: %.2f (%.1f%% of evaluate)" % (
+				t_sync * 1e3, 100.0 * t_sync / t_evaluate)
+	print "restore, ms: %.2f (identical: %s)" % (t_restore * 1e3, identical)
+	print "checkpoint snapshot parse, ms: %.2f" % (t_parse * 1e3)
+
+if (__name__ == "__main__"):
+	if (len(sys.argv) > 1):
+		bench(int(sys.argv[1]))
+	else:
+		bench()
@@ -0,0 +1,103 @@
+"""
+	Units' layout benchmark: hierarchies with many L0 units, Python 
+	overhead per unit (instance with '__slots__' against instance plus 
+	dictionary of the same attributes), number of separately allocated
+	units' vectors and 'evaluate' time with vectors in level-wide arrays
+	against the same hierarchy with every vector copied to its own 
+	allocation (previous scattered layout), also sweep over one vector 
+	of all units of L0 (e.g. collecting reward correlations)
+	
+	Usage: python unit_layout.py [steps_num]
+"""
+
+import sys
+import time
+
+sys.path.append("../../")
+
+from numpy import *
+
+from mpfrl.SOM import Miller_SOM
+from hierarchies import build_hierarchy
+
+L0_UNITS_NUMS = [16, 64, 256]
+PATCH_DIM = 4
+
+def _build_hierarchy(l0_units_num):
+	return build_hierarchy(l0_units_num, PATCH_DIM, ss_shape = (5, 5), 
+							ts_shape = (6, 6), l0_ts_class = None, 
+							rngs_seed = 0, ts_class = Miller_SOM)
+
+def _scatter(h):
+	"""
+	copies every vector of units to its own allocation
+	"""
+	
+	for unit in h.l0_units + h.units:
+		for name in unit._level_vectors:
+			setattr(unit, name, getattr(unit, name).copy())
+
+def _attributes_dict_size(unit):
+	names = [
+		"_%s%s" % (cls.__name__, name) if name.startswith("__") else name
+		for cls in unit.__class__.__mro__
+			for name in getattr(cls, "__slots__", ())
+	]
+	
+	return sys.getsizeof(dict([
+		(name, getattr(unit, name)) for name in names if hasattr(unit, name)
+	]))
+
+def _time_evaluate(h, X):
+	t_start = time.time()
+	
+	for t in xrange(X.shape[0]):
+		h.evaluate(X[t], 0.1)
+	
+	return (time.time() - t_start) / X.shape[0]
+
+def bench(steps_num = 50):
+	print "%6s %10s %10s %12s %12s %14s %14s %12s %12s" % (
+				"L0", "unit, B", "dict, B", "vectors", "arrays", 
+				"scattered, ms", "level-wide, ms", "sweep, us", "level, us")
+	
+	for l0_units_num in L0_UNITS_NUMS:
+		X = random.uniform(0.0, 1.0, (steps_num, l0_units_num * PATCH_DIM))
+		
+		h_packed = _build_hierarchy(l0_units_num)
+		h_scattered = _build_hierarchy(l0_units_num)
+		_scatter(h_scattered)
+		
+		unit = h_packed.l0_units[0]
+		
+		vectors_num = sum([len(u._level_vectors) for u in h_packed.l0_units + h_packed.units])
+		levels_vectors = h_packed.levels_vectors()
+		arrays_num = sum([len(level) for level in levels_vectors])
+		
+		t_scattered = _time_evaluate(h_scattered, X)
+		t_packed = _time_evaluate(h_packed, X)
+		
+		# -- mean reward correlation of every L0 unit
+		name = "_MPF_Unit_RL__reward_corr"
+		number = 1000
+		
+		t_start = time.time()
+		for i in xrange(number):
+			array([getattr(u, name).mean() for u in h_scattered.l0_units])
+		t_sweep = (time.time() - t_start) / number
+		
+		t_start = time.time()
+		for i in xrange(number):
+			levels_vectors[0][name].mean(axis = 1)
+		t_level = (time.time() - t_start) / number
+		
+		print "%6d %10d %10d %12d %12d %14.2f %14.2f %12.1f %12.1f" % (
+					l0_units_num, sys.getsizeof(unit), _attributes_dict_size(unit),
+					vectors_num, arrays_num, t_scattered * 1e3, t_packed * 1e3,
+					t_sweep * 1e6, t_level * 1e6)
+
+if (__name__ == "__main__"):
+	if (len(sys.argv) > 1):
+		bench(int(sys.argv[1]))
+	else:
+		bench()
@@ -10,10 +10,14 @@
 	2. RSOM based on PL-SOM
 """
 
+from collections import OrderedDict
+
 from common import *
-from sklearn.mixture import GMM
 
 from noise import *
+from predictors import *
+from samplers import *
+from state import *
 
 
 #================================================================================
@@ -24,7 +28,14 @@ class _Template_SOM:
 	Template for deriving specific kinds of Self-Organizing Maps
 	
 	Temporal extension (RSOM) is enabled by passing 'rsom_ext = True' as
-	argument to constructor
+	argument to constructor, then leaky integrated difference is kept (and
+	updated in-place) in '__last_diff_m' and '__diff_m' is just scratch of
+	neighbourhood update, so no difference matrix is copied per step
+	
+	All floating-point arrays (weights, activation vectors, preallocations,
+	predictor) have the same dtype given by 'dtype' argument of constructor
+	('common.FLOAT_DTYPE' by default), so no promotion happens in SOM's
+	computations as long as inputs have this dtype too
 	
 	Generative extension has been implemented using GMM in a following way:
 	 1. SOM treated like a mixture of gaussians, where N = lattice width * lattice height
@@ -46,19 +57,28 @@ class _Template_SOM:
 		# SOM's lattice shape (width and height)
 		self.lattice_shape = lattice_shape
 		
+		# dtype of all floating-point arrays
+		self.dtype = dtype(FLOAT_DTYPE)
+		if ("dtype" in kwargs):
+			self.dtype = dtype(kwargs["dtype"])
+		
 		# SOM's neurons (weights) organized in 2d numpy array
 		self.neurons = empty((lattice_shape[0]*lattice_shape[1], input_dim), 
-								dtype = FLOAT_DTYPE)
+								dtype = self.dtype)
 		self.neurons[:] = random.uniform(0, 1, self.neurons.shape)
 		
 		# enable RSOM extension if requested
 		# 'decay' is normal public parameter which could be tuned if needed
 		if ("rsom_ext" in kwargs.keys()) and (kwargs["rsom_ext"]):
+			self._rsom_ext = True
+			
 			self.decay = 0.7
 			self.__calc_diff_m = self.__calc_diff_m_rsom
 			
-			self.__last_diff_m = zeros(self.neurons.shape)
+			self.__last_diff_m = zeros(self.neurons.shape, dtype = self.dtype)
 		else:
+			self._rsom_ext = False
+			
 			self.__calc_diff_m = self.__calc_diff_m_regular
 		
 		# Model approximation characteristic, i.e. how close was
@@ -70,55 +90,127 @@ class _Template_SOM:
 		#
 		# NOTE: this is preallocation, actually. But it is used outside, so
 		#		it is not private 
-		self.act_vec = zeros(self.neurons.shape[0])
+		self.act_vec = zeros(self.neurons.shape[0], dtype = self.dtype)
 		
 		# Likelihood function which is used to calculate activation vector
+		# in-place: f(squared distances, out) (and its name in case of 
+		# builtin one, None for custom function)
 		self._likelihood_func = None
+		self._likelihood_name = None
 		
 		builtin_llf = {
-					"gaussian": lambda d: exp(-d / 2.0),
-					"uniform": lambda d: 1.0 - d / max(d)
+					"gaussian": lambda d, out: exp(divide(d, -2.0, out = out), out = out),
+					"uniform": lambda d, out: subtract(1.0, divide(d, d.max(), out = out), out = out)
 		}
 		
 		if ("likelihood_func" in kwargs):
 			if ((kwargs["likelihood_func"].__class__ == str) and
 				(kwargs["likelihood_func"] in builtin_llf)):
 					self._likelihood_func = builtin_llf[kwargs["likelihood_func"]]
+					self._likelihood_name = kwargs["likelihood_func"]
 			else:
-				self._likelihood_func = lambda s, d: kwargs["likelihood_func"](d)
+				self._likelihood_func = lambda d, out: copyto(out, kwargs["likelihood_func"](d))
 				
 		# -- uniform likelihood by default
 		if (self._likelihood_func == None):
 			self._likelihood_func = builtin_llf["uniform"]
+			self._likelihood_name = "uniform"
 			
 		# Default to dummy predictor's (markov chain) 
 		# state transition probabilities update function
 		self.__update_state_trans_probs = lambda bmu: None
+		
+		# Predictor of the next activation vector (see 'init_predictor')
+		self._predictor = None
 				
 		
-		# Associated generative model (instance of GMM)
+		# Associated generative model ('Mixture_Sampler' instance for GMM)
 		self.gen_model = None
 		
 		# Whether covariance is full or not 
 		# (see 'init_generative_model' for more details)
 		self.gmm_full_cov = True
 		
+		# Whether covariances are refreshed only for neurons altered by the
+		# last update (see 'init_generative_gmm')
+		self.gmm_window_only = False
+		
+		# Tolerance of neurons' displacement by update below which their
+		# covariances are not refreshed and period (in updates) of full
+		# refresh (see 'init_generative_gmm')
+		self.gmm_move_tolerance = None
+		self.gmm_full_refresh_period = None
+		
 		# how to reduce vector from neighbours to neuron's weight in covariance calculation
 		#
 		# NOTE: arbitary value for now!
 		self.covar_diff_scale = 0.3
 		
+		# Neighbourhood cutoff tolerance: if set, neurons which gaussian
+		# neighbourhood weight is below it are left unaltered, i.e. update
+		# is restricted to lattice window around BMU (see '_nh_update')
+		#
+		# NOTE: disabled (None) by default, 1e-3 seems to be reasonable
+		self.nh_tolerance = None
+		if ("nh_tolerance" in kwargs):
+			self.nh_tolerance = kwargs["nh_tolerance"]
+		
 		# define some private helper variables
 		# (mostly - preallocations of arrays for speed optimization)
 		
 		# -- difference between input and weight vectors of every neuron
-		self.__diff_m = zeros(self.neurons.shape)
+		self.__diff_m = zeros(self.neurons.shape, dtype = self.dtype)
+		
+		# -- squared euclidean distances from input to every neuron
+		# -- (filled by BMU engine, see '_calc_sq_dists')
+		self.__sq_dists = zeros(self.neurons.shape[0], dtype = self.__diff_m.dtype)
+		
+		# -- normalized input and BMU's weight vectors (see 'find_bmu')
+		self.__input_unit_vec = zeros(self.neurons.shape[1], dtype = self.dtype)
+		self.__wv_unit_vec = zeros(self.neurons.shape[1], dtype = self.dtype)
 		
 		# -- precalculated neurons' coordinates (i, j) in lattice
 		self._neurons_coords = zeros((self.neurons.shape[0], 2), dtype = uint32)
 		self._neurons_coords[:, 0] = mod(arange(0, self.neurons.shape[0]), lattice_shape[0])
 		self._neurons_coords[:, 1] = floor(arange(0, self.neurons.shape[0]) / lattice_shape[0])
 		
+		# -- squared lattice distances from every BMU to every neuron:
+		# --- whole N x N table is precomputed for moderate lattices
+		# --- for huge lattices rows are calculated lazily (per BMU) and
+		# --- kept in LRU cache of bounded size
+		#
+		# NOTE: both limits could be overriden by constructor's kwargs
+		#		'lattice_dists_max_full' and 'lattice_dists_cache_size'
+		lattice_dists_max_full = 1024
+		if ("lattice_dists_max_full" in kwargs):
+			lattice_dists_max_full = kwargs["lattice_dists_max_full"]
+		
+		self._lattice_dists_cache_size = 256
+		if ("lattice_dists_cache_size" in kwargs):
+			self._lattice_dists_cache_size = kwargs["lattice_dists_cache_size"]
+		
+		self.__lattice_sq_dists_lru = OrderedDict()
+		
+		if (self.neurons.shape[0] <= lattice_dists_max_full):
+			self._lattice_sq_dists = self.__calc_lattice_sq_dists(
+											arange(0, self.neurons.shape[0]))
+		else:
+			self._lattice_sq_dists = None
+		
+		# -- neighbourhood vector preallocation (see '_gauss_nh')
+		self.__nh_vec = zeros((self.neurons.shape[0], 1), dtype = self.dtype)
+		
+		# -- lattice window of the last neighbourhood update
+		# -- (None means the whole lattice, see '_nh_update')
+		self._last_nh_window = None
+		
+		# -- squared displacements of neurons by the last neighbourhood
+		# -- update and indicies of neurons displaced by more than 
+		# -- 'gmm_move_tolerance' (tracked only if it is set, None means 
+		# -- all neurons)
+		self._moves = None
+		self._last_moved_inds = None
+		
 		# -- gen_model's covariances update function
 		# -- default is to dummy function, as long as we have no
 		# -- generative model by default
@@ -129,35 +221,103 @@ class _Template_SOM:
 		# -- are drawn from discrete distribution are returned
 		self.generate = self.__generate_dpd
 		
+		# -- sampler of neurons' indicies (see 'samplers' module): inverse
+		# -- CDF by default, alias table ('sampler = "alias"') pays off when
+		# -- the same activation vector is sampled repeatedly
+		samplers = {"cdf": CDF_Sampler, "alias": Alias_Sampler}
+		
+		sampler_name = "cdf"
+		if ("sampler" in kwargs):
+			sampler_name = kwargs["sampler"]
+		
+		self._sampler = samplers[sampler_name](self.neurons.shape[0], self.dtype)
+		
+		# -- random numbers generator used by "roulette" (and its noise):
+		# -- global numpy.random by default, could be replaced by dedicated 
+		# -- stream (RandomState instance), see 'set_rng'
+		self._rng = random
+		
 		# -- Noise function for "roulette"
 		if ("noise" in kwargs):
 			self._noise_func = kwargs["noise"]
 			self._noise_func.shape = self.neurons.shape[1]
+			self._noise_func.dtype = self.dtype
 			
 			# brings anything constructive only for GaussianNoise
 			#self._noise_func.shape = self.neurons.shape[1]
 		else:
 			self._noise_func = lambda: 0.0 # no noise by default
 			
-		# Attributes to store in .MAT file
-		self._stored_attr_names = [
-								"lattice_shape", "last_model_bias", # "decay"
-								"_Template_SOM__last_bmu_ind"
-		]
-		self._excluded_attr_names = [
-									"_Template_SOM__diff_m",
-									"_Template_SOM__last_diff_m",
-									"_neurons_coords"
+		# State schema: (name, attribute, dtype, shape) of fields stored in
+		# dumps and checkpoints (see 'state' module)
+		self._state_fields = [
+					("lattice_shape", "lattice_shape", intp, (2,)),
+					("neurons", "neurons", self.neurons.dtype, self.neurons.shape),
+					("act_vec", "act_vec", self.act_vec.dtype, self.act_vec.shape),
+					("last_model_bias", "last_model_bias", float64, ())
 		]
+		
+		if (self._rsom_ext):
+			self._state_fields.append(
+					("last_diff_m", "_Template_SOM__last_diff_m",
+						self.__last_diff_m.dtype, self.__last_diff_m.shape)
+			)
+		
+		if (hasattr(self._noise_func, "magn")):
+			self._state_fields.append(("noise_magn", "_noise_func.magn", float64, ()))
 			
 	
-	def init_generative_gmm(self, gmm_cov_type = 'full'):
+	def set_rng(self, rng):
+		"""
+		Sets random numbers generator (numpy.random or RandomState instance)
+		used in sampling ('generate'), noise is given dedicated generator
+		seeded from it (so noise's blocks of samples, see 'noise._Base_Noise',
+		don't shift sampling)
+		"""
+		
+		self._rng = rng
+		
+		if (hasattr(self._noise_func, "set_rng")):
+			self._noise_func.set_rng(random.RandomState(rng.randint(0, 2**31 - 1)))
+		elif (hasattr(self._noise_func, "rng")):
+			self._noise_func.rng = rng
+	
+	def _rebind_views(self):
+		"""
+		Re-points views of neurons kept by generative extension (GMM's 
+		means and flat weight vectors' components) to 'self.neurons', 
+		it must be called whenever neurons are rebound to another array 
+		(e.g. shared or memory-mapped one, see 'sharding' and 'state')
+		"""
+		
+		if (self.gen_model is None): return
+		
+		self.gen_model.means_ = self.neurons[:]
+		
+		self._neurons_wv_comps_flat = self.neurons.reshape(
+						(self.neurons.shape[0]*self.neurons.shape[1], 1))
+	
+	def init_generative_gmm(self, gmm_cov_type = 'full', window_only = False,
+								move_tolerance = None, full_refresh_period = 100):
 		"""
 		Initialize SOM's generative extension (GMM, currently)
 		
 		'gmm_cov_type' could be equal to:
 		1. 'tied' (average covariance for each mixture component)
 		2. 'full' (distinct covariance for each mixture component)
+		
+		'window_only = True' makes covariances (of 'full' type) and
+		covariance data (of both types) to be refreshed only for neurons
+		inside lattice window of the last neighbourhood update grown by
+		one neuron (covariance depends on adjacent neurons), so it makes 
+		sense along with 'nh_tolerance' (see '_nh_update') only; 
+		covariances stay exact, as neurons outside the window are unaltered
+		
+		'move_tolerance' makes them to be refreshed only for neurons 
+		displaced by the last update by more than it (euclidean distance)
+		and their adjacent neurons, so cost scales with active neighbourhood
+		even without 'nh_tolerance'; covariances of others drift slightly,
+		so all of them are refreshed every 'full_refresh_period' updates
 		"""
 		
 		# GMM could treat SOM as completely distinct gaussians ('full' covariance)
@@ -166,38 +326,54 @@ class _Template_SOM:
 		
 		if (gmm_cov_type != 'full'): self.gmm_full_cov = False
 		
-		# initialize generative model as GMM
-		self.gen_model = GMM(n_components = self.neurons.shape[0],
-							 covariance_type = gmm_cov_type)
+		self.gmm_window_only = window_only
+		
+		self.gmm_move_tolerance = move_tolerance
+		self.gmm_full_refresh_period = full_refresh_period
 		
-		self.gen_model.means_ = self.neurons[:] # make a view
+		# -- updates since initialization (for periodic full refresh)
+		self._covars_updates_num = 0
 		
+		if (move_tolerance is not None):
+			self._moves = zeros(self.neurons.shape[0], dtype = self.dtype)
+		
+		# initialize generative model as GMM (means are a view of neurons)
 		if (self.gmm_full_cov):
-			self.gen_model.covars_ = zeros(
+			covars = zeros(
 						(
-							self.gen_model.n_components, 
+							self.neurons.shape[0], 
 							self.neurons.shape[1], self.neurons.shape[1]
 						), 
-						dtype = FLOAT_DTYPE
+						dtype = self.dtype
 			)
 			
+			# -- products of adjacent neurons' data and covariances of
+			# -- neurons refreshed by update (see '__update_covars_full')
+			self._covars_products = zeros((2,) + covars.shape, dtype = self.dtype)
+			
 			self.__update_covars = self.__update_covars_full
 		else:
-			self.gen_model.covars_ = zeros(
+			covars = zeros(
 						(self.neurons.shape[1], self.neurons.shape[1]), 
-						dtype = FLOAT_DTYPE
+						dtype = self.dtype
 			)
-			self._temp_neuron_cov = zeros(
-						self.gen_model.covars_.shape, 
-						dtype = FLOAT_DTYPE
+			
+			# -- covariance data of all neurons arranged as one matrix
+			# -- (weight vector component x (neuron, adjacent neuron)),
+			# -- so mean covariance is just one matrix product
+			self._covar_calc_data_t = zeros(
+						(self.neurons.shape[1], self.neurons.shape[0], 4), 
+						dtype = self.dtype
 			)
 			
 			self.__update_covars = self.__update_covars_tied
 		
+		self.gen_model = Mixture_Sampler(self.neurons[:], covars, gmm_cov_type)
+		
 		# -- data samples (neighbour neurons - mean neuron) organized for vectorized
 		# -- covariance calculation
 		self._covar_calc_data = zeros((self.neurons.shape[0]*self.neurons.shape[1], 4), 
-									dtype = FLOAT_DTYPE)
+									dtype = self.dtype)
 		
 		# -- per neuron views to _covar_calc_data
 		self._covar_calc_data_views = empty((self.neurons.shape[0],), dtype="object")
@@ -210,7 +386,7 @@ class _Template_SOM:
 		
 		# -- normalization matrix against adjacent neurons num for each neuron
 		# -- (duplicated for each weight vector compononent)
-		self._neurons_adj_num_norm = zeros((self._covar_calc_data.shape[0], 1), dtype = FLOAT_DTYPE)
+		self._neurons_adj_num_norm = zeros((self._covar_calc_data.shape[0], 1), dtype = self.dtype)
 		
 		# -- indicies of adjacent neurons and its weight vectors' components
 		self._adj_neurons_inds = zeros(self._covar_calc_data.shape, dtype = uint32)
@@ -264,6 +440,17 @@ class _Template_SOM:
 		self._neurons_wv_comps_flat = self.neurons.reshape(
 						(self.neurons.shape[0]*self.neurons.shape[1], 1))
 		
+		# -- indicies of adjacent neurons of every neuron and normalization
+		# -- against their number (see '__calc_covar_data')
+		self._adj_neurons = self._adj_neurons_inds[::self.neurons.shape[1]].astype(intp)
+		self._adj_neurons_norm = self._neurons_adj_num_norm[::self.neurons.shape[1], 0]
+		
+		# -- covariances of all neurons (only altered ones are refreshed
+		# -- by updates if 'window_only' or 'move_tolerance' is set)
+		self._last_nh_window = None
+		self._last_moved_inds = None
+		self.__update_covars()
+		
 		# -- GMM as generative method
 		self.generate = self.__generate_gmm
 		
@@ -278,52 +465,112 @@ class _Template_SOM:
 		- each neuron is treated as a state of a markov chain
 		- current active state corresponds to current BMU
 		- transition event from previous (t-1) BMU [i] to current (t) BMU [j] is 
-			recorded in frequencies matrix in [i, j]
-		- frequencies matrix is then row-normalized in order to retrieve
-			markov chain's state-transition matrix
+			recorded as sparse transition count [i, j] along with running
+			total of transitions from [i]
+		- state-transition probability is then count / total, so
+			no dense frequencies or state-transition matrices are kept
+			(see 'predictors.Sparse_FOMM')
 			
 		NOTE: Withour prior call to this function 'predict_next_act_vec'
 				won't work 
 		"""
 		
-		# -- frequencies of transitions from one state to another
-		self.__mm_freqs = zeros((self.neurons.shape[0], self.neurons.shape[0]))
-		
-		# -- state transition matrix
-		self.__mm_trans_probs = eye(self.neurons.shape[0])
+		# -- markov chain with sparse state transitions
+		self._predictor = Sparse_FOMM(self.neurons.shape[0], dtype = self.dtype)
 		
 		# -- previous BMU
 		self.__last_bmu_ind = None
 		
 		# -- predicted activation vector pre-cache
-		self.predicted_act_vec = zeros(self.act_vec.shape)
+		self.predicted_act_vec = zeros(self.act_vec.shape, dtype = self.dtype)
 		
 		# -- state-transition matrix update
 		self.__update_state_trans_probs = self.__update_state_trans_probs_fomm
 		
+		# -- predictor's state (transitions are in '_state_extras')
+		self._state_fields.extend([
+					("predicted_act_vec", "predicted_act_vec",
+						self.predicted_act_vec.dtype, self.predicted_act_vec.shape),
+					("last_bmu_ind", "_Template_SOM__last_bmu_ind", intp, ())
+		])
+		
 	def _to_matlab_mat(self):
 		"""
-		returns dictionary with all essential properties:
-		1. Numpy arrays for now
+		returns dictionary with all essential properties
+		(fields of state schema, see 'self._state_fields')
 		"""
 		
-		res_d = dict()
+		# NOTE: RSOM's difference memory (as large as neurons) is not
+		#		stored in .MAT-file, checkpoints keep it
+		res_d = dict([
+				(name, getattr(owner, attr_name))
+				for (name, owner, attr_name, f_dtype, f_shape) in state_fields(self)
+					if (name != "last_diff_m")
+		])
 		
-		for attr_name in dir(self):
-			if (attr_name in self._excluded_attr_names): continue
-			
-			attr = getattr(self, attr_name)
-			
-			if (((hasattr(attr, "__class__")) and (attr.__class__ == ndarray)) or
-				(attr_name in self._stored_attr_names)):
-				
-				res_d[attr_name.lstrip("_")] = attr
-				
-		if ((self._noise_func.__class__ == UniformNoise) or
-			(self._noise_func.__class__ == GaussianNoise)):
-			res_d["noise_magn"] = self._noise_func.magn
+		if (self._predictor is not None):
+			res_d["predictor"] = self._predictor._to_matlab_mat()
 		
 		return res_d
+	
+	def _state_extras(self, prefix = ""):
+		"""
+		returns (name, value) pairs of variable-sized state, i.e. not 
+		described by schema (predictor's transitions)
+		"""
+		
+		if (self._predictor is None): return []
+		
+		return [
+			(prefix + "predictor/" + name, value)
+			for (name, value) in sorted(self._predictor._to_matlab_mat().items())
+		]
+		
+	def _reserve_state_extras(self, prefix = "", capacities = None):
+		"""
+		prepares variable-sized state (predictor's storage) for being mapped
+		(see 'state.State_File'): it is grown to twice as many transitions
+		as already observed (if it is less than that) or set to capacity 
+		of field "trans_from" in 'capacities' (name -> shape, i.e. layout 
+		of restored state file, see 'state.state_file_layout')
+		"""
+		
+		if (self._predictor is None): return
+		
+		predictor = self._predictor
+		
+		if (capacities is None):
+			predictor.reserve(2 * predictor.trans_num)
+		else:
+			predictor.reserve(capacities[prefix + "predictor/trans_from"][0], True)
+		
+	def _reserved_state_fields(self, prefix = ""):
+		"""
+		returns resolved fields (see 'state.state_fields') of variable-sized
+		state at its reserved size, i.e. current capacity of predictor's 
+		storage (used by memory-mapped state, see 'state.State_File')
+		"""
+		
+		if (self._predictor is None): return []
+		
+		predictor = self._predictor
+		
+		prefix += "predictor/"
+		
+		return [
+			(prefix + "trans_num", predictor, "trans_num", intp, ())
+		] + [
+			(prefix + name, predictor, attr_name, 
+				getattr(predictor, attr_name).dtype, 
+				getattr(predictor, attr_name).shape)
+			for (name, attr_name) in [
+					("trans_from", "_trans_from"),
+					("trans_to", "_trans_to"),
+					("trans_counts", "_trans_counts"),
+					("row_totals", "_row_totals"),
+					("absorbing", "_absorbing")
+			]
+		]
 		
 	def __calc_diff_m_regular(self, input_vec):
 		"""
@@ -331,56 +578,142 @@ class _Template_SOM:
 		and neuron's weights
 		"""
 		
-		self.__diff_m[:] = input_vec - self.neurons
+		subtract(input_vec, self.neurons, out = self.__diff_m)
+		
+		return self.__diff_m
 		
 	def __calc_diff_m_rsom(self, input_vec):
 		"""
 		RSOM extension to SOM: difference between input vector and neuron's
 		weights is adjusted by previous such difference and both distributed using
 		decay factor 'self.decay' which is controlling "memory" deepness
+		
+		Integration is done in-place in '__last_diff_m', which is returned
+		('__diff_m' is used as scratch), update doesn't alter it (see 
+		'_nh_update'), so it is kept for the next step without copying
 		"""
 		
-		self.__diff_m[:] = (1 - self.decay) * self.__last_diff_m + \
-					self.decay * (input_vec - self.neurons)
-					
-		# store __diff_m as it could be modified
-		# (in 'update_neurons' for in-place optimization purposes, for instance)			
-		self.__last_diff_m[:] = self.__diff_m # copy\
+		diff_m = self.__last_diff_m
+		
+		subtract(input_vec, self.neurons, out = self.__diff_m)
+		self.__diff_m *= self.decay
+		
+		diff_m *= 1 - self.decay
+		diff_m += self.__diff_m
+		
+		return diff_m
 		
 	def __update_state_trans_probs_fomm(self, bmu_ind):
 		"""
-		Updates frequencies and state transition matrix of first-order markov
-		model (markov chain) used as predictor
+		Records transition from previous BMU to the current one in
+		first-order markov model (markov chain) used as predictor
+		"""
+		
+		if (self.__last_bmu_ind is not None):
+			self._predictor.add_transition(self.__last_bmu_ind, bmu_ind)
+			
+		self.__last_bmu_ind = bmu_ind
 		
-		TODO: find a way to optimize this crap and get rid of frequencies matrix!
+	def __covars_neurons_inds(self):
+		"""
+		returns indicies of neurons which covariances are to be refreshed
+		(see 'init_generative_gmm'), None means all neurons:
+		1. neurons displaced by more than 'gmm_move_tolerance' by the last
+			update and their adjacent neurons (except every 
+			'gmm_full_refresh_period' update)
+		2. neurons inside window of the last neighbourhood update grown 
+			by one neuron
 		"""
 		
-		if (self.__last_bmu_ind != None):
-			self.__mm_freqs[self.__last_bmu_ind, bmu_ind] += 1
+		if (self.gmm_move_tolerance is not None):
+			self._covars_updates_num += 1
 			
-			self.__mm_trans_probs[self.__last_bmu_ind, :] = \
-				self.__mm_freqs[self.__last_bmu_ind, :] / \
-				sum(self.__mm_freqs[self.__last_bmu_ind, :]) 
+			if ((self._last_moved_inds is None) or 
+				(self._covars_updates_num % self.gmm_full_refresh_period == 0)):
+				return None
 			
+			return unique(concatenate((
+						self._last_moved_inds, 
+						self._adj_neurons[self._last_moved_inds].reshape(-1)
+			)))
+		
+		if ((not self.gmm_window_only) or (self._last_nh_window is None)):
+			return None
+		
+		((y_from, y_to), (x_from, x_to)) = self._last_nh_window
+		
+		if (y_from > 0): y_from -= 1
+		if (y_to < self.lattice_shape[1]): y_to += 1
+		if (x_from > 0): x_from -= 1
+		if (x_to < self.lattice_shape[0]): x_to += 1
+		
+		return (arange(y_from, y_to)[:, None] * self.lattice_shape[0] + \
+					arange(x_from, x_to)).reshape(-1)
+	
+	def __calc_covar_data(self, neurons_inds):
+		"""
+		calculates covariance data (scaled differences between adjacent 
+		neurons' weight vectors and neuron's one) of given neurons 
+		(of all of them if 'neurons_inds' is None)
+		"""
+		
+		if (neurons_inds is None):
+			self._covar_calc_data[:] = self.neurons[self._adj_neurons_inds, self._adj_wv_comps_inds]
+			self._covar_calc_data -= self._neurons_wv_comps_flat
+			self._covar_calc_data *= self._neurons_adj_num_norm * self.covar_diff_scale
 			
-		self.__last_bmu_ind = bmu_ind
+			return
+		
+		# -- neuron x weight vector component x adjacent neuron
+		data = self.neurons[self._adj_neurons[neurons_inds]].transpose(0, 2, 1)
+		data -= self.neurons[neurons_inds][:, :, None]
+		data *= (self._adj_neurons_norm[neurons_inds] * self.covar_diff_scale)[:, None, None]
 		
+		self._covar_calc_data.reshape(
+					(self.neurons.shape[0], self.neurons.shape[1], 4))[neurons_inds] = data
+	
 	def __update_covars_full(self):
 		"""
 		updates corresponding covariances in generative model
 		assuming distinct covariances for each mixture component (neuron)
 		"""
 		
-		self._covar_calc_data[:] = self.neurons[self._adj_neurons_inds, self._adj_wv_comps_inds]
-		self._covar_calc_data -= self._neurons_wv_comps_flat
-		self._covar_calc_data *= self._neurons_adj_num_norm * self.covar_diff_scale
+		neurons_inds = self.__covars_neurons_inds()
 		
-		# NOTE: this is seems to be faster (and memory tolerant)
-		# than the dot product of '_covar_calc_data' to '_covar_calc_data.T'
-		for i in xrange(self.neurons.shape[0]):
-			dot(self._covar_calc_data_views[i], 
-					self._covar_calc_data_views[i].T, 
-					self.gen_model.covars_[i])
+		if ((neurons_inds is not None) and (neurons_inds.shape[0] == 0)): return
+		
+		self.__calc_covar_data(neurons_inds)
+		
+		# (cached factors of sampler are recomputed lazily)
+		self.gen_model.covars_changed(neurons_inds)
+		
+		# -- neuron x weight vector component x adjacent neuron
+		data = self._covar_calc_data.reshape(
+					(self.neurons.shape[0], self.neurons.shape[1], 4))
+		
+		covars = self.gen_model.covars_
+		products = self._covars_products
+		
+		if (neurons_inds is not None):
+			data = data[neurons_inds]
+			covars = products[1, :data.shape[0]]
+		
+		products = products[0, :data.shape[0]]
+		
+		# Products of all neurons' data at once, as sums of outer products 
+		# of their adjacent neurons' columns
+		# NOTE: the same as 'einsum("nda,nea->nde", data, data)', but 
+		# einsum (and batched 'matmul') doesn't use BLAS and iterates over
+		# 4 adjacent neurons innermost, so they are much slower (and 
+		# slower than 'dot' per neuron too)
+		multiply(data[:, :, None, 0], data[:, None, :, 0], out = covars)
+		
+		for i in xrange(1, data.shape[2]):
+			multiply(data[:, :, None, i], data[:, None, :, i], out = products)
+			covars += products
+		
+		if (neurons_inds is not None):
+			self.gen_model.covars_[neurons_inds] = covars
 			
 	def __update_covars_tied(self):
 		"""
@@ -388,36 +721,52 @@ class _Template_SOM:
 		assuming one average covariance for every mixture component (neuron)
 		"""
 		
-		self._covar_calc_data[:] = self.neurons[self._adj_neurons_inds, self._adj_wv_comps_inds]
-		self._covar_calc_data -= self._neurons_wv_comps_flat
-		self._covar_calc_data *= self._neurons_adj_num_norm * self.covar_diff_scale
+		neurons_inds = self.__covars_neurons_inds()
 		
-		# Simple mean average covariance matrix
-		for i in xrange(self.neurons.shape[0]):
-			dot(self._covar_calc_data_views[i], 
-					self._covar_calc_data_views[i].T, 
-					self._temp_neuron_cov)
-			
-			self.gen_model.covars_ += self._temp_neuron_cov
-			
+		if ((neurons_inds is not None) and (neurons_inds.shape[0] == 0)): return
+		
+		self.__calc_covar_data(neurons_inds)
+		
+		# Simple mean average covariance matrix:
+		# sum of all neurons' products is one product of data of all neurons
+		self._covar_calc_data_t[:] = self._covar_calc_data.reshape(
+					(self.neurons.shape[0], self.neurons.shape[1], 4)).transpose(1, 0, 2)
+		
+		data_t = self._covar_calc_data_t.reshape((self.neurons.shape[1], -1))
+		
+		dot(data_t, data_t.T, self.gen_model.covars_)
 		self.gen_model.covars_ /= self.neurons.shape[0]
+		
+		self.gen_model.covars_changed()
+	
 	
+	def _calc_sq_dists(self, diff_m):
+		"""
+		BMU engine: squared euclidean distance from input to every neuron
+		
+		Distances are computed row-wise (i.e. O(N*D) instead of diagonal
+		of N x N matrix) into preallocated buffer, which is returned
+		
+		NOTE: returned buffer is overwritten by the next call
+		"""
+		
+		einsum("ij,ij->i", diff_m, diff_m, out = self.__sq_dists)
+		
+		return self.__sq_dists
 	
 	def find_bmu(self, input_vec, diff_m = None, calc_act_vec = False):
 		""" returns BMU position [i] in lattice and its weight vector """
 		
-		if (diff_m == None):
-			self.__calc_diff_m(input_vec) 
-			diff_m = self.__diff_m[:]
+		if (diff_m is None):
+			diff_m = self.__calc_diff_m(input_vec) 
 			
 		# find BMU (using squared euclidian distance) 
 		# and calculate activation vector (if needed)
-		# TODO: precache 'norms' array
-		norms = diag(dot(diff_m, diff_m.T))
+		norms = self._calc_sq_dists(diff_m)
 		bmu_ind = argmin(norms)
 		
 		if (calc_act_vec):
-			self.act_vec[:] = self._likelihood_func(norms)
+			self._likelihood_func(norms, self.act_vec)
 		
 		
 		# %%%%%%%%% VARIATED %%%%%%%%%%%%%%%%%
@@ -428,36 +777,177 @@ class _Template_SOM:
 		# TODO #2: Unify with 'model_error' in update_neurons in case of PL_SOM ???
 		#
 		
-		input_norm = linalg.norm(input_vec)
+		# (the same as 'linalg.norm', but into preallocated vectors)
+		input_norm = sqrt(dot(input_vec, input_vec))
 		if (input_norm == 0.0): input_norm = EPS
 		
-		wv_norm = linalg.norm(self.neurons[bmu_ind])
+		wv = self.neurons[bmu_ind]
+		
+		wv_norm = sqrt(dot(wv, wv))
 		if (wv_norm == 0.0): wv_norm = EPS 
 		
-		self.last_model_bias = linalg.norm(
-			input_vec / input_norm - 
-			self.neurons[bmu_ind] / wv_norm
-		)
+		divide(input_vec, input_norm, out = self.__input_unit_vec)
+		divide(wv, wv_norm, out = self.__wv_unit_vec)
+		self.__input_unit_vec -= self.__wv_unit_vec
+		
+		self.last_model_bias = sqrt(dot(self.__input_unit_vec, self.__input_unit_vec))
 		
 		# %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
 		
-		return (bmu_ind, self.neurons[bmu_ind])
+		return (bmu_ind, wv)
+	
+	def __calc_lattice_sq_dists(self, bmu_inds):
+		"""
+		returns squared lattice distances from each of given BMUs
+		to every neuron (one row per BMU)
+		"""
+		
+		coords = self._neurons_coords.astype(self.dtype)
+		
+		dx = coords[bmu_inds, 0][:, None] - coords[:, 0]
+		dy = coords[bmu_inds, 1][:, None] - coords[:, 1]
+		
+		return dx * dx + dy * dy
+	
+	def _lattice_sq_dists_rows(self, bmu_inds):
+		"""
+		returns squared lattice distances from each of given BMUs
+		to every neuron (one row per BMU), bypassing LRU cache
+		"""
+		
+		if (self._lattice_sq_dists is not None):
+			return self._lattice_sq_dists[bmu_inds]
+		
+		return self.__calc_lattice_sq_dists(bmu_inds)
+	
+	def _lattice_sq_dists_row(self, bmu_ind):
+		"""
+		returns squared lattice distances from given BMU to every neuron
+		either from precomputed table or from LRU cache
+		"""
+		
+		if (self._lattice_sq_dists is not None):
+			return self._lattice_sq_dists[bmu_ind]
+		
+		row = self.__lattice_sq_dists_lru.pop(bmu_ind, None)
+		
+		if (row is None):
+			row = self.__calc_lattice_sq_dists([bmu_ind])[0]
+			
+			if (len(self.__lattice_sq_dists_lru) >= self._lattice_dists_cache_size):
+				self.__lattice_sq_dists_lru.popitem(last = False)
+		
+		# (re)insert as the most recently used
+		self.__lattice_sq_dists_lru[bmu_ind] = row
+		
+		return row
 	
 	def _gauss_nh(self, bmu_ind, denom):
 		"""
 		Standard gaussian neighbourhood which depends on
 		1. current BMU index
 		2. squared shape parameter: 'denom'
+		
+		Returns column vector (N x 1) which is overwritten by the next call
 		"""
 		
-		# TODO: pre-cache both arrays: 'ind_diff' and that under return statement
+		divide(self._lattice_sq_dists_row(bmu_ind), -denom, 
+				out = self.__nh_vec[:, 0])
+		exp(self.__nh_vec, out = self.__nh_vec)
+		
+		return self.__nh_vec
 	
-		ind_diff = array([bmu_ind % self.lattice_shape[0],
-						  floor(bmu_ind / self.lattice_shape[0])]) - \
-					self._neurons_coords
+	def _nh_window(self, bmu_ind, denom):
+		"""
+		returns lattice window ((y_from, y_to), (x_from, x_to)) around BMU
+		outside of which gaussian neighbourhood (squared shape parameter 'denom')
+		is below 'nh_tolerance'
 		
-		return diag(exp(-dot(ind_diff, ind_diff.T) / 
-					(denom)))[:, None]
+		returns None if window covers the whole lattice (or cutoff is disabled)
+		"""
+		
+		if (self.nh_tolerance is None): return None
+		
+		# exp(-r^2 / denom) = tolerance
+		radius = int(ceil(sqrt(-denom * log(self.nh_tolerance))))
+		
+		b_x = int(self._neurons_coords[bmu_ind, 0])
+		b_y = int(self._neurons_coords[bmu_ind, 1])
+		
+		x_from = b_x - radius
+		if (x_from < 0): x_from = 0
+		x_to = b_x + radius + 1
+		if (x_to > self.lattice_shape[0]): x_to = self.lattice_shape[0]
+		
+		y_from = b_y - radius
+		if (y_from < 0): y_from = 0
+		y_to = b_y + radius + 1
+		if (y_to > self.lattice_shape[1]): y_to = self.lattice_shape[1]
+		
+		if ((x_to - x_from == self.lattice_shape[0]) and
+			(y_to - y_from == self.lattice_shape[1])):
+			return None
+		
+		return ((y_from, y_to), (x_from, x_to))
+	
+	def _nh_update(self, bmu_ind, denom, diff_m, scale = 1.0):
+		"""
+		Applies neighbourhood-weighted update to neurons:
+			neurons += scale * gaussian_nh(bmu_ind, denom) * diff_m
+			
+		Update is restricted to lattice window around BMU if 'nh_tolerance'
+		is set, so its cost scales with neighbourhood area
+		
+		Squared displacements of neurons are stored in '_moves' if they are
+		tracked (see 'init_generative_gmm')
+		
+		NOTE: weighted differences are stored in '__diff_m' (within the 
+				window only, if any), i.e. 'diff_m' is altered in-place only
+				if it is '__diff_m' itself (it is not for RSOM)
+		"""
+		
+		window = self._nh_window(bmu_ind, denom)
+		self._last_nh_window = window
+		
+		if (window is None):
+			nh_diff_m = self.__diff_m
+			
+			multiply(diff_m, self._gauss_nh(bmu_ind, denom), out = nh_diff_m)
+			if (scale != 1.0): nh_diff_m *= scale
+			
+			self.neurons += nh_diff_m
+			
+			if (self._moves is not None):
+				einsum("ij,ij->i", nh_diff_m, nh_diff_m, out = self._moves)
+				self._last_moved_inds = nonzero(
+							self._moves > self.gmm_move_tolerance**2)[0]
+			
+			return
+		
+		# -- lattice-shaped views: [y, x, weight vector component]
+		(ys, xs) = (slice(*window[0]), slice(*window[1]))
+		lattice_hw = (self.lattice_shape[1], self.lattice_shape[0])
+		
+		diff_w = diff_m.reshape(lattice_hw + (diff_m.shape[1],))[ys, xs]
+		nh_diff_w = self.__diff_m.reshape(lattice_hw + (diff_m.shape[1],))[ys, xs]
+		neurons_w = self.neurons.reshape(lattice_hw + (self.neurons.shape[1],))[ys, xs]
+		
+		nh_w = exp(self._lattice_sq_dists_row(bmu_ind).reshape(lattice_hw)[ys, xs] / \
+					-denom)
+		
+		multiply(diff_w, nh_w[:, :, None], out = nh_diff_w)
+		if (scale != 1.0): nh_diff_w *= scale
+		
+		neurons_w += nh_diff_w
+		
+		if (self._moves is not None):
+			moves_w = self._moves.reshape(lattice_hw)[ys, xs]
+			einsum("yxd,yxd->yx", nh_diff_w, nh_diff_w, out = moves_w)
+			
+			(moved_ys, moved_xs) = nonzero(moves_w > self.gmm_move_tolerance**2)
+			
+			self._last_moved_inds = (moved_ys + window[0][0]) * self.lattice_shape[0] + \
+										moved_xs + window[1][0]
 	
 	def _update_neurons_kernel(self, bmu_ind, diff_m):
 		raise NotImplementedError
@@ -474,14 +964,13 @@ class _Template_SOM:
 				'input_vec' is not needed for children update kernel
 		"""
 		
-		if (diff_m == None):
-			self.__calc_diff_m(input_vec) 
-			diff_m = self.__diff_m[:]
+		if (diff_m is None):
+			diff_m = self.__calc_diff_m(input_vec) 
 		
 		# -- update neuron's weights
 		# -- update procedure is specific to particular kind of SOM
 		# -- and is implemented in children classes
-		self._update_neurons_kernel(bmu_ind, diff_m[:])
+		self._update_neurons_kernel(bmu_ind, diff_m)
 		
 		# -- update corresponding covariances in generative model (if it exists!)
 		self.__update_covars()
@@ -496,16 +985,129 @@ class _Template_SOM:
 		returns BMU: index [i] and its weigth vector
 		"""
 		
-		self.__calc_diff_m(input_vec) 
+		diff_m = self.__calc_diff_m(input_vec) 
 		
 		# -- 'input' here is not actually used in find_bmu
-		bmu_and_wv = self.find_bmu(input_vec, self.__diff_m[:], True)
+		bmu_and_wv = self.find_bmu(input_vec, diff_m, True)
 		
 		# -- update neurons
-		self.update_neurons(bmu_and_wv[0], input_vec, self.__diff_m[:])
+		self.update_neurons(bmu_and_wv[0], input_vec, diff_m)
 		
 		return bmu_and_wv
 	
+	def feed_batch(self, X, batch_mode = False, epochs = 1, sigma = 1.0):
+		"""
+		Feeds sequence of input vectors (rows of T x D array 'X')
+		
+		1. Online mode (default): exactly the same sequential update as
+			calling 'feed' for every row of 'X', but with per-step overhead
+			stripped (activation vector and model bias are calculated only
+			for the last input)
+		2. Batch mode ('batch_mode = True'): batch SOM [Kohonen], i.e. BMUs
+			of all inputs are found by one matrix operation per epoch and
+			every neuron is set to neighbourhood-weighted mean of inputs;
+			'sigma' (scalar or one value per epoch) is gaussian neighbourhood
+			shape parameter, SOM-specific update kernel isn't used at all
+		
+		returns BMUs indicies (of the last epoch in case of batch mode)
+		
+		NOTE: batch mode makes no sense for RSOM
+		"""
+		
+		X = asarray(X, dtype = self.dtype)
+		
+		if (batch_mode):
+			return self.__feed_batch_offline(X, epochs, sigma)
+		
+		bmu_inds = zeros(X.shape[0], dtype = intp)
+		
+		# -- bind everything needed beforehand
+		calc_diff_m = self.__calc_diff_m
+		calc_sq_dists = self._calc_sq_dists
+		update_neurons_kernel = self._update_neurons_kernel
+		update_covars = self.__update_covars
+		update_state_trans_probs = self.__update_state_trans_probs
+		
+		for t in xrange(X.shape[0] - 1):
+			diff_m = calc_diff_m(X[t])
+			
+			bmu_ind = argmin(calc_sq_dists(diff_m))
+			
+			update_neurons_kernel(bmu_ind, diff_m)
+			update_covars()
+			update_state_trans_probs(bmu_ind)
+			
+			bmu_inds[t] = bmu_ind
+		
+		# -- the last one is fed regularly in order to leave SOM in
+		# -- consistent state (activation vector, model bias)
+		if (X.shape[0] > 0):
+			bmu_inds[-1] = self.feed(X[-1])[0]
+		
+		return bmu_inds
+	
+	def __feed_batch_offline(self, X, epochs, sigma, chunk_size = 4096):
+		"""
+		Batch SOM training, see 'feed_batch'
+		"""
+		
+		assert(not self._rsom_ext)
+		
+		if (isscalar(sigma)):
+			sigma = [sigma] * epochs
+		
+		bmu_inds = zeros(X.shape[0], dtype = intp)
+		x_sq = einsum("ij,ij->i", X, X)
+		
+		for epoch in xrange(epochs):
+			# -- all BMUs at once (chunked in order to bound memory):
+			# -- |x - w|^2 = |x|^2 - 2 * x.w + |w|^2
+			w_sq = einsum("ij,ij->i", self.neurons, self.neurons)
+			
+			for c in xrange(0, X.shape[0], chunk_size):
+				sq_dists = dot(X[c:c + chunk_size], self.neurons.T)
+				sq_dists *= -2.0
+				sq_dists += w_sq
+				sq_dists += x_sq[c:c + chunk_size, None]
+				
+				bmu_inds[c:c + chunk_size] = argmin(sq_dists, axis = 1)
+			
+			# -- inputs are accumulated per BMU, so neighbourhood is
+			# -- applied only once per distinct BMU
+			bmu_counts = bincount(bmu_inds, minlength = self.neurons.shape[0])
+			used_bmu_inds = nonzero(bmu_counts)[0]
+			
+			bmu_sums = empty((used_bmu_inds.shape[0], X.shape[1]))
+			for d in xrange(X.shape[1]):
+				bmu_sums[:, d] = bincount(
+									bmu_inds, weights = X[:, d],
+									minlength = self.neurons.shape[0]
+				)[used_bmu_inds]
+			
+			nh = exp(self._lattice_sq_dists_rows(used_bmu_inds) / \
+						-(sigma[epoch] * sigma[epoch]))
+			
+			nh_sums = dot(nh.T, bmu_sums)
+			nh_norms = dot(nh.T, bmu_counts[used_bmu_inds])
+			
+			# neurons far away from any BMU are kept unaltered
+			updated = nh_norms > EPS
+			self.neurons[updated] = nh_sums[updated] / nh_norms[updated, None]
+		
+		# -- SOM's extensions are updated once (all neurons could be altered)
+		self._last_nh_window = None
+		self._last_moved_inds = None
+		self.__update_covars()
+		
+		for bmu_ind in bmu_inds:
+			self.__update_state_trans_probs(bmu_ind)
+		
+		# -- leave SOM in consistent state (activation vector, model bias)
+		if (X.shape[0] > 0):
+			self.find_bmu(X[-1], None, True)
+		
+		return bmu_inds
+	
 	def predict_next_act_vec(self):
 		"""
 		Predicts activation vector (next BMU likelihood) at next time step
@@ -515,7 +1117,7 @@ class _Template_SOM:
 		NOTE: 'init_predictor' MUST be called prior to usage of this function!
 		"""
 		
-		dot(self.act_vec, self.__mm_trans_probs, self.predicted_act_vec)
+		self._predictor.predict(self.act_vec, self.predicted_act_vec)
 		
 		return self.predicted_act_vec[:]
 	
@@ -528,7 +1130,7 @@ class _Template_SOM:
 		# act_vec /= max(act_vec) # Is such normaliztaion really needed?
 		self.gen_model.weights_ = act_vec[:]
 	
-		return self.gen_model.sample(samples_num)
+		return self.gen_model.sample(samples_num, self._rng)
 	
 	def __generate_dpd(self, act_vec, samples_num):
 		"""
@@ -539,22 +1141,25 @@ class _Template_SOM:
 		Returns weight vectors of neurons sampled from Discrete PD
 		
 		NOTE: 'act_vec' could have any values, as long as 
-				it is normalized in this function
+				it is normalized in this function (by sampler)
 		"""
 		
 		abs(act_vec, out = act_vec) # just in case
 		
-		# -- CDF
-		bins = cumsum(act_vec)
+		self._sampler.set_pmf(act_vec)
 		
-		if (bins[-1] == 0.0):
-			print act_vec
-			raise ValueError
+		# (one sample is drawn by backward pass, scalar draw is cheaper)
+		if (samples_num == 1):
+			ind = self._sampler.sample_one(self._rng)
+			samples = self.neurons[ind:ind + 1].copy()
+		else:
+			samples = self.neurons.take(
+						self._sampler.sample(self._rng, samples_num), axis = 0)
 		
-		bins /= bins[-1] # normalization
+		# (added in-place, so samples keep SOM's dtype)
+		samples += self._noise_func()
 		
-		return self.neurons[digitize(random.random_sample(samples_num), bins)] + \
-			self._noise_func()
+		return samples
 
 #================================================================================
 
@@ -614,6 +1219,8 @@ class Miller_SOM(_Template_SOM):
 		# NOTE: completely arbitary value for now!
 		self.nh_constant = 2.3
 		
+		self._state_fields.append(("nh_constant", "nh_constant", float64, ()))
+		
 	
 	def _update_neurons_kernel(self, bmu_ind, diff_m):	
 		
@@ -625,8 +1232,7 @@ class Miller_SOM(_Template_SOM):
 		if (model_error < EPS): model_error = EPS 
 		
 		# -- update neurons' weights
-		diff_m *= self._gauss_nh(bmu_ind, model_error*self.nh_constant*self.nh_constant)
-		self.neurons += diff_m
+		self._nh_update(bmu_ind, model_error*self.nh_constant*self.nh_constant, diff_m)
 
 #================================================================================
 		
@@ -653,12 +1259,16 @@ class PL_SOM(_Template_SOM):
 		# NOTE: almost arbitary value for now!
 		self.nh_constant = 2.3
 		
+		self._state_fields.append(("nh_constant", "nh_constant", float64, ()))
+		
 		# -- used in error estimation: previous denominator
 		# -- (i.e. normalization factor) of model_error estimation formula
 		#
 		# -- NOTE: assume (t-1) by word "previous"
 		self.__last_me_denom = EPS
 		
+		self._state_fields.append(("last_me_denom", "_PL_SOM__last_me_denom", float64, ()))
+		
 	
 	def _update_neurons_kernel(self, bmu_ind, diff_m):	
 		
@@ -692,8 +1302,7 @@ class PL_SOM(_Template_SOM):
 			
 			
 			# -- update neurons' weights
-			diff_m *= self._gauss_nh(bmu_ind, sigma*sigma)
-			self.neurons += diff_m * model_error
+			self._nh_update(bmu_ind, sigma*sigma, diff_m, model_error)
 		
 #================================================================================
 
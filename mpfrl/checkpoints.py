@@ -0,0 +1,583 @@
+"""
+	Append-only checkpoint store for MPF hierarchy dumps
+	
+	Single binary file consisting of the header followed by records,
+	each record is: 4-byte tag, payload length (uint64), payload
+	
+	1. "FLDS" - schema extension: JSON list of [field id, name, dtype] for
+		fields seen first time (fields are never removed)
+	2. "SNAP" - snapshot: time (int64), name (e.g. "after_forward") and
+		entries of fields which changed since the previous snapshot only,
+		each entry is: field id (uint32), number of dimensions (uint8),
+		shape (uint64 each) and raw data
+	
+	Thus value of any field at snapshot [i] is the value from its last entry
+	in snapshots [0..i] (see 'Checkpoint_Reader')
+	
+	State to store is given by explicit (name, value) pairs, structured
+	values (e.g. flat state records, see 'state' module) are stored as
+	separate fields named by prefix + name of record's field, see
+	'MPF_Hierarchy._checkpoint_state'
+	
+	Writing could be moved off the caller's thread by
+	'Async_Checkpoint_Writer'
+"""
+
+import json
+import struct
+import threading
+import traceback
+import Queue
+
+from bisect import bisect_right
+
+from common import *
+
+CHECKPOINT_MAGIC = "MPFCKPT\x01"
+
+_RECORD_HEADER = struct.Struct("<4sQ")
+_SNAPSHOT_HEADER = struct.Struct("<qH")
+_ENTRIES_NUM = struct.Struct("<I")
+_ENTRY_HEADER = struct.Struct("<IB")
+
+# buffer size of checkpoint store's file
+WRITE_BUFFER_SIZE = 1 << 20
+
+#================================================================================
+
+class Checkpoint_Writer:
+	"""
+	
+	Writes snapshots of state into new checkpoint store 'file_path'
+	(existing file is overwritten)
+	
+	Raw data of last written value of every field is kept, so unchanged
+	fields cost only comparison. Fields of structured values (records) are
+	compared all at once: raw data of whole record against the previous one,
+	so per-field work is done for changed fields only
+	
+	"""
+	
+	def __init__(self, file_path):
+		self.file_path = file_path
+		
+		# (large buffer: snapshot is written as many small chunks)
+		self._file = open(file_path, "wb", WRITE_BUFFER_SIZE)
+		self._file.write(CHECKPOINT_MAGIC)
+		
+		# name -> field id
+		self._fields_ids = dict()
+		
+		# field id -> dtype, last written shape and raw data
+		self._fields_dtypes = []
+		self._last_shapes = []
+		self._last_data = []
+		
+		# name of structured value -> its layout (see '__record_layout')
+		self._records = dict()
+		
+		self.snapshots_num = 0
+	
+	def __write_record(self, tag, payload_len):
+		self._file.write(_RECORD_HEADER.pack(tag, payload_len))
+	
+	def __new_field(self, name, field_dtype, new_fields):
+		"""
+		registers field 'name' (appended to 'new_fields'), returns its id
+		"""
+		
+		field_id = len(self._fields_dtypes)
+		self._fields_ids[name] = field_id
+		
+		self._fields_dtypes.append(field_dtype)
+		self._last_shapes.append(None)
+		self._last_data.append(None)
+		
+		new_fields.append([field_id, name, field_dtype.str])
+		
+		return field_id
+	
+	def __record_layout(self, name, value, new_fields):
+		"""
+		returns layout of structured value 'name' (its fields are registered
+		on the first call): dtype, per field offset, size and packed header
+		of its entry, the first and the last 8-byte words of non-empty fields
+		and buffers of raw data of last written record and of its changed
+		words
+		"""
+		
+		layout = self._records.get(name)
+		
+		if (layout is not None):
+			# (records have fixed schema, see 'state.State_Record')
+			assert(value.dtype == layout["dtype"])
+			return layout
+		
+		# (structured scalars only, see 'state.State_Record')
+		assert(value.shape == ())
+		
+		entries = []
+		
+		for field_name in value.dtype.names:
+			(field_dtype, offset) = value.dtype.fields[field_name][:2]
+			
+			field_id = self.__new_field(name + field_name, field_dtype.base, new_fields)
+			
+			entries.append((
+				offset, field_dtype.itemsize,
+				struct.pack(
+					"<IB%dQ" % len(field_dtype.shape),
+					field_id, len(field_dtype.shape), *field_dtype.shape
+				)
+			))
+		
+		# -- raw data is compared by 8-byte words (the last one is padded),
+		# -- preallocated buffers (fresh ones of record's size cost page
+		# -- faults and evict more of cache)
+		words_num = -(-value.dtype.itemsize // 8)
+		
+		# (empty fields are written once, they can't change)
+		layout = {
+			"dtype": value.dtype,
+			"entries": [entry for entry in entries if (entry[1] > 0)],
+			"empty_entries": [entry for entry in entries if (entry[1] == 0)],
+			"written": False,
+			"last_data": zeros(8 * words_num, dtype = uint8),
+			"changed_words": zeros(words_num, dtype = bool)
+		}
+		
+		layout["first_words"] = array(
+					[offset // 8 for (offset, size, header) in layout["entries"]],
+					dtype = intp
+		)
+		layout["last_words"] = array(
+					[
+						(offset + size - 1) // 8
+						for (offset, size, header) in layout["entries"]
+					],
+					dtype = intp
+		)
+		
+		self._records[name] = layout
+		
+		return layout
+	
+	def __record_entries(self, name, value, new_fields):
+		"""
+		returns (header, raw data) pairs of entries of changed fields of
+		structured value 'name'
+		"""
+		
+		layout = self.__record_layout(name, value, new_fields)
+		
+		data = ascontiguousarray(value).reshape(1).view(uint8)
+		data_len = data.shape[0]
+		
+		last_data = layout["last_data"]
+		
+		if (not layout["written"]):
+			entries = layout["entries"] + layout["empty_entries"]
+			layout["written"] = True
+		elif (len(layout["entries"]) == 0):
+			entries = []
+		else:
+			changed_words = layout["changed_words"]
+			full_len = 8 * (data_len // 8)
+			
+			not_equal(
+				data[:full_len].view(uint64),
+				last_data[:full_len].view(uint64),
+				out = changed_words[:full_len // 8]
+			)
+			
+			if (full_len < data_len):
+				changed_words[-1] = not array_equal(
+							data[full_len:], last_data[full_len:data_len])
+			
+			# field is changed if any of its words is changed (words shared
+			# with neighbours could make unchanged field to be written)
+			changed = logical_or.reduceat(changed_words, layout["first_words"])
+			changed |= changed_words[layout["last_words"]]
+			
+			entries = layout["entries"]
+			entries = [entries[i] for i in flatnonzero(changed)]
+		
+		copyto(last_data[:data_len], data)
+		
+		# (entries refer to last data, it is kept until the next 'write')
+		return [
+			(header, buffer(last_data, offset, size))
+			for (offset, size, header) in entries
+		]
+	
+	def write(self, t, snapshot_name, state):
+		"""
+		appends snapshot of 'state' ((name, value) pairs, None values are
+		skipped) taken at time 't'
+		"""
+		
+		new_fields = []
+		changed = []
+		
+		fields_ids = self._fields_ids
+		fields_dtypes = self._fields_dtypes
+		last_shapes = self._last_shapes
+		last_data = self._last_data
+		
+		for (name, value) in state:
+			if (value is None): continue
+			
+			# fields of structured value are written as separate fields
+			if ((value.__class__ == ndarray) and (value.dtype.names is not None)):
+				changed.extend(self.__record_entries(name, value, new_fields))
+				continue
+			
+			if (value.__class__ != ndarray):
+				value = asarray(value)
+			
+			field_id = fields_ids.get(name)
+			
+			if (field_id is None):
+				field_id = self.__new_field(name, value.dtype, new_fields)
+			
+			elif (value.dtype != fields_dtypes[field_id]):
+				value = value.astype(fields_dtypes[field_id])
+			
+			# raw data comparison is cheaper than elementwise one
+			data = value.tobytes()
+			
+			if ((data == last_data[field_id]) and
+				(value.shape == last_shapes[field_id])):
+				continue
+			
+			last_shapes[field_id] = value.shape
+			last_data[field_id] = data
+			
+			changed.append((
+				struct.pack(
+					"<IB%dQ" % len(value.shape),
+					field_id, len(value.shape), *value.shape
+				),
+				data
+			))
+		
+		# -- schema extension
+		if (len(new_fields) > 0):
+			payload = json.dumps(new_fields)
+			
+			self.__write_record("FLDS", len(payload))
+			self._file.write(payload)
+		
+		# -- snapshot
+		payload_len = _SNAPSHOT_HEADER.size + len(snapshot_name) + _ENTRIES_NUM.size
+		
+		for (header, data) in changed:
+			payload_len += len(header) + len(data)
+		
+		chunks = [
+			_RECORD_HEADER.pack("SNAP", payload_len),
+			_SNAPSHOT_HEADER.pack(t, len(snapshot_name)),
+			snapshot_name,
+			_ENTRIES_NUM.pack(len(changed))
+		]
+		
+		for (header, data) in changed:
+			chunks.append(header)
+			chunks.append(data)
+		
+		self._file.writelines(chunks)
+		
+		self.snapshots_num += 1
+	
+	def flush(self):
+		self._file.flush()
+	
+	def close(self):
+		self._file.close()
+
+#================================================================================
+
+class Async_Checkpoint_Writer:
+	"""
+	
+	Background writer: 'write' only copies state into one of 'slots_num'
+	preallocated snapshot buffers (ring) and returns, while change detection
+	and I/O are performed by 'writer' (i.e. 'Checkpoint_Writer') in
+	separate thread
+	
+	If all buffers are still waiting to be written (writer can't keep up)
+	'write' blocks until one is released (backpressure), such stalls are
+	counted in 'stalls_num'
+	
+	NOTE: 'close' (or at least 'wait') must be called to be sure that
+			everything is written, writer thread's errors are re-raised
+			on subsequent calls
+	
+	"""
+	
+	def __init__(self, writer, slots_num = 4):
+		assert(slots_num >= 1)
+		
+		self.writer = writer
+		
+		# -- snapshot buffers: lists of (name, copy of value) pairs
+		self._slots = [[] for slot_id in xrange(slots_num)]
+		
+		self._free_slots = Queue.Queue()
+		for slot_id in xrange(slots_num):
+			self._free_slots.put(slot_id)
+		
+		# -- filled slots (and flush requests) to be processed by thread
+		self._pending = Queue.Queue()
+		
+		self._error = None
+		
+		self.stalls_num = 0
+		
+		self._thread = threading.Thread(target = self.__writer_loop)
+		self._thread.daemon = True
+		self._thread.start()
+	
+	def __writer_loop(self):
+		while (True):
+			item = self._pending.get()
+			
+			try:
+				if (item is None): break
+				
+				if (item == "flush"):
+					if (self._error is None):
+						self.writer.flush()
+				else:
+					(slot_id, t, snapshot_name) = item
+					
+					# (after failure buffers are just released)
+					try:
+						if (self._error is None):
+							self.writer.write(t, snapshot_name, self._slots[slot_id])
+					finally:
+						self._free_slots.put(slot_id)
+			
+			except Exception:
+				self._error = traceback.format_exc()
+			
+			finally:
+				self._pending.task_done()
+	
+	def __check_error(self):
+		if (self._error is not None):
+			raise RuntimeError("checkpoint writer thread failed:\n" + self._error)
+	
+	def write(self, t, snapshot_name, state):
+		"""
+		copies snapshot of 'state' into free buffer and queues it for writing
+		"""
+		
+		self.__check_error()
+		
+		try:
+			slot_id = self._free_slots.get_nowait()
+		except Queue.Empty:
+			self.stalls_num += 1
+			slot_id = self._free_slots.get()
+		
+		slot = self._slots[slot_id]
+		slot_len = len(slot)
+		
+		pos = 0
+		
+		for (name, value) in state:
+			if (value.__class__ == ndarray):
+				buf = None
+				if (pos < slot_len): buf = slot[pos][1]
+				
+				# reuse buffer of the same field from previous snapshots
+				if ((buf.__class__ == ndarray) and (buf.shape == value.shape) and
+					(buf.dtype == value.dtype)):
+					copyto(buf, value)
+				else:
+					buf = value.copy()
+				
+				value = buf
+			
+			# (scalars are immutable, so stored as they are)
+			if (pos < slot_len):
+				slot[pos] = (name, value)
+			else:
+				slot.append((name, value))
+			
+			pos += 1
+		
+		del slot[pos:]
+		
+		self._pending.put((slot_id, t, snapshot_name))
+	
+	def flush(self):
+		"""
+		queues flush of underlying writer (doesn't wait for it)
+		"""
+		
+		self.__check_error()
+		
+		self._pending.put("flush")
+	
+	def wait(self):
+		"""
+		waits until all queued snapshots are written
+		"""
+		
+		self._pending.join()
+		
+		self.__check_error()
+	
+	def close(self):
+		"""
+		writes all queued snapshots, stops thread and closes underlying writer
+		"""
+		
+		self._pending.put("flush")
+		self._pending.put(None)
+		self._thread.join()
+		
+		self.writer.close()
+		
+		self.__check_error()
+
+#================================================================================
+
+class Checkpoint_Reader:
+	"""
+	
+	Reads checkpoint store written by 'Checkpoint_Writer': records are
+	indexed once on opening, data is read on demand
+	
+	'snapshots' is a list of (t, snapshot name) pairs
+	
+	"""
+	
+	def __init__(self, file_path):
+		self.file_path = file_path
+		
+		self._file = open(file_path, "rb")
+		assert(self._file.read(len(CHECKPOINT_MAGIC)) == CHECKPOINT_MAGIC)
+		
+		# name -> field id, field id -> name and dtype
+		self.fields_ids = dict()
+		self._fields_names = []
+		self._fields_dtypes = []
+		
+		self.snapshots = []
+		
+		# field id -> snapshots indicies and (offset, shape) of its entries
+		self._entries_snapshots = []
+		self._entries = []
+		
+		self.__index()
+	
+	def __index(self):
+		f = self._file
+		
+		while (True):
+			header = f.read(_RECORD_HEADER.size)
+			if (len(header) < _RECORD_HEADER.size): break
+			
+			(tag, payload_len) = _RECORD_HEADER.unpack(header)
+			payload_end = f.tell() + payload_len
+			
+			if (tag == "FLDS"):
+				for (field_id, name, dtype_str) in json.loads(f.read(payload_len)):
+					assert(field_id == len(self._fields_names))
+					
+					self.fields_ids[str(name)] = field_id
+					self._fields_names.append(str(name))
+					self._fields_dtypes.append(dtype(str(dtype_str)))
+					
+					self._entries_snapshots.append([])
+					self._entries.append([])
+			
+			elif (tag == "SNAP"):
+				(t, name_len) = _SNAPSHOT_HEADER.unpack(f.read(_SNAPSHOT_HEADER.size))
+				snapshot_name = f.read(name_len)
+				
+				(entries_num,) = _ENTRIES_NUM.unpack(f.read(_ENTRIES_NUM.size))
+				
+				for i in xrange(entries_num):
+					(field_id, ndim) = _ENTRY_HEADER.unpack(f.read(_ENTRY_HEADER.size))
+					entry_shape = struct.unpack("<%dQ" % ndim, f.read(8 * ndim))
+					
+					self._entries_snapshots[field_id].append(len(self.snapshots))
+					self._entries[field_id].append((f.tell(), entry_shape))
+					
+					f.seek(
+						self._fields_dtypes[field_id].itemsize * \
+							int(prod(entry_shape)),
+						1
+					)
+				
+				self.snapshots.append((t, snapshot_name))
+			
+			# unknown records are skipped
+			f.seek(payload_end)
+	
+	def __len__(self):
+		return len(self.snapshots)
+	
+	def __read_entry(self, field_id, entry_ind):
+		(offset, entry_shape) = self._entries[field_id][entry_ind]
+		
+		self._file.seek(offset)
+		
+		return fromfile(
+					self._file,
+					dtype = self._fields_dtypes[field_id],
+					count = int(prod(entry_shape))
+		).reshape(entry_shape)
+	
+	def get(self, name, snapshot_ind = -1):
+		"""
+		returns value of field 'name' at snapshot 'snapshot_ind'
+		(None if it has not been written yet)
+		"""
+		
+		if (snapshot_ind < 0): snapshot_ind += len(self.snapshots)
+		
+		field_id = self.fields_ids[name]
+		
+		entry_ind = bisect_right(self._entries_snapshots[field_id], snapshot_ind) - 1
+		if (entry_ind < 0): return None
+		
+		return self.__read_entry(field_id, entry_ind)
+	
+	def snapshot(self, snapshot_ind = -1):
+		"""
+		returns dictionary with values of all fields at snapshot 'snapshot_ind'
+		"""
+		
+		res_d = dict()
+		
+		for name in self._fields_names:
+			value = self.get(name, snapshot_ind)
+			
+			if (value is not None):
+				res_d[name] = value
+		
+		return res_d
+	
+	def history(self, name):
+		"""
+		returns snapshots indicies where field 'name' has been changed
+		and its values at them
+		"""
+		
+		field_id = self.fields_ids[name]
+		
+		return (
+			list(self._entries_snapshots[field_id]),
+			[
+				self.__read_entry(field_id, entry_ind)
+				for entry_ind in xrange(len(self._entries[field_id]))
+			]
+		)
+	
+	def close(self):
+		self._file.close()
@@ -11,7 +11,11 @@ from common import *
 from SOM import *
 from units import *
 
-from scipy.io import savemat
+from checkpoints import *
+from recorder import *
+
+# name of checkpoint store in 'dump_path' (see 'dump_format')
+CHECKPOINT_FILENAME = "h.ckpt"
 
 class MPF_Hierarchy:
 	"""
@@ -24,10 +28,37 @@ class MPF_Hierarchy:
 	(i.e. "sensomotor" units in the bottom of hierarchy) and desired
 	number of levels 
 	
+	Every 'dump_period' steps state of whole hierarchy is stored
+	after forward and after backward passes ('dump_snapshots' could be 
+	narrowed to one of them) according to 'dump_format':
+	1. "mat" (default) - compressed .MAT-file 'dump_path/h_<t>.mat' 
+		per dump
+	2. "checkpoint" - snapshots are appended to single checkpoint store
+		'dump_path/h.ckpt', only changed arrays are written 
+		(see 'checkpoints' module)
+	
+	Checkpoints could be written asynchronously ('dump_async_slots' > 0):
+	snapshots are copied into ring of that many buffers and written by
+	background thread, 'close_dumps' must be called at the end then
+	
+	All units are of the same dtype as L0 ones (see '_Base_MPF_Unit'), 
+	input vector of other dtype is converted once on evaluation
+	
+	Small vectors of units (predictions, reward correlations etc.) are
+	kept in contiguous arrays per level (see 'units.pack_units_vectors')
+	
 	"""
 	
 	def __init__(self, l0_units, levels_num, dump_period = 0, dump_path = "", 
-					ss_class = None, ts_class = None):
+					ss_class = None, ts_class = None, dump_format = "mat",
+					dump_async_slots = 0,
+					dump_snapshots = ("after_forward", "after_backward")):
+		# dtype of all floating-point arrays
+		self.dtype = l0_units[0].dtype
+		
+		for unit in l0_units:
+			assert(unit.dtype == self.dtype)
+		
 		# Output vector after hierarchy evaluation
 		# this vector is a prediction of next input
 		self.output_vec = zeros(
@@ -35,9 +66,15 @@ class MPF_Hierarchy:
 					lambda a, u: a + u.ss.neurons.shape[1],
 					l0_units,
 					0
-				)
+				),
+				dtype = self.dtype
 		)
 		
+		# -- preallocations of converted input vector and 
+		# -- random input of top unit's backward pass
+		self._input_vec = zeros(self.output_vec.shape, dtype = self.dtype)
+		self._top_ts_act_vec = None
+		
 		# store classes for constructing hierarchy
 		# -- unit class
 		self.__mpf_unit_class = l0_units[0].__class__
@@ -88,23 +125,78 @@ class MPF_Hierarchy:
 		# forward and subsequent passes
 		self.t = 0
 		
-		# attributes to store
-		self._stored_attr_names = [
-						"t",
-						"reinforcement_prime",
-						"max_abs_reinforcement_prime"
+		# State schema: (name, attribute, dtype, shape) of fields stored in
+		# dumps and checkpoints (see 'state' module), units have their own
+		self._state_fields = [
+					("t", "t", int64, ()),
+					("reinforcement_prime", "reinforcement_prime", float64, ()),
+					("max_abs_reinforcement_prime", "max_abs_reinforcement_prime",
+						float64, ()),
+					("prev_reinforcement", "_prev_reinforcement", float64, ()),
+					("prev_reinforcement_prime", "_prev_reinforcement_prime", 
+						float64, ()),
+					("dump_period", "dump_period", int64, ()),
+					("output_vec", "output_vec", 
+						self.output_vec.dtype, self.output_vec.shape)
 		]
 		
+		# -- flat record of whole hierarchy's state (see 'state_record')
+		self._state_record = None
+		
+		# -- memory-mapped state and names of its variable-sized fields
+		# -- (see 'map_state')
+		self._state_file = None
+		self._state_extras_names = None
+		
+		# recorder of per-step diagnostics (see 'start_recording')
+		self.recorder = None
+		
 		# storing parameters
+		assert((dump_format == "checkpoint") or (dump_format == "mat"))
+		assert((dump_async_slots == 0) or (dump_format == "checkpoint"))
+		assert(len(dump_snapshots) > 0)
+		
+		for dump_subname in dump_snapshots:
+			assert((dump_subname == "after_forward") or 
+					(dump_subname == "after_backward"))
+		
 		self.dump_period = dump_period
 		self.dump_path = dump_path
+		self.dump_format = dump_format
+		self.dump_async_slots = dump_async_slots
+		self.dump_snapshots = tuple(dump_snapshots)
 		
 		# -- prepare dictionary for dumping
 		self._dump_dict = dict()
 		
+		# -- checkpoint store (created on first dump)
+		self._checkpoint_writer = None
+		
+		# executor of same-level units (None means sequential evaluation)
+		# and numpy's floating-point error handling to use in its threads
+		# (see 'set_executor')
+		self._executor = None
+		self._executor_errstate = None
+		
+		# random numbers generator for top unit's backward pass input
+		# (see 'seed_rngs')
+		self._rng = random
+		
 		# try to automatically construct hierarchy
 		self.__construct_hierarchy(l0_units, levels_num)
 		
+		# compile units tree into level-by-level evaluation schedule
+		self.__compile_schedule()
+		
+		# level-wide arrays of units' vectors (dictionary per level, 
+		# None once units are detached from them, see 'levels_vectors')
+		self._levels_vectors = [
+					pack_units_vectors([unit for (unit, children) in level])
+					for level in self._levels
+		]
+		
+		self._top_ts_act_vec = zeros(self.top_unit.ts.act_vec.shape, dtype = self.dtype)
+		
 	def _check_should_dump(self):
 		"""
 		returns True if hierarchy should be stored in .MAT file
@@ -123,14 +215,10 @@ class MPF_Hierarchy:
 		
 		if (not self._check_should_dump()): return
 		
-		res_d = dict()
-		
-		for attr_name in dir(self):
-			attr = getattr(self, attr_name)
-			
-			if (((hasattr(attr, "__class__")) and (attr.__class__ == ndarray)) or
-				(attr_name in self._stored_attr_names)):
-				res_d[attr_name] = attr
+		res_d = dict([
+				(name, getattr(owner, attr_name))
+				for (name, owner, attr_name, f_dtype, f_shape) in state_fields(self)
+		])
 		
 		# dump units
 		unit_counter = 0
@@ -144,13 +232,187 @@ class MPF_Hierarchy:
 		# place resulting dump in specific place
 		self._dump_dict[dump_subname] = res_d
 		
+	def _units_prefixes(self):
+		"""
+		returns pairs of unit and its name prefix in dumps
+		"""
+		
+		return [
+			(unit, "unit_L%d__%.3d/" % (unit.unit_level, unit_counter))
+			for (unit_counter, unit) in enumerate(self.l0_units + self.units)
+		]
+	
+	def _state_schema(self):
+		"""
+		returns resolved state schema of hierarchy and all its units
+		(see 'state.state_fields')
+		"""
+		
+		res = state_fields(self)
+		
+		for (unit, prefix) in self._units_prefixes():
+			res.extend(unit._state_schema(prefix))
+		
+		return res
+	
+	def state_record(self):
+		"""
+		Captures state of whole hierarchy into flat record, i.e. numpy
+		structured scalar with stable layout (see 'state' module), and 
+		returns it
+		
+		Variable-sized state (predictors' transitions) is not included,
+		see '_state_extras'
+		
+		NOTE: record is reused by subsequent captures, copy it if needed
+		NOTE: schema is fixed at the first call
+		"""
+		
+		if (self._state_record is None):
+			self._state_record = State_Record(self._state_schema())
+		
+		return self._state_record.capture()
+	
+	def _state_extras(self):
+		"""
+		returns (name, value) pairs of variable-sized state of all units
+		"""
+		
+		res = []
+		
+		for (unit, prefix) in self._units_prefixes():
+			res.extend(unit._state_extras(prefix))
+		
+		return res
+	
+	def map_state(self, file_path, restore = False):
+		"""
+		Backs state of whole hierarchy (SOMs' weights, predictors, units'
+		vectors etc.) by single memory-mapped file 'file_path', i.e. arrays
+		of units become views of file's pages (see 'state.State_File')
+		
+		'restore' = False: file is created from current state
+		'restore' = True: state is replaced by contents of existing file
+			written by hierarchy of the same structure, only mapping is
+			performed (no parsing, pages are read on first access)
+		
+		Predictors' storage is mapped with headroom: grown to twice as many
+		transitions as already observed, once any of them outgrows it, the
+		next 'sync_state' maps state again into new file (replacing this one)
+		
+		Subsequent 'sync_state' calls are checkpoints
+		
+		NOTE: random numbers generators' states are not stored
+		NOTE: map state before sharding and building populations
+		"""
+		
+		# -- predictors' capacities are taken from restored file
+		capacities = None
+		
+		if (restore):
+			capacities = dict([
+						(name, f_shape)
+						for (name, f_dtype, f_shape) in state_file_layout(file_path)
+			])
+		
+		fields = self._state_schema()
+		extras_fields = []
+		
+		for (unit, prefix) in self._units_prefixes():
+			unit._reserve_state_extras(prefix, capacities)
+			extras_fields.extend(unit._reserved_state_fields(prefix))
+		
+		self._state_extras_names = [
+					name 
+					for (name, owner, attr_name, f_dtype, f_shape) in extras_fields
+		]
+		
+		self._state_file = State_File(file_path, fields + extras_fields, restore)
+		
+	def sync_state(self):
+		"""
+		writes state to memory-mapped file (see 'map_state'): scalars are
+		copied into it and mapped pages are flushed
+		
+		State is mapped again (into new file) if predictors' storage has
+		outgrown the file
+		"""
+		
+		if (len(self._state_file.detached(self._state_extras_names)) > 0):
+			self.map_state(self._state_file.file_path)
+		
+		self._state_file.sync()
+	
+	def levels_vectors(self):
+		"""
+		returns level-wide arrays of units' vectors: dictionary per level 
+		of schedule (see 'units.pack_units_vectors'), or None once vectors
+		of any unit have been rebound (e.g. by 'map_state', sharding or 
+		population), so units don't refer to these arrays anymore
+		"""
+		
+		if (self._levels_vectors is None): return None
+		
+		for (level, level_vectors) in zip(self._levels, self._levels_vectors):
+			if (not units_vectors_packed(
+						[unit for (unit, children) in level], level_vectors)):
+				# (stale copies are dropped)
+				self._levels_vectors = None
+				break
+		
+		return self._levels_vectors
+	
+	def _checkpoint_state(self):
+		"""
+		returns state of hierarchy to be stored in checkpoint: flat record
+		(expanded by writer into its fields) and variable-sized state
+		"""
+		
+		return [("", self.state_record())] + self._state_extras()
+	
+	def _take_snapshot(self, dump_subname):
+		"""
+		stores current state of hierarchy (if it's time to dump)
+		according to 'dump_format'
+		"""
+		
+		if (not self._check_should_dump()): return
+		
+		if (dump_subname not in self.dump_snapshots): return
+		
+		if (self.dump_format == "mat"):
+			self._to_matlab_mat(dump_subname)
+			return
+		
+		if (self._checkpoint_writer is None):
+			self._checkpoint_writer = Checkpoint_Writer(
+							self.dump_path + "/" + CHECKPOINT_FILENAME
+			)
+			
+			if (self.dump_async_slots > 0):
+				self._checkpoint_writer = Async_Checkpoint_Writer(
+							self._checkpoint_writer,
+							self.dump_async_slots
+				)
+		
+		self._checkpoint_writer.write(self.t, dump_subname, self._checkpoint_state())
+	
 	def _dump_hierarchy(self):
 		"""
 		stores prepared hierarchy to matlab file
+		(or just flushes checkpoint store)
 		"""
 		
 		if (not self._check_should_dump()): return
 		
+		if (self.dump_format == "checkpoint"):
+			self._checkpoint_writer.flush()
+			return
+		
+		# (scipy is imported only here, as it is slow to import and
+		# is not needed unless hierarchy is dumped to matlab files)
+		from scipy.io import savemat
+		
 		# store at last
 		savemat(
 				self.dump_path + "/h_%d.mat" % (self.t), 
@@ -159,6 +421,43 @@ class MPF_Hierarchy:
 				do_compression = True
 		)
 		
+	def start_recording(self, file_path = None, chunk_size = 1024):
+		"""
+		Starts recording of per-step diagnostics (prediction errors, BMUs
+		and model errors of units) into columns kept in memory or written
+		in chunks to columnar file 'file_path' (see 'recorder' module), 
+		returns recorder
+		"""
+		
+		self.close_recording()
+		
+		self.recorder = Series_Recorder(self, file_path, chunk_size)
+		
+		return self.recorder
+		
+	def close_recording(self):
+		"""
+		writes the rest of recorded rows and stops recording
+		"""
+		
+		if (self.recorder is None): return
+		
+		self.recorder.close()
+		self.recorder = None
+	
+	def close_dumps(self):
+		"""
+		finishes writing of checkpoints (waits for background writer, if any)
+		and closes checkpoint store
+		
+		NOTE: subsequent dumps would start new store (overwriting this one)
+		"""
+		
+		if (self._checkpoint_writer is None): return
+		
+		self._checkpoint_writer.close()
+		self._checkpoint_writer = None
+	
 	def __construct_hierarchy(self, l0_units, levels_num):
 		"""
 		Constructs hierarchy give only L0 ("sensomotor") units and
@@ -185,7 +484,8 @@ class MPF_Hierarchy:
 				parent_unit = None,
 				unit_type = MPF_UT_INTERNAL,
 				unit_level = level_id,
-				h = self
+				h = self,
+				dtype = self.dtype
 			)
 			
 			for child_unit in children:
@@ -229,6 +529,160 @@ class MPF_Hierarchy:
 		# add top node at last
 		self.top_unit = _add_unit(lk_units, ((20, 20), (10, 10)), levels_num - 1)
 	
+	def __compile_schedule(self):
+		"""
+		Compiles units tree into topologically ordered level-by-level
+		schedule, used by 'evaluate' instead of recursive forward and backward
+		passes of units
+		
+		'self._levels[k]' holds units of level k (i.e. the longest path to L0)
+		as pairs: (unit, [(child unit, slice of unit's input), ...]), 
+		L0 units are in the same order as their input ranges
+		"""
+		
+		# children always precede their parents in this list
+		all_units = self.l0_units + self.units
+		
+		units_levels = dict()
+		
+		for unit in all_units:
+			units_levels[unit] = 0
+			
+			for child_unit in unit.children_units:
+				if (units_levels[unit] < units_levels[child_unit] + 1):
+					units_levels[unit] = units_levels[child_unit] + 1
+		
+		self._levels = [[] for level_id in xrange(units_levels[self.top_unit] + 1)]
+		
+		for unit in all_units:
+			self._levels[units_levels[unit]].append((
+						unit,
+						[
+							(child_unit, slice(*child_unit._pu_iv_range))
+							for child_unit in unit.children_units
+						]
+			))
+		
+		# -- L0 units' parts of input vector
+		self._l0_iv_slices = [slice(*iv_range) for iv_range in self.l0_iv_ranges]
+	
+	def set_executor(self, executor):
+		"""
+		Enables parallel evaluation: units of the same level are dispatched
+		to 'executor', i.e. anything with 'map(func, iterable)' method, e.g.
+		'multiprocessing.pool.ThreadPool' (numpy releases GIL in heavy calls);
+		levels are still evaluated one after another
+		
+		'None' switches back to sequential evaluation
+		
+		NOTE: call 'seed_rngs' in order to get the same results as in
+				sequential mode (backward pass is random)
+		"""
+		
+		self._executor = executor
+		
+		# numpy's error handling is per-thread, so propagate current one
+		self._executor_errstate = geterr()
+	
+	def seed_rngs(self, seed):
+		"""
+		Gives dedicated random numbers generator (RandomState) to every unit
+		and to hierarchy itself, all are seeded from 'seed'
+		
+		Results then depend neither on evaluation order of units nor
+		on any other consumer of numpy.random
+		"""
+		
+		all_units = self.l0_units + self.units
+		
+		seeds = random.RandomState(seed).randint(0, 2**31 - 1, len(all_units) + 1)
+		
+		self._rng = random.RandomState(seeds[0])
+		
+		for (unit, unit_seed) in zip(all_units, seeds[1:]):
+			unit.set_rng(random.RandomState(unit_seed))
+	
+	def __run_level(self, func, items):
+		"""
+		applies 'func' to every item either sequentially or by executor,
+		returns when all are done (i.e. acts like barrier)
+		"""
+		
+		if (self._executor is None):
+			for item in items:
+				func(item)
+			
+			return
+		
+		errstate_kwargs = self._executor_errstate
+		
+		def _task(item):
+			with errstate(**errstate_kwargs):
+				func(item)
+		
+		list(self._executor.map(_task, items))
+	
+	@staticmethod
+	def _forward_pass_l0_unit((unit, input_vec)):
+		unit._forward_pass_kernel(input_vec)
+	
+	@staticmethod
+	def _forward_pass_unit((unit, children)):
+		# collect children's outputs
+		for (child_unit, pu_iv_slice) in children:
+			unit._accu_ss_io_vec[pu_iv_slice] = child_unit.ts.act_vec
+		
+		unit._forward_pass_kernel(unit._accu_ss_io_vec[:])
+	
+	@staticmethod
+	def _backward_pass_unit((unit, ts_act_vec)):
+		unit._backward_pass_kernel(ts_act_vec)
+	
+	def _random_top_ts_act_vec(self):
+		"""
+		returns random input of top unit's backward pass
+		(preallocated array, overwritten by the next call)
+		"""
+		
+		self._top_ts_act_vec[:] = self._rng.uniform(
+					0.0, 1.0, self._top_ts_act_vec.shape)
+		
+		return self._top_ts_act_vec
+	
+	def _forward_pass(self, input_vec):
+		"""
+		Performs forward pass level by level: from L0 units to the top one
+		"""
+		
+		self.__run_level(
+					self._forward_pass_l0_unit,
+					[
+						(self.l0_units[i], input_vec[self._l0_iv_slices[i]])
+						for i in xrange(len(self.l0_units))
+					]
+		)
+		
+		for level in self._levels[1:]:
+			self.__run_level(self._forward_pass_unit, level)
+	
+	def _backward_pass(self, top_ts_act_vec):
+		"""
+		Performs backward pass level by level: from the top unit to L0 ones
+		"""
+		
+		self.top_unit._backward_pass_kernel(top_ts_act_vec)
+		
+		for level in reversed(self._levels[1:]):
+			# distribute output through-out children
+			self.__run_level(
+						self._backward_pass_unit,
+						[
+							(child_unit, unit._accu_ss_io_vec[pu_iv_slice])
+							for (unit, children) in level
+								for (child_unit, pu_iv_slice) in children
+						]
+			)
+	
 	def evaluate(self, input_vec, reinforcement):
 		"""
 		Evaluate the hierarchy once (forward and backward pass)
@@ -259,22 +713,27 @@ class MPF_Hierarchy:
 		
 		# Try out
 		self.reinforcement_prime = reinforcement
+		
+		# -- input is converted to hierarchy's dtype once
+		if (input_vec.dtype != self.dtype):
+			self._input_vec[:] = input_vec
+			input_vec = self._input_vec
 
 		
 		# -- pass input_vec to L0 units
 		# -- i.e. perform forward pass
-		for i in xrange(len(self.l0_units)):
-			self.l0_units[i].forward_pass(
-						input_vec[self.l0_iv_ranges[i][0]:self.l0_iv_ranges[i][1]]
-			)
+		self._forward_pass(input_vec)
+		
+		if (self.recorder is not None):
+			self.recorder.record(input_vec)
 			
 		### dump hierarchy after FORWARD PASS
-		self._to_matlab_mat("after_forward")
+		self._take_snapshot("after_forward")
 		###
 		
 		# -- perform backward pass
 		# -- NOTE: now for convinience it should be performed explicitly!
-		self.top_unit.backward_pass(random.uniform(0.0, 1.0, self.top_unit.ts.act_vec.shape))
+		self._backward_pass(self._random_top_ts_act_vec())
 		#
 		# OR
 		#
@@ -284,10 +743,13 @@ class MPF_Hierarchy:
 		for i in xrange(len(self.l0_units)):
 			self.output_vec[self.l0_iv_ranges[i][0]:self.l0_iv_ranges[i][1]] = \
 				self.l0_units[i]._accu_ss_io_vec
+		
+		if (self.recorder is not None):
+			self.recorder.store_outputs()
 				
 		### dump hierarchy after BACKWARD PASS
 		### and actually save dump
-		self._to_matlab_mat("after_backward")
+		self._take_snapshot("after_backward")
 		
 		self._dump_hierarchy()
 		###
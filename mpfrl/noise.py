@@ -3,43 +3,193 @@
 	additional properties (scale decreasing, for instance)
 	
 	Such approach is sufficiently faster than scipy rv_continuous...
+	
+	Samples are pre-drawn and scaled in blocks (see '_Base_Noise'), so a
+	call just returns row of ring buffer
 """
 
 from common import *
 
-class UniformNoise:
-	def __init__(self, lower = -1.0, upper = 1.0, magn = 1.0,
-				magn_decrease = 0.0, min_magn = 0.001):
+# default number of calls which samples are pre-drawn for at once
+NOISE_BLOCK_SIZE = 64
+
+# maximal number of samples drawn by generator at once
+NOISE_CHUNK_SIZE = 4096
+
+class _Base_Noise:
+	"""
+	
+	Template for noises of decreasing magnitude: it is decreased by
+	'magn_decrease' on every call down to 'min_magn'
+	
+	Raw samples (of unit magnitude) are pre-drawn for 'block_size' calls
+	at once and magnitudes of these calls are computed at once too, raw
+	samples are scaled by them into ring buffer in one vectorized step
+	(rescaled if magnitude is changed from outside), so every call just
+	returns one row of the ring (overwritten when the ring is refilled!)
+	
+	'block_size = 1' gives the same samples as drawing them on every call
+	
+	Samples are drawn from 'rng' (numpy.random or RandomState instance), 
+	dedicated generator could be given by 'set_rng'
+	
+	Raw samples and ring are of 'dtype' (set by SOM to its own dtype,
+	so noise is added to samples without conversion)
+	
+	NOTE: 'shape' and 'dtype' must be set before the first call
+	NOTE: pre-drawn samples are not part of state (see 'state' module), 
+			as well as generator's state, so continuation after restoring
+			is the same only for 'block_size = 1'
+	
+	Children classes implement:
+	1. '_draw(size)' returning raw samples
+	2. '_scale(raw, magns, out)' storing noise vectors in 'out' (rows of
+		'raw' scaled by column of magnitudes 'magns')
+	
+	"""
+	
+	def __init__(self, magn, magn_decrease, min_magn, block_size):
 		self.shape = 1 # default value
+		self.dtype = float64 # default value
+		
+		# random numbers generator (numpy.random or RandomState instance)
+		self.rng = random
 		
-		self.lower = lower
-		self.upper = upper
 		self.magn = magn + magn_decrease
 		self.magn_decrease = magn_decrease
 		self.min_magn = min_magn
 		
+		self.block_size = block_size
+		
+		# -- raw samples (allocated on the first call, None means no samples
+		# -- drawn), ring of scaled ones with its rows and position of the 
+		# -- next call's row in it
+		self._raw = None
+		self._ring = None
+		self._rows = None
+		self._pos = 0
+		
+		# -- magnitudes of block's calls (list, as they are taken one by 
+		# -- one), position of the first call after which magnitude stops 
+		# -- decreasing (reaches its minimum) and magnitude's parameters 
+		# -- after the last call (to detect changes from outside, e.g. by 
+		# -- restoring from checkpoint)
+		self._magns = None
+		self._min_pos = None
+		self._last_magn = None
+		self._last_magn_decrease = None
+		
+	def set_rng(self, rng):
+		"""
+		Sets random numbers generator, samples already drawn are dropped
+		"""
+		
+		self.rng = rng
+		self._raw = None
+		
+	def _draw(self, size):
+		raise NotImplementedError
+	
+	def _scale(self, raw, magns, out):
+		raise NotImplementedError
+	
+	def __refill(self):
+		"""
+		draws raw samples of the next block
+		"""
+		
+		shape = (self.block_size, self.shape)
+		
+		if ((self._raw is None) or (self._raw.shape != shape) or
+			(self._raw.dtype != self.dtype)):
+			self._raw = zeros(shape, dtype = self.dtype)
+			self._ring = zeros(shape, dtype = self.dtype)
+			self._rows = list(self._ring)
+		
+		# (samples are drawn in float64 by generator, in chunks of rows 
+		# small enough to be allocated without mapping new pages)
+		rows_num = (NOISE_CHUNK_SIZE // self.shape) or 1
+		
+		for start in xrange(0, self.block_size, rows_num):
+			chunk = self._raw[start:start + rows_num]
+			chunk[...] = self._draw(chunk.shape)
+		
+		self._pos = 0
+		
+		self.__schedule()
+		
+	def __schedule(self):
+		"""
+		calculates magnitudes of the rest of block's calls 
+		(exactly the same as decreasing magnitude call by call)
+		and scales their raw samples into the ring
+		"""
+		
+		magns = zeros(self.block_size - self._pos)
+		
+		magns.fill(self.magn_decrease)
+		magns[0] = self.magn - self.magn_decrease
+		subtract.accumulate(magns, out = magns)
+		
+		self._min_pos = self.block_size
+		
+		below_min = nonzero(magns < self.min_magn)[0]
+		
+		if (below_min.shape[0] > 0):
+			magns[below_min[0]:] = self.min_magn
+			self._min_pos = self._pos + below_min[0]
+		
+		# (positions of calls are kept)
+		self._magns = [None] * self._pos + magns.tolist()
+		
+		# (magnitudes are of ring's dtype, as scalar magnitude would be)
+		self._scale(self._raw[self._pos:], 
+					magns.astype(self.dtype)[:, newaxis], self._ring[self._pos:])
+		
 	def __call__(self):
-			self.magn -= self.magn_decrease
-			if (self.magn < self.min_magn):
-				self.magn_decrease = 0.0
-				self.magn = self.min_magn
+			if ((self._raw is None) or (self._pos == self.block_size)):
+				self.__refill()
+			elif ((self.magn != self._last_magn) or 
+				(self.magn_decrease != self._last_magn_decrease)):
+				self.__schedule()
+			
+			pos = self._pos
+			self._pos = pos + 1
 			
-			return random.uniform(self.lower, self.upper, self.shape) * self.magn
+			self.magn = self._last_magn = self._magns[pos]
+			if (pos >= self._min_pos): self.magn_decrease = 0.0
+			
+			self._last_magn_decrease = self.magn_decrease
+			
+			return self._rows[pos]
+	
+class UniformNoise(_Base_Noise):
+	def __init__(self, lower = -1.0, upper = 1.0, magn = 1.0,
+				magn_decrease = 0.0, min_magn = 0.001, 
+				block_size = NOISE_BLOCK_SIZE):
+		_Base_Noise.__init__(self, magn, magn_decrease, min_magn, block_size)
+		
+		self.lower = lower
+		self.upper = upper
 		
-class GaussianNoise:
+	def _draw(self, size):
+		return self.rng.uniform(self.lower, self.upper, size)
+	
+	def _scale(self, raw, magns, out):
+		multiply(raw, magns, out = out)
+		
+class GaussianNoise(_Base_Noise):
 	def __init__(self, mean = 0.0, magn = 1.0,
-				magn_decrease = 0.0, min_magn = 0.001):
-		self.shape = 1 # default value
+				magn_decrease = 0.0, min_magn = 0.001,
+				block_size = NOISE_BLOCK_SIZE):
+		_Base_Noise.__init__(self, magn, magn_decrease, min_magn, block_size)
 		
 		self.mean = mean
-		self.magn = magn + magn_decrease
-		self.magn_decrease = magn_decrease
-		self.min_magn = min_magn
 		
-	def __call__(self):
-			self.magn -= self.magn_decrease
-			if (self.magn < self.min_magn):
-				self.magn_decrease = 0.0
-				self.magn = self.min_magn
-			
-			return random.normal(self.lower, self.magn, self.shape)
+	def _draw(self, size):
+		return self.rng.standard_normal(size)
+	
+	def _scale(self, raw, magns, out):
+		# the same as 'rng.normal(mean, magn)'
+		multiply(raw, magns, out = out)
+		if (self.mean != 0.0): out += self.mean
@@ -0,0 +1,555 @@
+"""
+	Population of independent MPF hierarchies evaluated at once
+	
+	Hierarchies with the same structure (e.g. agents with different seeds
+	or parameters) are stepped together: state of units on the same position
+	is stacked along leading (member) axis and forward/backward passes are
+	performed as batched numpy operations, so stepping K members costs far
+	less than K separate 'MPF_Hierarchy.evaluate' calls
+"""
+
+from common import *
+from SOM import *
+from units import *
+
+#================================================================================
+
+class _SOM_Stack:
+	"""
+	
+	State of K same-shaped SOMs (one per population member) stacked along
+	leading axis
+	
+	Arrays of member SOMs are rebound to views of stacked arrays, so
+	members always observe actual weights and activations. Scalar state
+	lives here and is written back by 'sync_members'
+	
+	Sampling ('generate') is done by member SOMs themselves (their 
+	samplers, noises and random numbers generators), so it is the same
+	as in members' own evaluation
+	
+	"""
+	
+	def __init__(self, soms):
+		som = soms[0]
+		
+		# (the other SOMs have no batched update)
+		assert(som.__class__ in (Miller_SOM, PL_SOM))
+		
+		for s in soms:
+			assert(s.__class__ == som.__class__)
+			assert(s.neurons.shape == som.neurons.shape)
+			assert(s._rsom_ext == som._rsom_ext)
+			assert(s.gen_model is None)
+			assert(s._likelihood_name is not None)
+			assert(s._likelihood_name == som._likelihood_name)
+			
+			# (windowed neighbourhood is not implemented, members would 
+			# step differently then)
+			assert(s.nh_tolerance is None)
+		
+		self.soms = soms
+		
+		self.kind = som.__class__
+		self.dtype = som.dtype
+		self.likelihood_name = som._likelihood_name
+		self.rsom_ext = som._rsom_ext
+		
+		self.neurons = self.__stack_array(soms, "neurons")
+		self.act_vec = self.__stack_array(soms, "act_vec")
+		
+		(K, N, D) = self.neurons.shape
+		
+		self.nh_constant = array([s.nh_constant for s in soms], dtype = self.dtype)[:, None]
+		
+		if (self.kind == PL_SOM):
+			self.last_me_denom = array(
+						[s._PL_SOM__last_me_denom for s in soms], dtype = self.dtype)
+		
+		if (self.rsom_ext):
+			self.decay = array([s.decay for s in soms], dtype = self.dtype)[:, None, None]
+			self.last_diff_m = self.__stack_array(soms, "_Template_SOM__last_diff_m")
+		
+		self.last_model_bias = zeros(K, dtype = self.dtype)
+		
+		# -- squared lattice distances (whole table, see '_Template_SOM')
+		self.lattice_sq_dists = som._lattice_sq_dists_rows(arange(N))
+		
+		# -- predictor (stacked chains of members' markov models)
+		self.predictor = None
+		
+		if (som._predictor is not None):
+			self.predictor = Sparse_FOMM.stack([s._predictor for s in soms])
+			self.predicted_act_vec = self.__stack_array(soms, "predicted_act_vec")
+			
+			self.last_bmu_ind = array([
+						-1 if (s._Template_SOM__last_bmu_ind is None) else
+						s._Template_SOM__last_bmu_ind
+						for s in soms
+			])
+		
+		# -- preallocations
+		self.diff_m = zeros((K, N, D), dtype = self.dtype)
+		self.sq_dists = zeros((K, N), dtype = self.dtype)
+		self.samples = zeros((K, D), dtype = self.dtype)
+		self._members_range = arange(K)
+	
+	@staticmethod
+	def __stack_array(objs, attr_name):
+		"""
+		stacks arrays of all objects and rebinds them to views
+		"""
+		
+		res = array([getattr(o, attr_name) for o in objs])
+		
+		for (k, o) in enumerate(objs):
+			setattr(o, attr_name, res[k])
+		
+		return res
+	
+	def sync_members(self):
+		"""
+		writes scalar state and predictors back to member SOMs
+		"""
+		
+		for (k, s) in enumerate(self.soms):
+			s.last_model_bias = self.last_model_bias[k]
+			
+			if (self.kind == PL_SOM):
+				s._PL_SOM__last_me_denom = self.last_me_denom[k]
+			
+			if (self.predictor is not None):
+				s._predictor = self.predictor.unstack(k)
+				
+				s._Template_SOM__last_bmu_ind = None
+				if (self.last_bmu_ind[k] >= 0):
+					s._Template_SOM__last_bmu_ind = self.last_bmu_ind[k]
+	
+	def find_bmu(self, input_vecs, calc_act_vec = True):
+		"""
+		batched '_Template_SOM.find_bmu', returns BMUs indicies
+		"""
+		
+		# -- difference between inputs and weights
+		# -- (integrated in-place in 'last_diff_m' for RSOM, see '_Template_SOM')
+		subtract(input_vecs[:, None, :], self.neurons, out = self.diff_m)
+		diff_m = self.diff_m
+		
+		if (self.rsom_ext):
+			diff_m = self.last_diff_m
+			
+			self.diff_m *= self.decay
+			diff_m *= 1.0 - self.decay
+			diff_m += self.diff_m
+		
+		einsum("knd,knd->kn", diff_m, diff_m, out = self.sq_dists)
+		bmu_inds = argmin(self.sq_dists, axis = 1)
+		
+		if (calc_act_vec):
+			if (self.likelihood_name == "gaussian"):
+				exp(self.sq_dists / -2.0, out = self.act_vec)
+			else:
+				divide(self.sq_dists, self.sq_dists.max(axis = 1)[:, None],
+						out = self.act_vec)
+				subtract(1.0, self.act_vec, out = self.act_vec)
+		
+		# -- model bias (error)
+		input_norms = sqrt(einsum("kd,kd->k", input_vecs, input_vecs))
+		input_norms[input_norms == 0.0] = EPS
+		
+		bmu_wvs = self.neurons[self._members_range, bmu_inds]
+		wv_norms = sqrt(einsum("kd,kd->k", bmu_wvs, bmu_wvs))
+		wv_norms[wv_norms == 0.0] = EPS
+		
+		bias_vecs = input_vecs / input_norms[:, None] - bmu_wvs / wv_norms[:, None]
+		self.last_model_bias[:] = sqrt(einsum("kd,kd->k", bias_vecs, bias_vecs))
+		
+		return bmu_inds
+	
+	def update_neurons(self, bmu_inds):
+		"""
+		batched '_Template_SOM.update_neurons' using 'diff_m' computed
+		by the last 'find_bmu'
+		"""
+		
+		(K, N, D) = self.neurons.shape
+		
+		bmu_sq_dists = self.sq_dists[self._members_range, bmu_inds]
+		
+		if (self.kind == Miller_SOM):
+			model_error = bmu_sq_dists / D
+			model_error[model_error < EPS] = EPS
+			
+			denom = model_error[:, None] * self.nh_constant * self.nh_constant
+			scale = None
+		
+		elif (self.kind == PL_SOM):
+			input_bmu_dist = sqrt(bmu_sq_dists)
+			
+			maximum(input_bmu_dist, self.last_me_denom, out = self.last_me_denom)
+			model_error = input_bmu_dist / self.last_me_denom
+			
+			sigma = self.nh_constant * model_error[:, None]
+			sigma[sigma < 1.0] = 1.0
+			
+			denom = sigma * sigma
+			scale = model_error[:, None, None]
+		
+		nh = exp(self.lattice_sq_dists[bmu_inds] / -denom)
+		
+		# (RSOM's difference is kept intact, see 'find_bmu')
+		multiply(self.last_diff_m if self.rsom_ext else self.diff_m, nh[:, :, None],
+					out = self.diff_m)
+		if (scale is not None): self.diff_m *= scale
+		
+		self.neurons += self.diff_m
+		
+		# -- markov model
+		if (self.predictor is not None):
+			self.predictor.add_transitions(self.last_bmu_ind, bmu_inds)
+			self.last_bmu_ind[:] = bmu_inds
+	
+	def feed(self, input_vecs):
+		"""
+		batched '_Template_SOM.feed', returns BMUs indicies
+		"""
+		
+		bmu_inds = self.find_bmu(input_vecs, True)
+		self.update_neurons(bmu_inds)
+		
+		return bmu_inds
+	
+	def predict_next_act_vec(self):
+		self.predictor.predict(self.act_vec, self.predicted_act_vec)
+		
+		return self.predicted_act_vec
+	
+	def generate(self, act_vecs):
+		"""
+		'_Template_SOM.generate' of every member SOM (one sample per 
+		member), returns (K x D) preallocated array
+		
+		NOTE: 'act_vecs' are altered in-place (like in original)
+		"""
+		
+		for (k, s) in enumerate(self.soms):
+			self.samples[k] = s.generate(act_vecs[k], 1)[0]
+		
+		return self.samples
+
+#================================================================================
+
+class _Unit_RL_Stack:
+	"""
+	
+	State of K same-shaped 'MPF_Unit_RL' units stacked along leading axis
+	(see '_SOM_Stack')
+	
+	"""
+	
+	def __init__(self, units):
+		unit = units[0]
+		
+		for u in units:
+			assert(u.__class__ == MPF_Unit_RL)
+			assert(u.has_ts == unit.has_ts)
+		
+		self.units = units
+		self.has_ts = unit.has_ts
+		
+		self.ss = _SOM_Stack([u.ss for u in units])
+		
+		if (self.has_ts):
+			self.ts = _SOM_Stack([u.ts for u in units])
+		else:
+			self.ts = self.ss
+		
+		for attr_name in [
+						"ss_act_vec_local_pred", "ss_act_vec_global_pred",
+						"ss_act_vec_total_pred", "_accu_ss_io_vec",
+						"_MPF_Unit_RL__last_ts_act_vec",
+						"_MPF_Unit_RL__ts_act_vec_bias",
+						"_MPF_Unit_RL__reward_corr"]:
+			setattr(self, attr_name.split("__")[-1].lstrip("_"),
+					_SOM_Stack._SOM_Stack__stack_array(units, attr_name))
+		
+		for attr_name in [
+						"rw_learning_rate", "rw_learning_rate_decr",
+						"min_rw_learning_rate", "rw_bias_influence",
+						"rw_bias_influence_decr", "min_rw_bias_influence"]:
+			setattr(self, attr_name, array([getattr(u, attr_name) for u in units]))
+	
+	def sync_members(self):
+		"""
+		writes scalar state back to member units (and their SOMs)
+		"""
+		
+		for (k, u) in enumerate(self.units):
+			for attr_name in [
+						"rw_learning_rate", "rw_learning_rate_decr",
+						"rw_bias_influence", "rw_bias_influence_decr"]:
+				setattr(u, attr_name, getattr(self, attr_name)[k])
+		
+		self.ss.sync_members()
+		
+		if (self.has_ts):
+			self.ts.sync_members()
+	
+	@staticmethod
+	def __normalize(vecs):
+		"""
+		normalizes each row in-place
+		"""
+		
+		vecs /= vecs.sum(axis = 1)[:, None]
+	
+	def forward_pass(self, input_vecs, reinforcement_primes):
+		"""
+		batched 'MPF_Unit_RL._forward_pass_kernel'
+		"""
+		
+		ss = self.ss
+		ts = self.ts
+		
+		# find unbiased activation vector
+		ss.find_bmu(input_vecs, True)
+		
+		# bias it by local prediction and global predictions
+		ss.act_vec *= self.ss_act_vec_total_pred
+		
+		ss_act_vec_norm_factors = ss.act_vec.sum(axis = 1)
+		ss_act_vec_norm_factors[ss_act_vec_norm_factors == 0.0] = EPS
+		
+		ss.act_vec /= ss_act_vec_norm_factors[:, None]
+		
+		# update neurons's weights
+		ss_adj_bmu_inds = argmax(ss.act_vec, axis = 1)
+		ss.update_neurons(ss_adj_bmu_inds)
+		
+		# locally predict next SS's activation vector
+		self.ss_act_vec_local_pred[:] = ss.predict_next_act_vec()
+		self.__normalize(self.ss_act_vec_local_pred)
+		
+		# temporaly classify biased activation vector
+		if (self.has_ts):
+			ss.act_vec[:] = 0.0
+			ss.act_vec[ss._members_range, ss_adj_bmu_inds] = 1.0
+			
+			ts.feed(ss.act_vec)
+			
+			self.__normalize(ts.act_vec)
+		
+		# prepare TS activation bias (from reinforcement)
+		self.reward_corr *= 1.0 - self.last_ts_act_vec
+		self.reward_corr += self.last_ts_act_vec * reinforcement_primes[:, None]
+		
+		# NOTE: bias is the same for every component (see original kernel),
+		# adjusting function is monotonic, so it's applied to minimum only
+		ts_act_vec_biases = \
+				MPF_Unit_RL._rcorr_adj_func(self.reward_corr.min(axis = 1)) * \
+				self.rw_bias_influence + \
+				1.0 / ts.act_vec.shape[1]
+		
+		ts_act_vec_biases[ts_act_vec_biases > 1.0] = 1.0
+		ts_act_vec_biases[ts_act_vec_biases < EPS] = EPS
+		
+		self.ts_act_vec_bias[:] = ts_act_vec_biases[:, None]
+		
+		# store unit's output for next forward pass
+		multiply(ts.act_vec, self.rw_learning_rate[:, None],
+				out = self.last_ts_act_vec)
+		
+		# decrease learning rate and bias influence
+		self.__decrease(self.rw_learning_rate, self.rw_learning_rate_decr,
+						self.min_rw_learning_rate)
+		self.__decrease(self.rw_bias_influence, self.rw_bias_influence_decr,
+						self.min_rw_bias_influence)
+	
+	@staticmethod
+	def __decrease(values, decrements, min_values):
+		values -= decrements
+		
+		min_reached = values < min_values
+		values[min_reached] = min_values[min_reached]
+		decrements[min_reached] = 0.0
+	
+	def backward_pass(self, ts_act_vecs):
+		"""
+		batched 'MPF_Unit_RL._backward_pass_kernel'
+		
+		NOTE: 'ts_act_vecs' are altered in-place (like in original)
+		"""
+		
+		self.__normalize(ts_act_vecs)
+		
+		ts_act_vecs *= self.ts_act_vec_bias
+		self.__normalize(ts_act_vecs)
+		
+		if (self.has_ts):
+			self.ss_act_vec_global_pred[:] = self.ts.generate(ts_act_vecs)
+			self.__normalize(self.ss_act_vec_global_pred)
+		else:
+			self.ss_act_vec_global_pred[:] = ts_act_vecs
+		
+		multiply(self.ss_act_vec_global_pred, self.ss_act_vec_local_pred,
+				out = self.ss_act_vec_total_pred)
+		self.ss_act_vec_total_pred += 1.0 / self.ss.act_vec.shape[1]
+		self.__normalize(self.ss_act_vec_total_pred)
+		
+		self.accu_ss_io_vec[:] = self.ss.generate(self.ss_act_vec_total_pred)
+
+#================================================================================
+
+class MPF_Population:
+	"""
+	
+	Container of K 'MPF_Hierarchy' instances with the same structure
+	(the same number of units, their classes, SOMs kinds and shapes),
+	evaluated at once by batched forward and backward passes
+	
+	Only 'MPF_Unit_RL' units with non-generative (i.e. without GMM)
+	'Miller_SOM' or 'PL_SOM' SOMs with builtin likelihood functions
+	are supported. Neighbourhood cutoff ('nh_tolerance') isn't supported
+	either (asserted), and hierarchies are not dumped
+	
+	Random inputs of top units and sampling are drawn by members (with
+	their own random numbers generators), so members given dedicated ones
+	(see 'MPF_Hierarchy.seed_rngs') step exactly as on their own
+	
+	NOTE: While being a member of population, hierarchy MUST NOT be
+		evaluated on its own. Members' arrays (weights, activations,
+		predictions, etc.) are views of population's state, but scalars
+		and predictors are written back only by 'sync_members'
+	
+	"""
+	
+	def __init__(self, hierarchies):
+		self.hierarchies = hierarchies
+		
+		h = hierarchies[0]
+		
+		for other_h in hierarchies:
+			assert(other_h.dump_period == 0)
+			assert(other_h.l0_iv_ranges == h.l0_iv_ranges)
+			assert(len(other_h.units) == len(h.units))
+		
+		# units on the same position in all members
+		members_units = [other_h.l0_units + other_h.units for other_h in hierarchies]
+		units = members_units[0]
+		
+		self._stacks = [
+				_Unit_RL_Stack([m_units[i] for m_units in members_units])
+				for i in xrange(len(units))
+		]
+		
+		# -- children positions of every unit and their slices in parent's input
+		self._children = []
+		
+		for unit in units:
+			self._children.append([
+						(units.index(child_unit), slice(*child_unit._pu_iv_range))
+						for child_unit in unit.children_units
+			])
+			
+			for m_units in members_units:
+				assert(
+					[len(u.children_units) for u in m_units] ==
+					[len(u.children_units) for u in units]
+				)
+		
+		# -- positions of units grouped by levels (see 'MPF_Hierarchy._levels')
+		self._levels = [
+				[units.index(unit) for (unit, _) in level]
+				for level in h._levels
+		]
+		
+		self._top_i = units.index(h.top_unit)
+		
+		# -- L0 units (always the first ones) and their input (output) ranges
+		self._l0_slices = [slice(*iv_range) for iv_range in h.l0_iv_ranges]
+		
+		self.output_vecs = array([other_h.output_vec for other_h in hierarchies])
+		
+		self.reinforcement_primes = zeros(len(hierarchies))
+		
+		# -- random input of top units' backward pass
+		self._top_ts_act_vecs = zeros(
+					self._stacks[self._top_i].ts.act_vec.shape, dtype = h.dtype)
+		
+		self.t = h.t
+	
+	def sync_members(self):
+		"""
+		writes population's scalar state and predictors back to members
+		"""
+		
+		for stack in self._stacks:
+			stack.sync_members()
+		
+		for (k, h) in enumerate(self.hierarchies):
+			h.t = self.t
+			h.reinforcement_prime = self.reinforcement_primes[k]
+			h.output_vec[:] = self.output_vecs[k]
+	
+	def forward_pass(self, input_vecs):
+		"""
+		performs forward pass of all members level by level,
+		'input_vecs' is (K x input dim) array
+		"""
+		
+		for level in self._levels:
+			for i in level:
+				stack = self._stacks[i]
+				
+				if (i < len(self._l0_slices)):
+					stack_input_vecs = input_vecs[:, self._l0_slices[i]]
+				else:
+					for (child_i, pu_iv_slice) in self._children[i]:
+						stack.accu_ss_io_vec[:, pu_iv_slice] = \
+									self._stacks[child_i].ts.act_vec
+					
+					stack_input_vecs = stack.accu_ss_io_vec
+				
+				stack.forward_pass(stack_input_vecs, self.reinforcement_primes)
+	
+	def backward_pass(self):
+		"""
+		performs backward pass of all members from top to bottom
+		"""
+		
+		top_stack = self._stacks[self._top_i]
+		
+		for (k, h) in enumerate(self.hierarchies):
+			self._top_ts_act_vecs[k] = h._random_top_ts_act_vec()
+		
+		top_stack.backward_pass(self._top_ts_act_vecs)
+		
+		for level in reversed(self._levels):
+			for i in level:
+				for (child_i, pu_iv_slice) in self._children[i]:
+					self._stacks[child_i].backward_pass(
+								self._stacks[i].accu_ss_io_vec[:, pu_iv_slice]
+					)
+		
+		# merge results of backward pass into output vectors
+		for i in xrange(len(self._l0_slices)):
+			self.output_vecs[:, self._l0_slices[i]] = self._stacks[i].accu_ss_io_vec
+	
+	def evaluate(self, input_vecs, reinforcements):
+		"""
+		Evaluates all members once (see 'MPF_Hierarchy.evaluate'),
+		'input_vecs' is (K x input dim) array and 'reinforcements' is
+		vector of K reinforcements
+		
+		returns (K x last L0 unit's dim) array: output of the last L0 unit
+		of each member
+		"""
+		
+		self.reinforcement_primes[:] = reinforcements
+		
+		self.forward_pass(input_vecs)
+		self.backward_pass()
+		
+		self.t += 1
+		
+		return self.output_vecs[:, self._l0_slices[-1]]
@@ -0,0 +1,294 @@
+"""
+	Predictors of the next SOM's activation vector given the current one
+	
+	1. First-order markov model (markov chain) with sparse incremental
+		storage of state transitions
+"""
+
+from common import *
+
+class Sparse_FOMM:
+	"""
+	
+	First-order markov model (markov chain) which keeps only observed
+	state transitions, so memory and per-step cost grow with the number
+	of distinct observed transitions instead of squared number of states
+	
+	- transition event from state [i] to state [j] increments count of
+		transition (i, j), stored in coordinate format: (from, to, count)
+	- running total of outgoing transitions is kept for every state, thus
+		state-transition probability is just count / total of its source
+	- state without any observed outgoing transition is treated as
+		absorbing (i.e. identity row of dense state-transition matrix)
+	
+	Several independent chains (with the same number of states) could be
+	kept in one instance ('chains_num' > 1), then activation vectors are
+	(chains_num x states_num) arrays and transitions are recorded for all
+	chains at once (see 'add_transitions'). Chains are stored as disjoint
+	blocks of states: global state = chain * states_num + state
+	
+	Counts and totals are int64 (float32 stops counting at 2^24), 
+	predictions are of 'dtype' (the same as activation vectors, see 
+	'_Template_SOM')
+	
+	"""
+	
+	def __init__(self, states_num, capacity = 64, chains_num = 1, dtype = float64):
+		self.states_num = states_num
+		self.chains_num = chains_num
+		self.dtype = dtype
+		
+		# number of distinct observed transitions
+		self.trans_num = 0
+		
+		# -- transitions in coordinate format (growable, see '__grow')
+		self._trans_from = zeros(capacity, dtype = intp)
+		self._trans_to = zeros(capacity, dtype = intp)
+		self._trans_counts = zeros(capacity, dtype = int64)
+		
+		# -- running totals of outgoing transitions per state
+		self._row_totals = zeros(chains_num * states_num, dtype = int64)
+		
+		# -- 1.0 for states without observed outgoing transitions, 0.0 otherwise
+		self._absorbing = ones(chains_num * states_num, dtype = dtype)
+		
+		# -- position of (from, to) transition (keyed by global 'from' and 'to')
+		# -- and storage it has been built for (see '__reindex')
+		self.__trans_pos = dict()
+		self.__indexed_trans_from = self._trans_from
+		
+		# -- preallocations for prediction (weights of transitions are of
+		# -- the same capacity as transitions storage, float64 is what 
+		# -- 'bincount' accumulates in anyway)
+		self.__inv_totals = zeros(chains_num * states_num)
+		self.__safe_totals = ones(chains_num * states_num, dtype = dtype)
+		self.__trans_weights = zeros(capacity)
+	
+	@staticmethod
+	def stack(predictors):
+		"""
+		returns multi-chain predictor holding copies of given single-chain
+		predictors as its chains (in the same order)
+		"""
+		
+		capacity = sum([p.trans_num for p in predictors])
+		if (capacity < 1): capacity = 1
+		
+		res = Sparse_FOMM(
+					predictors[0].states_num, capacity, len(predictors),
+					predictors[0].dtype
+		)
+		
+		for (chain, p) in enumerate(predictors):
+			assert((p.chains_num == 1) and (p.states_num == res.states_num))
+			
+			offset = chain * res.states_num
+			n = p.trans_num
+			
+			for pos in xrange(n):
+				res.__insert(
+						p._trans_from[pos] + offset,
+						p._trans_to[pos] + offset,
+						p._trans_counts[pos]
+				)
+			
+			res._row_totals[offset:offset + res.states_num] = p._row_totals
+			res._absorbing[offset:offset + res.states_num] = p._absorbing
+		
+		return res
+	
+	def unstack(self, chain):
+		"""
+		returns single-chain predictor holding copy of given chain
+		"""
+		
+		capacity = self.trans_num
+		if (capacity < 1): capacity = 1
+		
+		res = Sparse_FOMM(self.states_num, capacity, dtype = self.dtype)
+		
+		offset = chain * self.states_num
+		n = self.trans_num
+		
+		for pos in nonzero(self._trans_from[:n] // self.states_num == chain)[0]:
+			res.__insert(
+					self._trans_from[pos] - offset,
+					self._trans_to[pos] - offset,
+					self._trans_counts[pos]
+			)
+		
+		res._row_totals[:] = self._row_totals[offset:offset + self.states_num]
+		res._absorbing[:] = self._absorbing[offset:offset + self.states_num]
+		
+		return res
+	
+	def max_trans_num(self):
+		"""
+		returns maximal possible number of distinct transitions
+		(i.e. capacity which never has to be grown)
+		"""
+		
+		return self.chains_num * self.states_num * self.states_num
+	
+	def reserve(self, capacity, exact = False):
+		"""
+		grows transitions storage to hold at least 'capacity' transitions,
+		'exact' = True sets its capacity to 'capacity' exactly (e.g. to 
+		match restored state), it must hold observed transitions then
+		"""
+		
+		if (exact):
+			assert(capacity >= self.trans_num)
+			
+			if (capacity == self._trans_from.shape[0]): return
+		
+		elif (capacity <= self._trans_from.shape[0]): return
+		
+		for attr_name in ["_trans_from", "_trans_to", "_trans_counts"]:
+			old = getattr(self, attr_name)
+			new = zeros(capacity, dtype = old.dtype)
+			new[:self.trans_num] = old[:self.trans_num]
+			
+			setattr(self, attr_name, new)
+		
+		self.__trans_weights = zeros(capacity)
+		self.__indexed_trans_from = self._trans_from
+	
+	def __grow(self):
+		"""
+		doubles capacity of transitions storage
+		"""
+		
+		self.reserve(2 * self._trans_from.shape[0])
+	
+	def __reindex(self):
+		"""
+		rebuilds positions of transitions from storage, which could have
+		been replaced from outside (e.g. restored by 'state.State_File')
+		"""
+		
+		n = self.trans_num
+		
+		self.__trans_pos = dict(zip(
+					zip(self._trans_from[:n].tolist(), self._trans_to[:n].tolist()),
+					xrange(n)
+		))
+		self.__indexed_trans_from = self._trans_from
+	
+	def __insert(self, g_from, g_to, count):
+		"""
+		adds 'count' to transition between global states, returns its position
+		"""
+		
+		if (self._trans_from is not self.__indexed_trans_from):
+			self.__reindex()
+		
+		key = (g_from, g_to)
+		pos = self.__trans_pos.get(key)
+		
+		if (pos is None):
+			if (self.trans_num >= self._trans_from.shape[0]):
+				self.__grow()
+			
+			pos = self.trans_num
+			self.__trans_pos[key] = pos
+			self.trans_num += 1
+			
+			self._trans_from[pos] = g_from
+			self._trans_to[pos] = g_to
+		
+		self._trans_counts[pos] += count
+		
+		return pos
+	
+	def add_transition(self, from_state, to_state, chain = 0):
+		"""
+		records transition event from state 'from_state' to 'to_state'
+		"""
+		
+		offset = chain * self.states_num
+		g_from = from_state + offset
+		
+		self.__insert(g_from, to_state + offset, 1)
+		
+		self._row_totals[g_from] += 1
+		self._absorbing[g_from] = 0.0
+	
+	def add_transitions(self, from_states, to_states):
+		"""
+		records one transition event per chain (from_states[k] -> to_states[k]),
+		chains with negative 'from' state are skipped
+		"""
+		
+		for chain in xrange(self.chains_num):
+			if (from_states[chain] >= 0):
+				self.add_transition(from_states[chain], to_states[chain], chain)
+	
+	def predict(self, act_vec, out):
+		"""
+		Sparse vector-matrix product of activation vector 'act_vec' and
+		state-transition matrix, result is stored in 'out'
+		
+		NOTE: both arrays must be contiguous
+		"""
+		
+		flat_act_vec = act_vec.reshape(-1)
+		flat_out = out.reshape(-1)
+		
+		# identity rows of states without observed transitions
+		multiply(flat_act_vec, self._absorbing, out = flat_out)
+		
+		n = self.trans_num
+		if (n == 0): return out
+		
+		# act_vec[i] / total[i] for every state, then scaled by counts
+		# (totals are cast to 'dtype' here only, absorbing states have no 
+		# transitions, so adding after the cast is exact)
+		copyto(self.__safe_totals, self._row_totals, casting = "unsafe")
+		self.__safe_totals += self._absorbing
+		divide(flat_act_vec, self.__safe_totals, out = self.__inv_totals)
+		
+		weights = self.__trans_weights[:n]
+		
+		# ('raise' mode would buffer 'out', states are always valid)
+		take(self.__inv_totals, self._trans_from[:n], out = weights, mode = "clip")
+		weights *= self._trans_counts[:n]
+		
+		# (bincount always accumulates in float64, result is cast on adding)
+		flat_out += bincount(
+					self._trans_to[:n], weights = weights,
+					minlength = self._row_totals.shape[0]
+		)
+		
+		return out
+	
+	def trans_probs(self):
+		"""
+		returns dense state-transition matrix (for inspection only!)
+		with blocks of chains on its diagonal
+		"""
+		
+		res = diag(self._absorbing)
+		
+		n = self.trans_num
+		res[self._trans_from[:n], self._trans_to[:n]] = \
+				true_divide(
+						self._trans_counts[:n], 
+						self._row_totals[self._trans_from[:n]]
+				)
+		
+		return res
+	
+	def _to_matlab_mat(self):
+		"""
+		returns dictionary with observed transitions
+		"""
+		
+		n = self.trans_num
+		
+		return {
+			"trans_from": self._trans_from[:n],
+			"trans_to": self._trans_to[:n],
+			"trans_counts": self._trans_counts[:n],
+			"row_totals": self._row_totals
+		}
@@ -0,0 +1,322 @@
+"""
+	Columnar time-series recorder of per-step diagnostics of MPF hierarchy
+
+	Every step the same scalars are appended as one row of preallocated
+	columns (see 'Series_Recorder'):
+	
+	- t and reinforcement derivative
+	- prediction error of hierarchy and of every unit: distance and angular
+		(cosine) between current input and output of previous backward pass
+	- BMU index (argmax of activation vector) and model error (last model
+		bias) of every SOM
+	
+	Rows are either kept in memory (columns grow) or flushed in chunks to
+	single columnar file, each record of which is: 4-byte tag, payload
+	length (uint64), payload
+	
+	1. "COLS" - JSON list of [column name, dtype] (the first record)
+	2. "CHNK" - number of rows (uint32) followed by raw data of each column
+		(in order of "COLS")
+	
+	Columns of whole file are read by 'load_series'
+"""
+
+import json
+import struct
+
+from common import *
+
+SERIES_MAGIC = "MPFSERIES\x01"
+
+_RECORD_HEADER = struct.Struct("<4sQ")
+_ROWS_NUM = struct.Struct("<I")
+
+#================================================================================
+
+class Series_Recorder:
+	"""
+	
+	Records diagnostics of hierarchy 'h' into columns (see 'columns'),
+	'record' is called after forward pass and 'store_outputs' after backward
+	one (see 'MPF_Hierarchy.evaluate')
+	
+	Columns of each dtype are kept in one (rows x columns) block, so a row
+	is written by few vectorized assignments
+	
+	'file_path' = None: rows are kept in memory, blocks' capacity is 
+	doubled when they are full
+	
+	otherwise every 'chunk_size' rows are written to new columnar file 
+	'file_path' (existing one is overwritten), 'close' writes the rest
+	
+	Vectors of hierarchy and units are looked up every step, as they could
+	be rebound (e.g. by 'MPF_Hierarchy.map_state' or sharding)
+	
+	"""
+	
+	def __init__(self, h, file_path = None, chunk_size = 1024):
+		self.h = h
+		self.file_path = file_path
+		
+		units_prefixes = h._units_prefixes()
+		units = [unit for (unit, prefix) in units_prefixes]
+		
+		# -- SOMs of units and their prefixes
+		self._soms = [(unit.ss, prefix + "ss/") for (unit, prefix) in units_prefixes]
+		self._soms.extend([
+					(unit.ts, prefix + "ts/") 
+					for (unit, prefix) in units_prefixes
+						if (unit.has_ts)
+		])
+		
+		# -- segments of flat input and output vectors: hierarchy, then units
+		# -- (L0 units' inputs are parts of hierarchy's input vector)
+		vecs_lens = [h.output_vec.shape[0]] + \
+					[unit._accu_ss_io_vec.shape[0] for unit in units]
+		
+		self._segments_starts = cumsum([0] + vecs_lens[:-1])
+		
+		self._inputs = zeros(sum(vecs_lens))
+		self._outputs = zeros(self._inputs.shape)
+		
+		def _views(vec):
+			return [
+				vec[start:start + vec_len]
+				for (start, vec_len) in zip(self._segments_starts, vecs_lens)
+			]
+		
+		inputs_views = _views(self._inputs)
+		
+		self._l0_inputs = [
+					(inputs_views[1 + i], h._l0_iv_slices[i])
+					for i in xrange(len(h.l0_units))
+		]
+		self._units_inputs = [
+					(inputs_views[1 + i], units[i])
+					for i in xrange(len(h.l0_units), len(units))
+		]
+		
+		outputs_views = _views(self._outputs)
+		
+		self._output_view = outputs_views[0]
+		self._units_outputs = zip(outputs_views[1:], units)
+		
+		# -- columns: float ones, then integer ones
+		errors_names = [""] + [prefix for (unit, prefix) in units_prefixes]
+		
+		self._float_names = ["reinforcement_prime"] + \
+				[prefix + "pred_error/distance" for prefix in errors_names] + \
+				[prefix + "pred_error/angular" for prefix in errors_names] + \
+				[prefix + "model_error" for (som, prefix) in self._soms]
+		
+		self._int_names = ["t"] + \
+				[prefix + "bmu_ind" for (som, prefix) in self._soms]
+		
+		segments_num = len(errors_names)
+		
+		self._distance_cols = slice(1, 1 + segments_num)
+		self._angular_cols = slice(1 + segments_num, 1 + 2 * segments_num)
+		self._model_error_cols = slice(1 + 2 * segments_num, len(self._float_names))
+		self._bmu_cols = slice(1, len(self._int_names))
+		
+		self.columns = self._float_names + self._int_names
+		
+		self.chunk_size = chunk_size
+		
+		self._floats = zeros((chunk_size, len(self._float_names)))
+		self._ints = zeros((chunk_size, len(self._int_names)), dtype = int64)
+		
+		self.rows_num = 0
+		
+		# rows in current blocks
+		self._block_rows_num = 0
+		
+		self._file = None
+		
+		if (file_path is not None):
+			self._file = open(file_path, "wb")
+			self._file.write(SERIES_MAGIC)
+			
+			payload = json.dumps(
+					[[name, self._floats.dtype.str] for name in self._float_names] + 
+					[[name, self._ints.dtype.str] for name in self._int_names]
+			)
+			
+			self._file.write(_RECORD_HEADER.pack("COLS", len(payload)))
+			self._file.write(payload)
+		
+		# -- preallocations
+		self._diff = zeros(self._inputs.shape)
+	
+	def record(self, input_vec):
+		"""
+		appends row of diagnostics after forward pass given
+		hierarchy's input vector
+		"""
+		
+		if (self._block_rows_num == self._floats.shape[0]):
+			if (self._file is not None):
+				self.__write_chunk()
+			else:
+				self.__grow()
+		
+		# -- current inputs
+		self._inputs[:input_vec.shape[0]] = input_vec
+		
+		for (input_view, iv_slice) in self._l0_inputs:
+			input_view[:] = input_vec[iv_slice]
+		
+		for (input_view, unit) in self._units_inputs:
+			input_view[:] = unit._accu_ss_io_vec
+		
+		# -- prediction errors of all segments at once
+		starts = self._segments_starts
+		
+		subtract(self._inputs, self._outputs, out = self._diff)
+		self._diff *= self._diff
+		distances = sqrt(add.reduceat(self._diff, starts))
+		
+		multiply(self._inputs, self._outputs, out = self._diff)
+		dots = add.reduceat(self._diff, starts)
+		
+		multiply(self._inputs, self._inputs, out = self._diff)
+		norms = add.reduceat(self._diff, starts)
+		
+		multiply(self._outputs, self._outputs, out = self._diff)
+		norms *= add.reduceat(self._diff, starts)
+		
+		# (zero vectors give NaN)
+		with errstate(divide = "ignore", invalid = "ignore"):
+			angulars = dots / sqrt(norms)
+		
+		# -- row
+		row = self._block_rows_num
+		floats = self._floats[row]
+		ints = self._ints[row]
+		
+		floats[0] = self.h.reinforcement_prime
+		floats[self._distance_cols] = distances
+		floats[self._angular_cols] = angulars
+		floats[self._model_error_cols] = [
+					nan if (som.last_model_bias is None) else som.last_model_bias
+					for (som, prefix) in self._soms
+		]
+		
+		ints[0] = self.h.t
+		ints[self._bmu_cols] = [som.act_vec.argmax() for (som, prefix) in self._soms]
+		
+		self._block_rows_num += 1
+		self.rows_num += 1
+	
+	def store_outputs(self):
+		"""
+		keeps outputs of backward pass for the next prediction errors
+		"""
+		
+		self._output_view[:] = self.h.output_vec
+		
+		for (output_view, unit) in self._units_outputs:
+			output_view[:] = unit._accu_ss_io_vec
+	
+	def __grow(self):
+		"""
+		doubles capacity of blocks
+		"""
+		
+		for attr_name in ["_floats", "_ints"]:
+			old = getattr(self, attr_name)
+			new = zeros((2 * old.shape[0], old.shape[1]), dtype = old.dtype)
+			new[:old.shape[0]] = old
+			
+			setattr(self, attr_name, new)
+	
+	def __write_chunk(self):
+		"""
+		writes rows of blocks as chunk (column by column) and empties blocks
+		"""
+		
+		n = self._block_rows_num
+		if (n == 0): return
+		
+		# (transposed copies: columns are contiguous)
+		chunks = [
+			_ROWS_NUM.pack(n),
+			self._floats[:n].T.tobytes(),
+			self._ints[:n].T.tobytes()
+		]
+		
+		self._file.write(
+			_RECORD_HEADER.pack("CHNK", sum([len(chunk) for chunk in chunks]))
+		)
+		self._file.writelines(chunks)
+		
+		self._block_rows_num = 0
+	
+	def column(self, name):
+		"""
+		returns view of column 'name' with rows kept in memory
+		(all of them if there is no file)
+		"""
+		
+		n = self._block_rows_num
+		
+		if (name in self._int_names):
+			return self._ints[:n, self._int_names.index(name)]
+		
+		return self._floats[:n, self._float_names.index(name)]
+	
+	def close(self):
+		"""
+		writes the rest of rows and closes file (if any)
+		"""
+		
+		if (self._file is None): return
+		
+		self.__write_chunk()
+		
+		self._file.close()
+		self._file = None
+
+#================================================================================
+
+def load_series(file_path):
+	"""
+	returns dictionary with columns of columnar file written by
+	'Series_Recorder' (i.e. arrays of all recorded rows)
+	"""
+	
+	with open(file_path, "rb") as f:
+		assert(f.read(len(SERIES_MAGIC)) == SERIES_MAGIC)
+		
+		columns = []
+		parts = []
+		
+		while (True):
+			header = f.read(_RECORD_HEADER.size)
+			if (len(header) < _RECORD_HEADER.size): break
+			
+			(tag, payload_len) = _RECORD_HEADER.unpack(header)
+			payload = f.read(payload_len)
+			
+			if (tag == "COLS"):
+				columns = [
+					(str(name), dtype(str(dtype_str)))
+					for (name, dtype_str) in json.loads(payload)
+				]
+				parts = [[] for column in columns]
+				
+			elif (tag == "CHNK"):
+				(rows_num,) = _ROWS_NUM.unpack_from(payload)
+				offset = _ROWS_NUM.size
+				
+				for (i, (name, column_dtype)) in enumerate(columns):
+					parts[i].append(
+						frombuffer(payload, column_dtype, rows_num, offset)
+					)
+					offset += rows_num * column_dtype.itemsize
+	
+	return dict([
+		(name, concatenate(parts[i]) if (len(parts[i]) > 0) else
+				zeros(0, dtype = column_dtype))
+		for (i, (name, column_dtype)) in enumerate(columns)
+	])
@@ -0,0 +1,337 @@
+"""
+	Samplers of discrete probability distribution (categorical values,
+	e.g. SOM's neurons, with associated Probability Mass Function)
+	
+	1. Inverse CDF sampler: CDF is built into preallocated buffer and
+		samples are found by binary search, i.e. O(N) per PMF and 
+		O(log N) per sample
+	2. Alias table sampler [Walker, 1977; Vose, 1991]: table is built in
+		O(N) and only when PMF changes, every sample is O(1), so it pays
+		off when the same PMF is sampled repeatedly
+	
+	Both have the same interface: 'set_pmf' and then 'sample' (or 
+	'sample_one') as many times as needed. PMF could have any non-negative
+	values, as long as it is normalized by sampler
+	
+	And sampler of continuous mixture of gaussians (weighted by PMF of 
+	its components):
+	
+	3. Mixture sampler: component is drawn by inverse CDF sampler, then
+		sample of its gaussian is obtained from cached Cholesky factor of
+		covariance, refactorized only when covariance changes
+"""
+
+from common import *
+
+class CDF_Sampler:
+	"""
+	
+	Inverse CDF sampler of 'states_num' states
+	
+	CDF isn't normalized (i.e. it ends with total of PMF), uniform samples
+	are scaled by the total instead. Samples are of CDF's dtype, as binary
+	search would convert the whole CDF to samples' dtype otherwise, so 
+	scaled sample could be rounded up to the total: indices are clamped to
+	the last state of nonzero probability (i.e. the first one reaching
+	the total)
+	
+	"""
+	
+	def __init__(self, states_num, dtype = FLOAT_DTYPE):
+		self.cdf = zeros(states_num, dtype = dtype)
+		
+		# total of PMF (the last value of CDF)
+		self.total = self.cdf[-1]
+		
+		# index of the last state of nonzero probability
+		self._last_ind = states_num - 1
+		
+		# -- scalar type of CDF
+		self._scalar_type = self.cdf.dtype.type
+		
+	def set_pmf(self, pmf):
+		"""
+		builds CDF of 'pmf' (raises ValueError if it is all zeros)
+		"""
+		
+		# (not 'cumsum' and '== 0.0', their overhead on numpy scalars costs
+		# more than accumulation of small PMF)
+		add.accumulate(pmf, out = self.cdf)
+		
+		self.total = self.cdf[-1]
+		
+		if (not self.total):
+			raise ValueError("PMF is all zeros")
+		
+		self._last_ind = self.cdf.searchsorted(self.total, "left")
+		
+	def sample(self, rng, samples_num = 1):
+		"""
+		returns indicies of 'samples_num' states drawn using 'rng' 
+		(numpy.random or RandomState instance)
+		
+		NOTE: the same as 'digitize' of uniform samples by CDF
+		"""
+		
+		u = rng.random_sample(samples_num).astype(self.cdf.dtype)
+		u *= self.total
+		
+		inds = self.cdf.searchsorted(u, "right")
+		
+		# (scaled sample could be rounded up to the total)
+		minimum(inds, self._last_ind, out = inds)
+		
+		return inds
+	
+	def sample_one(self, rng):
+		"""
+		returns index of one state drawn using 'rng' (the same as 'sample'
+		of one state, but scalar draw and search are much cheaper)
+		"""
+		
+		ind = self.cdf.searchsorted(
+					self._scalar_type(rng.random_sample()) * self.total, "right")
+		
+		if (ind > self._last_ind): ind = self._last_ind
+		
+		return ind
+	
+class Alias_Sampler:
+	"""
+	
+	Alias table sampler of 'states_num' states
+	
+	Every state [i] is "kept" with probability 'prob[i]' or replaced by
+	'alias[i]' otherwise, both state and the choice are drawn from one
+	uniform sample: its integral and fractional parts (scaled by number
+	of states)
+	
+	"""
+	
+	def __init__(self, states_num, dtype = FLOAT_DTYPE):
+		self.prob = ones(states_num)
+		self.alias = arange(states_num)
+		
+		# PMF the table is built for (NaN, so the first one is never equal)
+		self.pmf = zeros(states_num, dtype = dtype)
+		self.pmf.fill(nan)
+		
+		# number of table (re)builds
+		self.builds_num = 0
+		
+	def set_pmf(self, pmf):
+		"""
+		builds table of 'pmf' (raises ValueError if it is all zeros), 
+		nothing is done if it is the same as the previous one
+		"""
+		
+		if (array_equal(pmf, self.pmf)): return
+		
+		states_num = self.prob.shape[0]
+		
+		scaled = pmf.astype(float64)
+		total = scaled.sum()
+		
+		if (total == 0.0):
+			raise ValueError("PMF is all zeros")
+		
+		scaled *= states_num / total
+		
+		# -- Vose's method (on lists, it is faster than on array's items)
+		scaled = scaled.tolist()
+		prob = [1.0] * states_num
+		alias = range(states_num)
+		
+		small = [i for i in xrange(states_num) if (scaled[i] < 1.0)]
+		large = [i for i in xrange(states_num) if (scaled[i] >= 1.0)]
+		
+		while ((len(small) > 0) and (len(large) > 0)):
+			s = small.pop()
+			l = large.pop()
+			
+			prob[s] = scaled[s]
+			alias[s] = l
+			
+			scaled[l] -= 1.0 - scaled[s]
+			
+			if (scaled[l] < 1.0):
+				small.append(l)
+			else:
+				large.append(l)
+		
+		# (the rest are of probability 1.0 up to rounding errors)
+		self.prob[:] = prob
+		self.alias[:] = alias
+		
+		self.pmf[:] = pmf
+		self.builds_num += 1
+		
+	def sample(self, rng, samples_num = 1):
+		"""
+		returns indicies of 'samples_num' states drawn using 'rng' 
+		(numpy.random or RandomState instance)
+		"""
+		
+		states_num = self.prob.shape[0]
+		
+		u = rng.random_sample(samples_num)
+		u *= states_num
+		
+		inds = u.astype(intp)
+		minimum(inds, states_num - 1, out = inds) # (u * N could be rounded to N)
+		
+		u -= inds # fractional part
+		
+		return where(u < self.prob[inds], inds, self.alias[inds])
+	
+	def sample_one(self, rng):
+		"""
+		returns index of one state drawn using 'rng' (the same as 'sample'
+		of one state, but without arrays)
+		"""
+		
+		states_num = self.prob.shape[0]
+		
+		u = rng.random_sample() * states_num
+		
+		ind = int(u)
+		if (ind == states_num): ind -= 1
+		
+		if (u - ind < self.prob[ind]): return ind
+		
+		return self.alias[ind]
+	
+class Mixture_Sampler:
+	"""
+	
+	Sampler of mixture of gaussians (in place of 'sklearn.mixture.GMM' 
+	for drawing samples only, no EM here), which has the same attributes:
+	
+	- 'means_': K x D means of components (could be a view, e.g. of neurons)
+	- 'covars_': covariances of components, K x D x D ('full' covariance
+		type) or D x D matrix shared by all of them ('tied' covariance type)
+	- 'weights_': mixing weights (any non-negative values, see 'sample')
+	
+	Samples are drawn as mean + L * z, where L is lower Cholesky factor of
+	component's covariance and z is standard normal vector. Factors are
+	cached and recomputed only for components which covariances have been 
+	changed (owner has to call 'covars_changed') and only once such 
+	component is drawn, so the cost of factorizations follows the cost
+	of covariances updates instead of being paid on every sample
+	
+	Covariances could be singular (e.g. estimated from a few points), so
+	'jitter' (relative to mean variance of component) is added to their
+	diagonals before factorization, it is increased tenfold until it 
+	succeeds
+	
+	"""
+	
+	def __init__(self, means, covars, covariance_type = "full", jitter = 1e-6):
+		assert (covariance_type == "full") or (covariance_type == "tied")
+		
+		self.covariance_type = covariance_type
+		self.n_components = means.shape[0]
+		self.jitter = jitter
+		
+		self.means_ = means
+		self.covars_ = covars
+		self.weights_ = ones(self.n_components, dtype = means.dtype)
+		
+		self._components_sampler = CDF_Sampler(self.n_components, means.dtype)
+		
+		# -- cached Cholesky factors and flags of outdated ones
+		# -- (one for all components in case of 'tied' covariance)
+		self._factors = zeros(covars.shape, dtype = covars.dtype)
+		self._stale = ones(covars.shape[:-2] or (1,), dtype = bool)
+		
+		# number of (re)factorized covariances
+		self.factorizations_num = 0
+		
+	def covars_changed(self, components_inds = None):
+		"""
+		marks factors of given components (all if None) as outdated,
+		'components_inds' are ignored in case of 'tied' covariance
+		"""
+		
+		if ((components_inds is None) or (self.covariance_type == "tied")):
+			self._stale.fill(True)
+		else:
+			self._stale[components_inds] = True
+		
+	def __factorize(self, covars, factors):
+		"""
+		writes lower Cholesky factors of (... x D x D) 'covars' (with
+		jitter added) into 'factors'
+		"""
+		
+		# (computed in float64, as float32 singular covariances are
+		# hardly ever positive definite even with jitter)
+		covars = covars.astype(float64)
+		
+		dim = covars.shape[-1]
+		diag_inds = arange(dim)
+		
+		jitter = self.jitter * covars.trace(axis1 = -2, axis2 = -1) / dim
+		jitter += finfo(float64).tiny ** 0.5 # (in case of zero covariance)
+		
+		while (True):
+			jittered = covars.copy()
+			jittered[..., diag_inds, diag_inds] += jitter[..., newaxis]
+			
+			try:
+				factors[:] = linalg.cholesky(jittered)
+				break
+			except linalg.LinAlgError:
+				jitter *= 10.0
+		
+		self.factorizations_num += jittered.size // (dim * dim)
+		
+	def __update_factors(self, components):
+		"""
+		refactorizes outdated covariances of drawn 'components'
+		"""
+		
+		if (self.covariance_type == "tied"):
+			if (self._stale[0]):
+				self.__factorize(self.covars_, self._factors)
+				self._stale[0] = False
+			
+			return
+		
+		stale = components[self._stale[components]]
+		
+		if (stale.shape[0] == 0): return
+		
+		stale = unique(stale)
+		
+		factors = empty((stale.shape[0],) + self._factors.shape[1:], 
+							dtype = self._factors.dtype)
+		
+		self.__factorize(self.covars_[stale], factors)
+		
+		self._factors[stale] = factors
+		self._stale[stale] = False
+		
+	def sample(self, samples_num = 1, rng = random):
+		"""
+		returns 'samples_num' x D samples drawn using 'rng' (numpy.random
+		or RandomState instance), mixing weights are taken from 'weights_'
+		(normalized by sampler, so they should not be all zeros)
+		"""
+		
+		self._components_sampler.set_pmf(self.weights_)
+		components = self._components_sampler.sample(rng, samples_num)
+		
+		self.__update_factors(components)
+		
+		z = rng.standard_normal((samples_num, self.means_.shape[1]))
+		
+		res = self.means_.take(components, axis = 0)
+		
+		# one batched matrix-vector product (L[c] * z for every sample)
+		if (self.covariance_type == "full"):
+			res += einsum("nij,nj->ni", self._factors[components], z)
+		else:
+			res += dot(z, self._factors.T)
+		
+		return res
@@ -0,0 +1,304 @@
+"""
+	MPF hierarchy sharded across worker processes
+	
+	Subtrees of 'MPF_Hierarchy' (rooted at units of some level) are evaluated
+	by forked worker processes, while units above them stay in the main
+	process. Weights and activation vectors of all units are moved into
+	shared memory before forking, so the main process reads outputs of
+	subtrees' roots (when assembling its '_accu_ss_io_vec') and L0 units'
+	backward pass results without any copying or (un)pickling
+"""
+
+import ctypes
+import traceback
+
+from multiprocessing import Pipe, Process
+from multiprocessing.sharedctypes import RawArray
+
+from common import *
+from SOM import *
+from units import *
+from hierarchy import MPF_Hierarchy
+
+#================================================================================
+
+# arrays of units (and their SOMs) moved into shared memory
+_SHARED_UNIT_ARRAYS = ["_accu_ss_io_vec"]
+_SHARED_SOM_ARRAYS = ["neurons", "act_vec"]
+
+def _share_array(obj, attr_name):
+	"""
+	rebinds array attribute to its copy placed in shared memory
+	"""
+	
+	arr = getattr(obj, attr_name)
+	
+	shared_arr = frombuffer(
+					RawArray(ctypes.c_char, arr.nbytes),
+					dtype = arr.dtype
+	).reshape(arr.shape)
+	
+	shared_arr[...] = arr
+	
+	setattr(obj, attr_name, shared_arr)
+
+def _worker_loop(conn, h, shards):
+	"""
+	evaluates given subtrees on commands from main process
+	
+	- ("forward", reinforcement_prime)
+	- ("backward", reinforcement_prime, top_last_model_bias)
+	- None: quit
+	
+	replies with None on success and with traceback text on failure
+	"""
+	
+	while (True):
+		cmd = conn.recv()
+		
+		if (cmd is None): break
+		
+		try:
+			h.reinforcement_prime = cmd[1]
+			
+			if (cmd[0] == "forward"):
+				for shard in shards:
+					shard.forward_pass()
+			else:
+				h.top_unit.ts.last_model_bias = cmd[2]
+				
+				for shard in shards:
+					shard.backward_pass()
+			
+			conn.send(None)
+		
+		except Exception:
+			conn.send(traceback.format_exc())
+	
+	conn.close()
+
+#================================================================================
+
+class _Shard:
+	"""
+	
+	Subtree of hierarchy rooted at unit 'root', evaluated level by level
+	(see 'MPF_Hierarchy._levels') inside worker process
+	
+	"""
+	
+	def __init__(self, h, root, input_vec):
+		self.root = root
+		
+		# -- units of subtree
+		subtree = set([root])
+		pending = [root]
+		
+		while (len(pending) > 0):
+			unit = pending.pop()
+			
+			subtree.update(unit.children_units)
+			pending.extend(unit.children_units)
+		
+		# -- L0 units with their parts of (shared) input vector
+		self.l0_items = [
+					(h.l0_units[i], input_vec[h._l0_iv_slices[i]])
+					for i in xrange(len(h.l0_units))
+						if (h.l0_units[i] in subtree)
+		]
+		
+		# -- upper levels (the last one consists of root only)
+		self.levels = []
+		
+		for level in h._levels[1:]:
+			level = [item for item in level if (item[0] in subtree)]
+			
+			if (len(level) > 0):
+				self.levels.append(level)
+		
+		# -- part of parent's vector to start backward pass with
+		self.root_ts_act_vec = root.parent_unit._accu_ss_io_vec[
+					slice(*root._pu_iv_range)
+		]
+	
+	def forward_pass(self):
+		for item in self.l0_items:
+			MPF_Hierarchy._forward_pass_l0_unit(item)
+		
+		for level in self.levels:
+			for item in level:
+				MPF_Hierarchy._forward_pass_unit(item)
+	
+	def backward_pass(self):
+		self.root._backward_pass_kernel(self.root_ts_act_vec)
+		
+		for level in reversed(self.levels):
+			for (unit, children) in level:
+				for (child_unit, pu_iv_slice) in children:
+					child_unit._backward_pass_kernel(
+								unit._accu_ss_io_vec[pu_iv_slice]
+					)
+
+#================================================================================
+
+class MPF_Sharded_Hierarchy:
+	"""
+	
+	Evaluates 'MPF_Hierarchy' with its subtrees rooted at level 'shard_level'
+	distributed among 'processes_num' forked worker processes (contiguous
+	groups of roots, i.e. neighbouring parts of input vector, per process)
+	
+	Units above 'shard_level' are evaluated in the main process after all
+	workers are done with forward pass and before they start backward pass
+	
+	NOTE: only weights and activation vectors are shared, all other state
+			of subtrees' units (predictors, learning rates, noise etc.) is
+			updated inside workers, copies in main process become stale
+	
+	NOTE: call 'MPF_Hierarchy.seed_rngs' before sharding in order to get
+			the same results as in sequential mode
+	
+	NOTE: dumping and recording are not supported (units' state is spread
+			among processes)
+	
+	"""
+	
+	def __init__(self, h, processes_num, shard_level = 1):
+		assert(h.dump_period == 0)
+		assert(h.recorder is None)
+		assert((shard_level >= 0) and (shard_level < len(h._levels) - 1))
+		
+		self.h = h
+		
+		roots = [unit for (unit, children) in h._levels[shard_level]]
+		
+		if (processes_num > len(roots)): processes_num = len(roots)
+		assert(processes_num >= 1)
+		
+		# -- units evaluated by main process must depend only on roots
+		main_levels = h._levels[shard_level + 1:]
+		main_units = set([unit for level in main_levels for (unit, c) in level])
+		
+		for level in main_levels:
+			for (unit, children) in level:
+				for (child_unit, pu_iv_slice) in children:
+					assert((child_unit in roots) or (child_unit in main_units))
+		
+		self._main_levels = main_levels
+		
+		# -- move units' arrays into shared memory
+		for unit in h.l0_units + h.units:
+			for attr_name in _SHARED_UNIT_ARRAYS:
+				_share_array(unit, attr_name)
+			
+			for som in [unit.ss, unit.ts]:
+				if (som is None): continue
+				
+				for attr_name in _SHARED_SOM_ARRAYS:
+					_share_array(som, attr_name)
+				
+				som._rebind_views()
+		
+		# -- input vector of hierarchy (written by main process)
+		self.input_vec = frombuffer(
+					RawArray(ctypes.c_char, h.output_vec.nbytes),
+					dtype = h.output_vec.dtype
+		)
+		
+		# -- fork workers
+		self._conns = []
+		self._workers = []
+		
+		for p in xrange(processes_num):
+			first_root_id = p * len(roots) // processes_num
+			last_root_id = (p + 1) * len(roots) // processes_num
+			
+			shards = [
+					_Shard(h, root, self.input_vec)
+					for root in roots[first_root_id:last_root_id]
+			]
+			
+			(conn, worker_conn) = Pipe()
+			
+			worker = Process(target = _worker_loop, args = (worker_conn, h, shards))
+			worker.daemon = True
+			worker.start()
+			
+			worker_conn.close()
+			
+			self._conns.append(conn)
+			self._workers.append(worker)
+		
+		self.processes_num = processes_num
+	
+	def __command_workers(self, cmd):
+		"""
+		sends command to all workers and waits for them (i.e. barrier)
+		"""
+		
+		for conn in self._conns:
+			conn.send(cmd)
+		
+		errors = [conn.recv() for conn in self._conns]
+		
+		for error in errors:
+			if (error is not None):
+				raise RuntimeError("MPF worker process failed:\n" + error)
+	
+	def evaluate(self, input_vec, reinforcement):
+		"""
+		The same as 'MPF_Hierarchy.evaluate'
+		"""
+		
+		h = self.h
+		
+		h.reinforcement_prime = reinforcement
+		
+		# -- forward pass: subtrees, then the rest
+		self.input_vec[:] = input_vec
+		
+		self.__command_workers(("forward", h.reinforcement_prime))
+		
+		for level in self._main_levels:
+			for item in level:
+				h._forward_pass_unit(item)
+		
+		# -- backward pass: the rest, then subtrees
+		h.top_unit._backward_pass_kernel(h._random_top_ts_act_vec())
+		
+		for level in reversed(self._main_levels[1:]):
+			for (unit, children) in level:
+				for (child_unit, pu_iv_slice) in children:
+					child_unit._backward_pass_kernel(
+								unit._accu_ss_io_vec[pu_iv_slice]
+					)
+		
+		self.__command_workers((
+					"backward",
+					h.reinforcement_prime,
+					h.top_unit.ts.last_model_bias
+		))
+		
+		# merge results of backward pass into output vector
+		for i in xrange(len(h.l0_units)):
+			h.output_vec[h._l0_iv_slices[i]] = h.l0_units[i]._accu_ss_io_vec
+		
+		h.t += 1
+		
+		# just temporary for single actuator in last unit
+		return h.output_vec[-h.l0_units[-1].ss.neurons.shape[1]:]
+	
+	def close(self):
+		"""
+		stops worker processes
+		"""
+		
+		for conn in self._conns:
+			conn.send(None)
+			conn.close()
+		
+		for worker in self._workers:
+			worker.join()
+		
+		self._conns = []
+		self._workers = []
@@ -0,0 +1,326 @@
+"""
+	Schema-driven capture of state into flat records
+	
+	Every stateful class (SOMs, units, hierarchy) declares its state schema
+	in 'self._state_fields': list of (name, attribute path, dtype, shape)
+	of fields, where attribute path could be dotted (e.g. "_noise_func.magn")
+	
+	Schemas of composite objects are concatenated (with prefixes, e.g.
+	"unit_L0__000/ss/neurons") into one flat record: numpy structured scalar,
+	which layout is stable and known before the first capture
+	
+	Values which size changes over time (e.g. predictor's transitions) are
+	not part of record, they are returned by '_state_extras' of an object
+	
+	Record could be placed in memory-mapped file ('State_File'), so arrays
+	of objects become views of it: saving is a flush of mapped pages and
+	restoring is just mapping of existing file. Variable-sized state is
+	mapped at its reserved size then (see '_reserve_state_extras' and 
+	'_reserved_state_fields' of an object), owner maps state again into
+	new file once it outgrows that size (see 'State_File.detached')
+"""
+
+import json
+import os
+import struct
+
+from common import *
+
+#================================================================================
+
+# value stored instead of None
+_NONE_FILL = {"f": nan, "i": -1, "u": 0, "b": False}
+
+STATE_FILE_MAGIC = "MPFSTATE\x01"
+
+# layout's description length (uint64) follows magic
+_LAYOUT_LEN = struct.Struct("<Q")
+
+# alignment of record in state file
+_RECORD_ALIGN = 64
+
+def state_fields(obj, prefix = ""):
+	"""
+	resolves schema of 'obj' into list of
+	(prefixed name, owner object, attribute name, dtype, shape)
+	"""
+	
+	res = []
+	
+	for (name, attr_path, field_dtype, field_shape) in obj._state_fields:
+		owner = obj
+		attr_names = attr_path.split(".")
+		
+		for attr_name in attr_names[:-1]:
+			owner = getattr(owner, attr_name)
+		
+		res.append((prefix + name, owner, attr_names[-1], field_dtype, field_shape))
+	
+	return res
+
+def _copy_nonzero(dst, src):
+	"""
+	copies array 'src' into zero-filled array 'dst' of the same layout
+	skipping zero bytes, so untouched pages of new file stay unallocated
+	"""
+	
+	src_bytes = ascontiguousarray(src).reshape(-1).view(uint8)
+	dst_bytes = dst.reshape(-1).view(uint8)
+	
+	mask = (src_bytes != 0)
+	dst_bytes[mask] = src_bytes[mask]
+
+def _read_layout(f, file_path):
+	"""
+	reads header of state file from opened file 'f', returns JSON layout
+	"""
+	
+	if (f.read(len(STATE_FILE_MAGIC)) != STATE_FILE_MAGIC):
+		raise ValueError("'%s' is not a state file" % file_path)
+	
+	(layout_len,) = _LAYOUT_LEN.unpack(f.read(_LAYOUT_LEN.size))
+	
+	return f.read(layout_len)
+
+def state_file_layout(file_path):
+	"""
+	returns layout of state file: list of (name, dtype, shape) of fields
+	"""
+	
+	with open(file_path, "rb") as f:
+		layout = json.loads(_read_layout(f, file_path))
+	
+	return [
+		(str(name), dtype(str(f_dtype)), tuple(f_shape))
+		for (name, f_dtype, f_shape) in layout
+	]
+
+class State_Record:
+	"""
+	
+	Flat record of state described by resolved schema (see 'state_fields'):
+	'capture' gathers actual values of all fields into 'record' (0-d array
+	of structured dtype 'dtype') using precomputed views of its fields
+	
+	"""
+	
+	def __init__(self, fields):
+		self.names = [name for (name, owner, attr_name, f_dtype, f_shape) in fields]
+		
+		self.dtype = dtype([
+					(name, f_dtype, f_shape)
+					for (name, owner, attr_name, f_dtype, f_shape) in fields
+		])
+		
+		self.record = zeros((), dtype = self.dtype)
+		
+		# -- (field's view, owner object, attribute name, value for None)
+		self._gather = [
+					(
+						self.record[name], owner, attr_name,
+						_NONE_FILL[dtype(f_dtype).kind]
+					)
+					for (name, owner, attr_name, f_dtype, f_shape) in fields
+		]
+	
+	def capture(self):
+		"""
+		gathers actual state into 'record' and returns it
+		"""
+		
+		for (view, owner, attr_name, none_fill) in self._gather:
+			value = getattr(owner, attr_name)
+			
+			if (value is None): value = none_fill
+			
+			view[...] = value
+		
+		return self.record
+	
+	def field(self, name):
+		"""
+		returns view of field 'name' of record
+		"""
+		
+		return self.record[name]
+
+#================================================================================
+
+class State_File:
+	"""
+	
+	Flat record of state described by resolved schema (see 'state_fields')
+	placed in memory-mapped file 'file_path': header (magic and JSON layout
+	of record) followed by record itself
+	
+	Array attributes of objects are rebound to views of mapped record, so
+	they are updated in-place in file's pages. Other values (scalars, None,
+	tuples) can't be mapped and are copied into record by 'sync' (and back
+	on restoring, fill values of float and integer fields are read back
+	as None)
+	
+	'restore' = False: new file is created and filled with current state,
+	it is written next to 'file_path' and replaces existing file only once
+	it is complete (pages of replaced file stay valid while mapped)
+	
+	'restore' = True: existing file is mapped and state of objects is
+	replaced by its contents, no data is read until it is accessed;
+	file's layout must match schema
+	
+	Owners of mapped arrays which keep views of them (e.g. SOM's GMM 
+	means) are given '_rebind_views' call once their arrays are rebound
+	
+	NOTE: arrays should be updated in-place only (rebinding attribute
+			detaches it from file)
+	
+	"""
+	
+	def __init__(self, file_path, fields, restore = False):
+		self.file_path = file_path
+		
+		self.names = [name for (name, owner, attr_name, f_dtype, f_shape) in fields]
+		
+		self.dtype = dtype([
+					(name, f_dtype, f_shape)
+					for (name, owner, attr_name, f_dtype, f_shape) in fields
+		])
+		
+		layout = json.dumps([
+					[name, self.dtype.fields[name][0].base.str, list(f_shape)]
+					for (name, owner, attr_name, f_dtype, f_shape) in fields
+		])
+		
+		header_len = len(STATE_FILE_MAGIC) + _LAYOUT_LEN.size + len(layout)
+		offset = -(-header_len // _RECORD_ALIGN) * _RECORD_ALIGN
+		
+		if (restore):
+			mapped_path = file_path
+			
+			with open(file_path, "rb") as f:
+				if (_read_layout(f, file_path) != layout):
+					raise ValueError(
+						"layout of state file '%s' doesn't match schema" % file_path
+					)
+		else:
+			mapped_path = file_path + ".new"
+			
+			with open(mapped_path, "wb") as f:
+				f.write(STATE_FILE_MAGIC)
+				f.write(_LAYOUT_LEN.pack(len(layout)))
+				f.write(layout)
+		
+		# (new file is extended to record's size with zeros, i.e. holes)
+		self._mmap = memmap(
+					mapped_path, dtype = self.dtype, mode = "r+",
+					offset = offset, shape = (1,)
+		)
+		
+		# (plain arrays' views, i.e. not 'memmap' instances)
+		self.record = self._mmap.reshape(()).view(ndarray)
+		
+		# -- (field's view, owner object, attribute name, value for None)
+		# -- of values synchronized by copying
+		self._synced = []
+		
+		# -- field's name -> (field's view, owner object, attribute name)
+		# -- of mapped arrays
+		self._mapped = dict()
+		
+		for (name, owner, attr_name, f_dtype, f_shape) in fields:
+			view = self.record[name]
+			value = getattr(owner, attr_name)
+			
+			if (value.__class__ != ndarray):
+				self._synced.append(
+					(view, owner, attr_name, _NONE_FILL[view.dtype.kind])
+				)
+				continue
+			
+			if ((value.shape != view.shape) or (value.dtype != view.dtype)):
+				raise ValueError(
+					"array '%s' %s doesn't match its field %s" % (
+						name, (value.dtype, value.shape), (view.dtype, view.shape)
+					)
+				)
+			
+			if (not restore): _copy_nonzero(view, value)
+			
+			setattr(owner, attr_name, view)
+			
+			self._mapped[name] = (view, owner, attr_name)
+		
+		# -- views of rebound arrays are re-pointed (once per owner)
+		owners = dict([
+					(id(owner), owner) 
+					for (view, owner, attr_name) in self._mapped.values()
+		])
+		
+		for owner in owners.values():
+			if (hasattr(owner, "_rebind_views")): owner._rebind_views()
+		
+		if (restore):
+			self.__load_synced()
+		else:
+			self.sync()
+			
+			os.rename(mapped_path, file_path)
+	
+	def __load_synced(self):
+		"""
+		copies synchronized values from record into objects
+		"""
+		
+		for (view, owner, attr_name, none_fill) in self._synced:
+			if (view.shape == ()):
+				value = view.item()
+				
+				# (only float and integer fill values can't be actual ones)
+				if (((view.dtype.kind == "f") and isnan(value)) or
+					((view.dtype.kind == "i") and (value == none_fill))):
+					value = None
+			else:
+				value = tuple(view.tolist())
+			
+			setattr(owner, attr_name, value)
+	
+	def sync(self):
+		"""
+		copies values which can't be mapped into record and flushes
+		mapped pages to file (i.e. checkpoint)
+		"""
+		
+		for (view, owner, attr_name, none_fill) in self._synced:
+			value = getattr(owner, attr_name)
+			
+			if (value is None): value = none_fill
+			
+			view[...] = value
+		
+		self._mmap.flush()
+	
+	def detached(self, names = None):
+		"""
+		returns names of mapped arrays (among given 'names' only, if any)
+		which attributes have been rebound since mapping (e.g. to grown 
+		storage), so they are not in file anymore
+		"""
+		
+		if (names is None): names = self._mapped.keys()
+		
+		res = []
+		
+		for name in names:
+			if (name not in self._mapped): continue
+			
+			(view, owner, attr_name) = self._mapped[name]
+			
+			if (getattr(owner, attr_name) is not view): res.append(name)
+		
+		return res
+	
+	def field(self, name):
+		"""
+		returns view of field 'name' of mapped record
+		"""
+		
+		return self.record[name]
@@ -3,16 +3,21 @@
 	and several implementations:
 		1. LoopSOM with RL extension (seems unreliable)
 		2. SOM-RSOM pair with inner and global prediction loops
+	
+	Units are thin objects (with '__slots__'), their small vectors could be
+	moved into contiguous arrays shared by all units of a level (see
+	'pack_units_vectors')
 """
 
 from common import *
 from noise import *
+from state import *
 
 MPF_UT_SENSOR = 1
 MPF_UT_ACTUATOR = 2
 MPF_UT_INTERNAL = 3
 
-class _Base_MPF_Unit:
+class _Base_MPF_Unit(object):
 	"""
 	
 	Base class for derving various MPF unit's implementation
@@ -22,17 +27,39 @@ class _Base_MPF_Unit:
 	2. hierarchy "establishment"
 	3. automated backward pass after forward pass
 	
-	NOTE: Quite straight-forward recursive approach is employed in here
-	TODO: Rewrite it to something less resource demanding and beautiful
+	NOTE: Quite straight-forward recursive approach is employed in here,
+		'MPF_Hierarchy' doesn't use it and evaluates units' kernels by
+		compiled level-by-level schedule instead
 	
 	Inherited classes MUST implement two function:
 	1. '_forward_pass_kernel' which actually performs forward pass
 	2. '_backward_pass_kernel' which actually performs backward pass
 	
+	'dtype' is dtype of all floating-point arrays of unit and its SOMs
+	(see '_Template_SOM'), inputs of kernels should have it too
+	
+	Attributes are fixed by '__slots__' (no per-unit dictionary), so
+	inherited classes MUST declare their own ones too; vectors listed
+	in '_level_vectors' could be rebound to views of level-wide arrays
+	
 	"""
 	
+	__slots__ = (
+				"dtype", "unit_type", "unit_level", "ss", "ts", "has_ts",
+				"children_units", "parent_unit", "_hierarchy", 
+				"_accu_ss_io_vec", "_state_fields", "_pu_iv_range", 
+				"_child_inputs_num"
+	)
+	
+	# names of small vectors kept in level-wide arrays by containing
+	# hierarchy (see 'pack_units_vectors')
+	_level_vectors = ("_accu_ss_io_vec",)
+	
 	def __init__(self, ss_class, ts_class, input_dim, ss_shape, ts_shape, 
-					parent_unit, unit_type, unit_level = None, h = None):
+					parent_unit, unit_type, unit_level = None, h = None,
+					dtype = FLOAT_DTYPE):
+		
+		self.dtype = dtype
 		
 		# Type of unit (used by containing hierarchy)
 		self.unit_type = unit_type
@@ -48,7 +75,8 @@ class _Base_MPF_Unit:
 		
 		# Spatial SOM (Spatial pooler)
 		self.ss = ss_class(ss_shape, input_dim, 
-						noise = UniformNoise(-0.5, 0.5, 1.0, noise_magn_decrease)
+						noise = UniformNoise(-0.5, 0.5, 1.0, noise_magn_decrease),
+						dtype = dtype
 		)
 		
 		# Temporal SOM (Temporal pooler)
@@ -64,7 +92,8 @@ class _Base_MPF_Unit:
 			
 			self.ts = ts_class(ts_shape, ss_shape[0] * ss_shape[1], 
 							rsom_ext = True,
-							noise = UniformNoise(-0.5, 0.5, 1.0, noise_magn_decrease)
+							noise = UniformNoise(-0.5, 0.5, 1.0, noise_magn_decrease),
+							dtype = dtype
 			)
 		
 		# Adjust tree of units
@@ -80,23 +109,26 @@ class _Base_MPF_Unit:
 		
 		# - Input to SS accumulator when collecting children's outputs
 		# - Output generated from SS in backward pass
-		self._accu_ss_io_vec = zeros(self.ss.neurons.shape[1])
+		self._accu_ss_io_vec = zeros(self.ss.neurons.shape[1], dtype = dtype)
 		
-		# Attributes to store in matlab file
-		self._stored_attr_names = ["unit_level"]
+		# State schema: (name, attribute, dtype, shape) of fields stored in
+		# dumps and checkpoints (see 'state' module), SOMs have their own
+		self._state_fields = [
+					("unit_level", "unit_level", intp, ()),
+					("accu_ss_io_vec", "_accu_ss_io_vec",
+						self._accu_ss_io_vec.dtype, self._accu_ss_io_vec.shape)
+		]
 		
 	def _to_matlab_mat(self):
 		"""
 		returns dictionary with interesting arrays and structures
+		(fields of state schema, see 'self._state_fields')
 		"""
 		
-		res_d = dict()
-		
-		for attr_name in dir(self):
-			if ((getattr(self, attr_name).__class__ == ndarray) or
-				(attr_name in self._stored_attr_names)):
-				
-				res_d[attr_name.lstrip("_")] = getattr(self, attr_name)
+		res_d = dict([
+				(name, getattr(owner, attr_name))
+				for (name, owner, attr_name, f_dtype, f_shape) in state_fields(self)
+		])
 		
 		# store spatial and temporal poolers
 		res_d["ss"] = self.ss._to_matlab_mat()
@@ -105,7 +137,69 @@ class _Base_MPF_Unit:
 			res_d["ts"] = self.ts._to_matlab_mat()
 				
 		return res_d
+	
+	def _state_schema(self, prefix = ""):
+		"""
+		returns resolved state schema of unit and its SOMs
+		(see 'state.state_fields')
+		"""
+		
+		res = state_fields(self, prefix)
+		res.extend(state_fields(self.ss, prefix + "ss/"))
+		
+		if (self.has_ts):
+			res.extend(state_fields(self.ts, prefix + "ts/"))
+		
+		return res
+	
+	def _state_extras(self, prefix = ""):
+		"""
+		returns (name, value) pairs of variable-sized state of unit's SOMs
+		"""
+		
+		res = self.ss._state_extras(prefix + "ss/")
+		
+		if (self.has_ts):
+			res.extend(self.ts._state_extras(prefix + "ts/"))
+		
+		return res
 			
+	def _reserve_state_extras(self, prefix = "", capacities = None):
+		"""
+		prepares variable-sized state of unit's SOMs for being mapped
+		(see '_Template_SOM._reserve_state_extras')
+		"""
+		
+		self.ss._reserve_state_extras(prefix + "ss/", capacities)
+		
+		if (self.has_ts):
+			self.ts._reserve_state_extras(prefix + "ts/", capacities)
+			
+	def _reserved_state_fields(self, prefix = ""):
+		"""
+		returns resolved fields of variable-sized state of unit's SOMs 
+		at its reserved size (see '_Template_SOM._reserved_state_fields')
+		"""
+		
+		res = self.ss._reserved_state_fields(prefix + "ss/")
+		
+		if (self.has_ts):
+			res.extend(self.ts._reserved_state_fields(prefix + "ts/"))
+		
+		return res
+			
+	def set_rng(self, rng):
+		"""
+		Sets dedicated random numbers generator (RandomState instance)
+		for unit's SOMs, so unit's results don't depend on evaluation
+		order of other units
+		"""
+		
+		self.ss.set_rng(rng)
+		
+		if (self.has_ts):
+			self.ts.set_rng(rng)
+		
 	def add_child(self, child_unit):
 		#assert(self.ss.neurons.shape[1] != child_unit.ts.neurons.shape[0])
 		
@@ -220,12 +314,23 @@ class MPF_Unit_LoopSOM(_Base_MPF_Unit):
 	
 	"""
 	
+	__slots__ = ("ss_act_local_pred", "ss_act_global_pred")
+	
+	_level_vectors = _Base_MPF_Unit._level_vectors + __slots__
+	
 	def __init__(self, **kwargs):
 		_Base_MPF_Unit.__init__(self, **kwargs)
 		
 		# SS activation predictions from TS-only and TS-from-hierarchy
-		self.ss_act_local_pred = zeros(self.ss.neurons.shape[0])
-		self.ss_act_global_pred = zeros(self.ss.neurons.shape[0])
+		self.ss_act_local_pred = zeros(self.ss.neurons.shape[0], dtype = self.dtype)
+		self.ss_act_global_pred = zeros(self.ss.neurons.shape[0], dtype = self.dtype)
+		
+		self._state_fields.extend([
+					("ss_act_local_pred", "ss_act_local_pred",
+						self.ss_act_local_pred.dtype, self.ss_act_local_pred.shape),
+					("ss_act_global_pred", "ss_act_global_pred",
+						self.ss_act_global_pred.dtype, self.ss_act_global_pred.shape)
+		])
 	
 	def _forward_pass_kernel(self, input_vec):
 		"""
@@ -318,6 +423,25 @@ class MPF_Unit_RL(_Base_MPF_Unit):
 	
 	"""
 	
+	__slots__ = (
+				"ss_act_vec_local_pred", "ss_act_vec_global_pred",
+				"ss_act_vec_total_pred", 
+				"rw_learning_rate", "rw_learning_rate_decr", 
+				"min_rw_learning_rate", 
+				"rw_bias_influence", "rw_bias_influence_decr",
+				"min_rw_bias_influence",
+				"__last_ts_act_vec", "__ts_act_vec_bias", "__reward_corr",
+				"__reward_corr_decay"
+	)
+	
+	_level_vectors = _Base_MPF_Unit._level_vectors + (
+				"ss_act_vec_local_pred", "ss_act_vec_global_pred",
+				"ss_act_vec_total_pred", 
+				"_MPF_Unit_RL__last_ts_act_vec", 
+				"_MPF_Unit_RL__ts_act_vec_bias", 
+				"_MPF_Unit_RL__reward_corr"
+	)
+	
 	def __init__(self, **kwargs):
 		_Base_MPF_Unit.__init__(self, **kwargs)
 		
@@ -325,10 +449,10 @@ class MPF_Unit_RL(_Base_MPF_Unit):
 		self.ss.init_predictor()
 		
 		# SS activation predictions from TS-only and TS-from-hierarchy
-		self.ss_act_vec_local_pred = ones(self.ss.act_vec.shape[0])
-		self.ss_act_vec_global_pred = ones(self.ss.act_vec.shape[0])
+		self.ss_act_vec_local_pred = ones(self.ss.act_vec.shape[0], dtype = self.dtype)
+		self.ss_act_vec_global_pred = ones(self.ss.act_vec.shape[0], dtype = self.dtype)
 		
-		self.ss_act_vec_total_pred = ones(self.ss.act_vec.shape[0])
+		self.ss_act_vec_total_pred = ones(self.ss.act_vec.shape[0], dtype = self.dtype)
 		
 		# reward correlator's learning-rate
 		# TODO: add learning-rate decrease!
@@ -344,31 +468,50 @@ class MPF_Unit_RL(_Base_MPF_Unit):
 		
 		# last temporal SOM's output (activation vector) scaled by 
 		# rewards correlator's learning-rate
-		self.__last_ts_act_vec = zeros(self.ts.act_vec.shape) 
+		self.__last_ts_act_vec = zeros(self.ts.act_vec.shape, dtype = self.dtype)
 		
 		# backward pass temporal pooler activation vector bias
 		# NOTE: could be used in forward pass, btw
-		self.__ts_act_vec_bias = ones(self.ts.act_vec.shape)
+		self.__ts_act_vec_bias = ones(self.ts.act_vec.shape, dtype = self.dtype)
 		
 		# correlation between reward and unit's output:
 		# forward pass tempolar pooler activation vector
-		self.__reward_corr = ones(self.ts.act_vec.shape)
+		self.__reward_corr = ones(self.ts.act_vec.shape, dtype = self.dtype)
+		
+		# -- preallocations for forward pass
+		self.__reward_corr_decay = zeros(self.ts.act_vec.shape, dtype = self.dtype)
+		
+		# state schema
+		ss_vec_shape = self.ss_act_vec_total_pred.shape
+		ts_vec_shape = self.__reward_corr.shape
+		
+		self._state_fields.extend([
+					("ss_act_vec_local_pred", "ss_act_vec_local_pred", self.dtype, ss_vec_shape),
+					("ss_act_vec_global_pred", "ss_act_vec_global_pred", self.dtype, ss_vec_shape),
+					("ss_act_vec_total_pred", "ss_act_vec_total_pred", self.dtype, ss_vec_shape),
+					("rw_learning_rate", "rw_learning_rate", float64, ()),
+					("rw_bias_influence", "rw_bias_influence", float64, ()),
+					("last_ts_act_vec", "_MPF_Unit_RL__last_ts_act_vec", self.dtype, ts_vec_shape),
+					("ts_act_vec_bias", "_MPF_Unit_RL__ts_act_vec_bias", self.dtype, ts_vec_shape),
+					("reward_corr", "_MPF_Unit_RL__reward_corr", self.dtype, ts_vec_shape)
+		])
 		
-		# -- adjusting function for reward correlation to be used
-		# -- in activation vector bias calculation
-		# NOTE: Sigmoid function is used, suggested in paper
-		self._rcorr_adj_func = lambda rcorr: \
-						1.0 / (1.0 + exp(-(((rcorr + 1.0) * 5.0) - 5.0))) - 0.5
-						
-		# attributes to store
-		self._stored_attr_names.extend(["rw_learning_rate", "rw_bias_influence"])
+	@staticmethod
+	def _rcorr_adj_func(rcorr):
+		"""
+		adjusting function for reward correlation to be used
+		in activation vector bias calculation
 		
+		NOTE: Sigmoid function is used, suggested in paper
+		"""
 		
+		return 1.0 / (1.0 + exp(-(((rcorr + 1.0) * 5.0) - 5.0))) - 0.5
 	
 	def _forward_pass_kernel(self, input_vec):
 		"""
 		TODO #1: Revise!
-		TODO #2: Optimize!
+		
+		NOTE: works in-place with preallocated arrays only
 		"""
 		
 		
@@ -379,14 +522,14 @@ class MPF_Unit_RL(_Base_MPF_Unit):
 		self.ss.act_vec *= self.ss_act_vec_total_pred
 							
 		# activation vector should be PMF (i.e. normalized likelihood)
-		ss_act_vec_norm_factor = sum(self.ss.act_vec)
+		ss_act_vec_norm_factor = self.ss.act_vec.sum()
 		if (ss_act_vec_norm_factor == 0.0): ss_act_vec_norm_factor = EPS
 		
 		self.ss.act_vec /= ss_act_vec_norm_factor
 							
 		# update neurons's weights
 		# TODO: is it valid idea?
-		ss_adj_bmu_ind = argmax(self.ss.act_vec)
+		ss_adj_bmu_ind = self.ss.act_vec.argmax()
 		self.ss.update_neurons(ss_adj_bmu_ind, input_vec)
 		
 		# locally predict next SS's activation vector
@@ -397,10 +540,10 @@ class MPF_Unit_RL(_Base_MPF_Unit):
 		
 		### (IS THIS REALLY NEEDED, as long as activation vector is
 		### already normalized?!)
-		try:
-			self.ss_act_vec_local_pred /= sum(self.ss_act_vec_local_pred)
-		except:
-			print self.ss_act_vec_local_pred 
+		local_pred_norm_factor = self.ss_act_vec_local_pred.sum()
+		if (local_pred_norm_factor == 0.0): local_pred_norm_factor = EPS
+		
+		self.ss_act_vec_local_pred /= local_pred_norm_factor
 		###
 		
 		# temporaly classify biased activation vector
@@ -410,34 +553,41 @@ class MPF_Unit_RL(_Base_MPF_Unit):
 			self.ss.act_vec[:] = 0.0
 			self.ss.act_vec[ss_adj_bmu_ind] = 1.0
 			
-			self.ts.feed(self.ss.act_vec[:])
+			self.ts.feed(self.ss.act_vec)
 		
 			### The same as for SS: RSOM's activation vector must be normalized
 			### likelihood - proper PMF! 
-			self.ts.act_vec /= sum(self.ts.act_vec)
+			self.ts.act_vec /= self.ts.act_vec.sum()
 			###
 		
 		# prepare TS activation bias (from reinforcement) for 
 		# backward pass
-		# using previous (t-1) unit's output (TS activation vector)
-		self.__reward_corr[:] = self.__last_ts_act_vec * \
-								self._hierarchy.reinforcement_prime + \
-								(1.0 - self.__last_ts_act_vec) * \
-								self.__reward_corr
-								
-		self.__ts_act_vec_bias[:] = max([
-						EPS, 
-						max(min([
-							1.0,
-							min(self._rcorr_adj_func(self.__reward_corr[:]) * \
-								self.rw_bias_influence + \
-								1.0 / self.ts.act_vec.shape[0]) # uniform constant for fun :) 
-						]))
-		])
+		# using previous (t-1) unit's output (TS activation vector):
+		# rcorr = last * r' + (1 - last) * rcorr
+		subtract(1.0, self.__last_ts_act_vec, out = self.__reward_corr_decay)
+		self.__reward_corr_decay *= self.__reward_corr
+		
+		multiply(self.__last_ts_act_vec, self._hierarchy.reinforcement_prime,
+				out = self.__reward_corr)
+		self.__reward_corr += self.__reward_corr_decay
+		
+		# bias is the same for every component: minimal adjusted reward
+		# correlation (plus uniform constant for fun :) clamped to [EPS, 1],
+		# adjusting function is monotonic, so it's applied to minimum only
+		ts_act_vec_bias = \
+				self._rcorr_adj_func(self.__reward_corr.min()) * \
+				self.rw_bias_influence + \
+				1.0 / self.ts.act_vec.shape[0]
+		
+		if (ts_act_vec_bias > 1.0): ts_act_vec_bias = 1.0
+		if (ts_act_vec_bias < EPS): ts_act_vec_bias = EPS
+		
+		self.__ts_act_vec_bias.fill(ts_act_vec_bias)
 		
 		# store unit's output for next forward pass
 		# (i.e. Temporal SOM's activation vector)
-		self.__last_ts_act_vec = self.ts.act_vec * self.rw_learning_rate
+		multiply(self.ts.act_vec, self.rw_learning_rate,
+				out = self.__last_ts_act_vec)
 		
 		# decreae learning rate and bias influence
 		self.rw_learning_rate -= self.rw_learning_rate_decr
@@ -498,4 +648,72 @@ class MPF_Unit_RL(_Base_MPF_Unit):
 		# pass this "total" prediction to SOM
 		self._accu_ss_io_vec[:] = \
 					self.ss.generate(self.ss_act_vec_total_pred[:], 1)[0, :]
-	
\ No newline at end of file
+	
+
+#================================================================================
+
+def pack_units_vectors(units):
+	"""
+	Moves small vectors of 'units' (named by their '_level_vectors') into
+	contiguous level-wide arrays, one per name, and rebinds attributes of
+	units to views of them (values are kept), so vectors of neighbouring
+	units are neighbours in memory too
+	
+	Returns dictionary: name -> level-wide array, which is (units x length)
+	matrix if vectors of all units having the name are of the same shape,
+	and concatenated vectors otherwise (in order of 'units')
+	
+	Vectors of the same name must be of the same dtype (see '_Base_MPF_Unit')
+	
+	NOTE: rebinding them later (e.g. by 'state.State_File', sharding or
+			population) detaches units from these arrays, 
+			see 'units_vectors_packed'
+	"""
+	
+	names = []
+	
+	for unit in units:
+		for name in unit._level_vectors:
+			if (name not in names): names.append(name)
+	
+	res = dict()
+	
+	for name in names:
+		owners = [unit for unit in units if (name in unit._level_vectors)]
+		vecs = [getattr(unit, name) for unit in owners]
+		
+		assert(len(set([vec.dtype for vec in vecs])) == 1)
+		
+		if (len(set([vec.shape for vec in vecs])) == 1):
+			packed = array(vecs)
+			views = list(packed)
+		else:
+			packed = concatenate(vecs)
+			
+			ends = cumsum([vec.size for vec in vecs])
+			views = [
+				packed[end - vec.size:end].reshape(vec.shape)
+				for (vec, end) in zip(vecs, ends)
+			]
+		
+		for (unit, view) in zip(owners, views):
+			setattr(unit, name, view)
+		
+		res[name] = packed
+	
+	return res
+
+def units_vectors_packed(units, packed_vectors):
+	"""
+	returns True if vectors of 'units' are still views of level-wide 
+	arrays 'packed_vectors' (see 'pack_units_vectors'), i.e. none of them
+	has been rebound since packing
+	"""
+	
+	for (name, packed) in packed_vectors.iteritems():
+		for unit in units:
+			if ((name in unit._level_vectors) and 
+				(getattr(unit, name).base is not packed)):
+				return False
+	
+	return True
@@ -0,0 +1,298 @@
+"""
+	Parallel loader of intrinsic parameters from directory of hierarchy
+	dumps ('h_*.gzpckl'), incremental alternative to 'load_mpf'
+	
+	- dumps are decoded (decompressed, unpickled and reduced to scalars)
+	by pool of worker processes
+	- parameters of every dump are cached in 'dump_path/params_cache.pckl'
+	along with dump's mtime and size, so only new (or changed) dumps are
+	decoded on reloading, cached ones are not even opened
+	- result is a lazy view with the same structure as 'load_mpf' returns,
+	parameters' arrays are materialized on first access
+"""
+
+import os
+import cPickle as pickle
+import gzip
+
+from multiprocessing import Pool
+
+from numpy import *
+
+CACHE_FILENAME = "params_cache.pckl"
+CACHE_VERSION = 1
+
+#================================================================================
+
+def _pred_errors(curr_input_vec, prev_output_vec):
+	"""
+	returns angular and distance prediction errors
+	"""
+	
+	return (
+		dot(curr_input_vec, prev_output_vec) / (
+			linalg.norm(curr_input_vec) * linalg.norm(prev_output_vec)
+		),
+		linalg.norm(curr_input_vec - prev_output_vec)
+	)
+
+def decode_dump(file_path):
+	"""
+	returns parameters of single dump as list of (key, value) pairs,
+	where key is a path in structure returned by 'load_mpf', e.g.
+	("pred_error", "angular") or (level_id, unit_id, "ss", "bmu_ind")
+	"""
+	
+	in_f = gzip.open(file_path, "rb")
+	h_dict = pickle.load(in_f)
+	in_f.close()
+	
+	h_dict_af = h_dict["after_forward"]
+	
+	(angular, distance) = _pred_errors(
+				h_dict_af["curr_input_vec"], h_dict_af["prev_output_vec"])
+	
+	res = [
+		(("time",), h_dict_af["t"]),
+		(("pred_error", "angular"), angular),
+		(("pred_error", "distance"), distance)
+	]
+	
+	for level_id in xrange(len(h_dict_af["levels"])):
+		for unit_id in xrange(len(h_dict_af["levels"][level_id])):
+			unit = h_dict_af["levels"][level_id][unit_id]
+			
+			(angular, distance) = _pred_errors(
+						unit["curr_input_vec"], unit["prev_output_vec"])
+			
+			res.extend([
+				((level_id, unit_id, "pred_error", "angular"), angular),
+				((level_id, unit_id, "pred_error", "distance"), distance)
+			])
+			
+			if ("ss" in unit):
+				res.extend([
+					((level_id, unit_id, "ss", "bmu_ind"), argmax(unit["ss"]["act_vec"])),
+					((level_id, unit_id, "ss", "ub_bmu_ind"),
+						argmax(unit["unbiased_ss_act_vec"])),
+					((level_id, unit_id, "ss", "model_error"),
+						unit["ss"]["last_model_bias"])
+				])
+			
+			if ("ts" in unit):
+				res.extend([
+					((level_id, unit_id, "ts", "bmu_ind"), argmax(unit["ts"]["act_vec"])),
+					((level_id, unit_id, "ts", "model_error"),
+						unit["ts"]["last_model_bias"])
+				])
+	
+	return res
+
+def _decode_dump_task(file_path):
+	# (worker's errors are reported with file name)
+	try:
+		return decode_dump(file_path)
+	except Exception, e:
+		raise Exception("failed to decode '%s': %r" % (file_path, e))
+
+#================================================================================
+
+class Lazy_Params:
+	"""
+	
+	Read-only view of nested dictionaries of parameters (the same
+	structure as 'load_mpf' returns) built on table of values: one row
+	per dump (sorted by time), one column per parameter key
+	
+	Arrays of parameters (table's columns) are copied out on first access
+	and memoized, levels and units are views as well
+	
+	"""
+	
+	def __init__(self, keys, table, prefix = (), columns_cache = None):
+		self._keys = keys
+		self._table = table
+		self._prefix = prefix
+		
+		# column index of key
+		if (columns_cache is None):
+			columns_cache = {"index": dict([(key, i) for (i, key) in enumerate(keys)])}
+		
+		self._columns_cache = columns_cache
+		
+		# -- children of this view (ordered as keys)
+		self._children = []
+		
+		depth = len(prefix)
+		
+		for key in keys:
+			if ((len(key) > depth) and (key[:depth] == prefix) and
+				(not key[depth] in self._children)):
+				self._children.append(key[depth])
+		
+		if (depth == 0):
+			self._children.append("levels_num")
+	
+	def __getitem__(self, name):
+		if ((len(self._prefix) == 0) and (name == "levels_num")):
+			return len([child for child in self._children if (child.__class__ == int)])
+		
+		key = self._prefix + (name,)
+		column_id = self._columns_cache["index"].get(key)
+		
+		if (column_id is not None):
+			column = self._columns_cache.get(key)
+			
+			if (column is None):
+				column = self._table[:, column_id].copy()
+				self._columns_cache[key] = column
+			
+			return column
+		
+		if (not name in self._children):
+			raise KeyError(name)
+		
+		return Lazy_Params(self._keys, self._table, key, self._columns_cache)
+	
+	def __contains__(self, name):
+		return (name in self._children)
+	
+	def __iter__(self):
+		return iter(self._children)
+	
+	def __len__(self):
+		return len(self._children)
+	
+	def keys(self):
+		return list(self._children)
+	
+	def iteritems(self):
+		for name in self._children:
+			yield (name, self[name])
+	
+	def items(self):
+		return list(self.iteritems())
+
+#================================================================================
+
+def _load_cache(cache_path):
+	"""
+	returns (keys, {filename: (mtime, size, values)}) from cache file
+	(empty if it is absent, broken or of another version)
+	"""
+	
+	try:
+		cache_f = open(cache_path, "rb")
+		
+		try:
+			cache = pickle.load(cache_f)
+		finally:
+			cache_f.close()
+		
+		if (cache["version"] == CACHE_VERSION):
+			return (cache["keys"], cache["files"])
+	except Exception:
+		pass
+	
+	return ([], dict())
+
+def _save_cache(cache_path, keys, files):
+	# (written aside and renamed, so interrupted saving keeps old cache)
+	temp_path = cache_path + ".tmp"
+	
+	cache_f = open(temp_path, "wb")
+	pickle.dump(
+		{"version": CACHE_VERSION, "keys": keys, "files": files},
+		cache_f,
+		pickle.HIGHEST_PROTOCOL
+	)
+	cache_f.close()
+	
+	if (os.path.exists(cache_path)): os.remove(cache_path)
+	os.rename(temp_path, cache_path)
+
+def load_dumps(dump_path, processes_num = None, chunk_size = 16):
+	"""
+	Loads parameters of all dumps from 'dump_path' decoding only those
+	which are not in cache (or changed since caching) by pool of
+	'processes_num' processes (number of CPUs by default), 'chunk_size'
+	dumps are sent to worker at once
+	
+	returns lazy view of parameters (see 'Lazy_Params'), its attribute
+	'decoded_num' is the number of actually decoded dumps
+	"""
+	
+	h_filenames = [
+				filename
+				for filename in os.listdir(dump_path)
+					if ((filename.find("h_") == 0) and
+						(filename.find(".gzpckl") > 0))
+	]
+	
+	assert(len(h_filenames) > 0)
+	
+	cache_path = os.path.join(dump_path, CACHE_FILENAME)
+	(keys, cached_files) = _load_cache(cache_path)
+	
+	# -- split dumps into cached and new (or changed) ones
+	files = dict()
+	new_filenames = []
+	
+	for filename in h_filenames:
+		file_stat = os.stat(os.path.join(dump_path, filename))
+		file_id = (file_stat.st_mtime, file_stat.st_size)
+		
+		entry = cached_files.get(filename)
+		
+		if ((entry is not None) and (entry[:2] == file_id)):
+			files[filename] = entry
+		else:
+			files[filename] = file_id + (None,)
+			new_filenames.append(filename)
+	
+	# -- decode new dumps in parallel
+	if (len(new_filenames) > 0):
+		keys_ids = dict([(key, i) for (i, key) in enumerate(keys)])
+		
+		pool = Pool(processes_num)
+		
+		try:
+			decoded = pool.imap(
+						_decode_dump_task,
+						[os.path.join(dump_path, filename) for filename in new_filenames],
+						chunk_size
+			)
+			
+			for (filename, params) in zip(new_filenames, decoded):
+				# (new keys are appended, values are aligned to keys)
+				for (key, value) in params:
+					if (not key in keys_ids):
+						keys_ids[key] = len(keys)
+						keys.append(key)
+				
+				values = empty(len(keys))
+				values.fill(nan)
+				
+				for (key, value) in params:
+					values[keys_ids[key]] = value
+				
+				files[filename] = files[filename][:2] + (values,)
+		finally:
+			pool.close()
+			pool.join()
+		
+		_save_cache(cache_path, keys, files)
+	
+	# -- table of values: row per dump (sorted by time)
+	table = empty((len(files), len(keys)))
+	table.fill(nan)
+	
+	for (row, (mtime, size, values)) in enumerate(files.itervalues()):
+		table[row, :values.shape[0]] = values
+	
+	table = table[argsort(table[:, keys.index(("time",))], kind = "mergesort")]
+	
+	res = Lazy_Params(keys, table)
+	res.decoded_num = len(new_filenames)
+	
+	return res
@@ -1,4 +1,5 @@
 import os
+import sys
 import cPickle as pickle
 import gzip
 
@@ -6,6 +7,12 @@ from numpy import *
 
 import pylab as plt
 
+sys.path.append("../")
+
+from mpfrl.recorder import load_series
+
+from dump_loader import load_dumps
+
 def load_mpf(dump_path):
 	files_list = os.listdir(dump_path)
 	h_filenames = [
@@ -184,6 +191,52 @@ def load_mpf(dump_path):
 	
 	return params
 
+def load_mpf_series(file_path):
+	"""
+	loads parameters recorded by 'MPF_Hierarchy.start_recording'
+	into the same structure as 'load_mpf' does
+	(unbiased BMU is not recorded)
+	"""
+	
+	columns = load_series(file_path)
+	
+	params = {
+		"time" : columns["t"],
+		"pred_error" : {
+			"angular" : columns["pred_error/angular"],
+			"distance" : columns["pred_error/distance"]
+		}
+	}
+	
+	# per-level unit ids in order of units' names, i.e. "unit_L<level>__<id>"
+	units_ids = dict()
+	
+	for name in sorted(columns.keys()):
+		if (name.find("unit_L") != 0): continue
+		
+		(unit_name, param_name) = name.split("/", 1)
+		level_id = int(unit_name[len("unit_L"):unit_name.find("__")])
+		
+		if (not unit_name in units_ids):
+			if (not level_id in params):
+				params[level_id] = dict()
+			
+			units_ids[unit_name] = len(params[level_id])
+			params[level_id][units_ids[unit_name]] = dict()
+		
+		unit = params[level_id][units_ids[unit_name]]
+		
+		# "pred_error/distance", "ss/bmu_ind", "ts/model_error" etc.
+		(group_name, value_name) = param_name.split("/")
+		
+		if (not group_name in unit):
+			unit[group_name] = dict()
+		
+		unit[group_name][value_name] = columns[name]
+	
+	params["levels_num"] = len([key for key in params if (key.__class__ == int)])
+	
+	return params
 
 def plot_activations_graph(mpf_params):
 	levels_num = mpf_params["levels_num"]
@@ -332,7 +385,7 @@ def plot_som_and_rsom_model_errors(mpf_params):
 #================================================================================
 # MAIN CODE
 #================================================================================
-mpf_params = load_mpf(
+mpf_params = load_dumps(
 		"K:\\__temp\\mpf_rl_dumps\\tictactoe_no_rules_no_l0-rsom_3levels_6units_1"
 )
 